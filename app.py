@@ -1,14 +1,22 @@
 import os
+import json
 import time
-import requests
+import hashlib
+import threading
 import urllib.parse
 from functools import wraps
-from flask import Flask, jsonify, render_template, request, Response
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, jsonify, render_template, request, Response, g
 from flask_cors import CORS
 from supabase import create_client, Client
-from sklearn.ensemble import RandomForestClassifier
 import pandas as pd
-import numpy as np 
+import brain
+import features
+import feature_store
+import profile_store
+from cache import TTLCache, open_cache
+import henrik
+import metrics
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 CORS(app)
@@ -24,75 +32,54 @@ supabase: Client = None
 if SUPABASE_URL and SUPABASE_KEY:
     try:
         clean_url = SUPABASE_URL.split('/rest/v1')[0].rstrip('/')
-        supabase = create_client(clean_url, SUPABASE_KEY)
+        supabase = metrics.InstrumentedSupabase(create_client(clean_url, SUPABASE_KEY))
         print("✅ Supabase connection initialized.")
     except Exception as e:
         print(f"❌ Supabase init error: {e}")
 
-# Global variable to hold the AI Brain in the server's memory
-spider_brain = None
+# The loaded Brain artifact (model + metadata) lives in one global so a hot-swap is a
+# single assignment: a request either sees the old Brain or the new one, never a mix.
+active_brain = None
+brain_path = None
+brain_checked_at = 0
+BRAIN_CHECK_INTERVAL = 5  # seconds between checks for a newly published Brain
 
 def wake_up_the_brain():
-    global spider_brain
+    """Loads the published Spider Brain artifact (see brain.py) instead of training at startup."""
+    global active_brain, brain_path
     print("\n[SYSTEM] Waking up the Spider Brain...")
     try:
-        # 1. Download the massive global dataset from Supabase
-        res = supabase.table('ml_spider_matches').select('*').execute()
-        if not res.data:
-            print("❌ No spider data found yet. The Brain is sleeping.")
+        path = brain.active_artifact_path()
+        artifact = brain.load_latest_artifact()
+        if not artifact:
+            # Fresh deploy on an empty disk: train one in the background; refresh_brain_if_stale() picks it up
+            if supabase:
+                job = brain.start_retrain_job()
+                print(f"⚠️ No trained Brain found. Retrain job {job['job_id']} is {job.get('status', 'running')}.")
+            else:
+                print("❌ No trained Brain found. Run `python brain.py` or /api/admin/retrain.")
             return
 
-        df = pd.DataFrame(res.data)
+        active_brain, brain_path = artifact, path
+        print(f"✅ Spider Brain {artifact['version']} is online ({artifact['rows']} training rows).")
 
-        # 2. Clean the Data (Remove Unranked players)
-        df = df[df['rank'] != 'Unknown']
-
-        # --- FEATURE ENGINEERING LAYER ---
-        
-        # A. Calculate Match-Level Baselines to capture "Rank Bias"
-        match_avg_acs = df.groupby('match_id')['acs'].transform('mean')
-        match_avg_adr = df.groupby('match_id')['adr'].transform('mean')
-        
-        df['lobby_relative_acs'] = df['acs'] - match_avg_acs
-        df['lobby_relative_adr'] = df['adr'] - match_avg_adr
-        
-        # B. Inject your exact written role-adjusted tactical rules
-        df['duelist_entry_score'] = np.where(df['role'] == 'Duelist', (df['fb'] * 2) - df['fd'] + df['lobby_relative_adr'], 0)
-        df['initiator_setup_score'] = np.where(df['role'] == 'Initiator', (df['kast'] * 1.5) - (df['hs_percent'] * 0.1), 0)
-        df['controller_anchor_score'] = np.where(df['role'] == 'Controller', df['kast'] / (df['fd'] + 1), 0)
-        df['sentinel_defense_score'] = np.where(df['role'] == 'Sentinel', df['kda'] * (df['kast'] / 100), 0)
-
-        # 3. Map Roles to Numbers
-        ROLE_MAP = {'Duelist': 0, 'Initiator': 1, 'Controller': 2, 'Sentinel': 3, 'Flex': 4}
-        df['role_encoded'] = df['role'].map(ROLE_MAP).fillna(4)
-
-        # 4. Set up the Features
-        features = [
-            'kills', 'deaths', 'acs', 'kast', 'adr', 'hs_percent', 'fb', 'fd',
-            'lobby_relative_acs', 'lobby_relative_adr',
-            'duelist_entry_score', 'initiator_setup_score', 'controller_anchor_score', 'sentinel_defense_score',
-            'role_encoded'
-        ]
-        X = df[features]
-        y = df['rank']
-
-        # 5. Train the AI in RAM with fine-tuned hyperparameters
-        print(f"[SYSTEM] Training AI on {len(df)} global matches with Tactical Tier Framework...")
-        model = RandomForestClassifier(
-            n_estimators=250, 
-            max_depth=14, 
-            min_samples_split=4, 
-            random_state=42
-        )
-        model.fit(X, y)
-        
-        spider_brain = model
-        print("✅ Spider Brain is fully online and ready to predict!")
+        report = brain.memory_report(artifact, path)
+        if report:
+            print(f"[SYSTEM] Worker {report['pid']} RSS {report['rss_mb']} MB, {report['brain_mapped_mb']} of {report['brain_size_mb']} MB Brain shared via mmap. "
+                  f"{report['workers']} workers: ~{report['total_shared_mb']} MB shared vs ~{report['total_unshared_mb']} MB unshared.")
 
     except Exception as e:
         print(f"❌ Critical Error waking up the brain: {e}")
 
-# Trigger the brain to wake up immediately when the server starts
+def refresh_brain_if_stale():
+    """Picks up a Brain published by a retrain job in any process, checking at most every few seconds."""
+    global brain_checked_at
+    if time.time() - brain_checked_at < BRAIN_CHECK_INTERVAL: return
+    brain_checked_at = time.time()
+    if brain.active_artifact_path() != brain_path:
+        wake_up_the_brain()
+
+# Load the newest trained Brain immediately when the server starts
 wake_up_the_brain()
 
 # --- ADMIN AUTHENTICATION ---
@@ -127,56 +114,141 @@ ROSTERS = {
     ]
 }
 
-cache = {
-    "last_updated": {"main": 0, "academy": 0},
-    "roster_data": {"main": [], "academy": []},
-    "player_details": {},
-    "news": {"last_updated": 0, "data": []}
-}
-
-def get_headers(): return {"Authorization": API_KEY}
-
-# --- CRASH-PROOF API FETCHER ---
-def fetch_with_retry(url):
-    """Fails fast to prevent Render from crashing the app due to 30s timeout."""
-    try:
-        r = requests.get(url, headers=get_headers(), timeout=5)
-        if r.status_code == 200:
-            return r.json()
-        elif r.status_code == 429:
-            time.sleep(1)
-            r2 = requests.get(url, headers=get_headers(), timeout=5)
-            if r2.status_code == 200:
-                return r2.json()
-    except: pass
+# --- SHARED CACHES ---
+# One sqlite file that every gunicorn worker reads and fills, bounded per namespace (see cache.py).
+# CACHE_BACKEND=memory keeps them per process instead.
+CACHE_PATH = None if os.environ.get("CACHE_BACKEND") == "memory" else os.environ.get("CACHE_PATH", os.path.join(brain.MODEL_DIR, "cache.sqlite"))
+player_ranks = open_cache("player_ranks", maxsize=256, ttl=7 * 86400, path=CACHE_PATH)  # "name#tag" -> {"rank", "fetched_at"}
+roster_cache = open_cache("rosters", maxsize=len(ROSTERS), ttl=None, path=CACHE_PATH)  # team_id -> {"roster", "updated_at"}
+player_details = open_cache("player_details", maxsize=512, ttl=600, path=CACHE_PATH)  # "name#tag" -> /api/player payload
+news_cache = open_cache("news", maxsize=1, ttl=None, path=CACHE_PATH)  # "feed" -> the published news feed
+tournament_types_cache = open_cache("tournament_types", maxsize=1, ttl=600, path=CACHE_PATH)  # "all" -> [[tournament id, match_type], ...]
+
+# --- HENRIK API CLIENT ---
+# Shared keep-alive pool with retries and a circuit breaker (see henrik.py). Web requests
+# give up fast: two attempts, short backoff, and no wait at all while the API is down.
+henrik_client = henrik.HenrikClient(API_KEY, timeout=5, max_attempts=2, backoff=0.5, max_backoff=2)
+# Background Henrik fan-out (rosters, news, profile backfills) shares one pool: at most HENRIK_FETCH_WORKERS calls in flight
+HENRIK_FETCH_WORKERS = 4
+henrik_pool = ThreadPoolExecutor(max_workers=HENRIK_FETCH_WORKERS, thread_name_prefix="henrik")
+
+# --- METRICS ---
+# Prometheus text on /metrics (see metrics.py). Workers pool their samples next to the shared cache;
+# CACHE_BACKEND=memory keeps them per process too.
+metrics.REGISTRY.directory = None if CACHE_PATH is None else os.environ.get("METRICS_DIR", os.path.join(brain.MODEL_DIR, "metrics"))
+REQUEST_SECONDS = metrics.REGISTRY.histogram("presa_http_request_seconds", "Flask request latency by route", ("route", "method"))
+REQUESTS = metrics.REGISTRY.counter("presa_http_requests_total", "Flask responses by route and status", ("route", "method", "status"))
+CACHE_LOOKUPS = metrics.REGISTRY.counter("presa_cache_lookups_total", "Cache lookups by cache and result", ("cache", "result"))
+PREDICT_SECONDS = metrics.REGISTRY.histogram("presa_brain_predict_seconds", "Spider Brain inference time per call", ("kind",),
+                                             buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1))
+BRAIN_TRAIN_SECONDS = metrics.REGISTRY.gauge("presa_brain_train_seconds", "Training time of the active Brain", ("version",))
+BRAIN_TRAIN_ROWS = metrics.REGISTRY.gauge("presa_brain_training_rows", "Rows the active Brain was trained on", ("version",))
+
+@metrics.REGISTRY.on_collect
+def collect_app_metrics():
+    for name, c in (("player_ranks", player_ranks), ("rosters", roster_cache), ("player_details", player_details),
+                    ("news", news_cache), ("tournament_types", tournament_types_cache), ("predictions", prediction_cache)):
+        CACHE_LOOKUPS.set(c.hits, cache=name, result="hit")
+        CACHE_LOOKUPS.set(c.misses, cache=name, result="miss")
+    BRAIN_TRAIN_SECONDS.clear()
+    BRAIN_TRAIN_ROWS.clear()
+    current_brain = active_brain
+    if current_brain:
+        BRAIN_TRAIN_SECONDS.set(current_brain.get('train_seconds', 0), version=current_brain['version'])
+        BRAIN_TRAIN_ROWS.set(current_brain.get('rows', 0), version=current_brain['version'])
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    # The route template, not the path, so player names never become label values
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    REQUEST_SECONDS.observe(time.perf_counter() - g.request_started, route=route, method=request.method)
+    REQUESTS.inc(route=route, method=request.method, status=str(response.status_code))
+    metrics.REGISTRY.flush()
+    return response
+
+@app.route('/metrics')
+def prometheus_metrics():
+    families = metrics.REGISTRY.merged()
+    metrics.add_ratio(families, "presa_cache_hit_ratio", "Share of cache lookups that hit", "presa_cache_lookups_total", "result", "hit")
+    return Response(metrics.render(families), mimetype="text/plain; version=0.0.4")
+
+# --- ROSTER RANKS (stale-while-revalidate) ---
+# Page views always get the cached roster; stale ranks are refreshed in the background.
+ROSTER_TTL = 1800
+roster_refreshing = set()
+roster_lock = threading.Lock()
+
+def fetch_player_rank(player):
+    safe_name, safe_tag = urllib.parse.quote(player['name']), urllib.parse.quote(player['tag'])
+    url = f"{henrik.HENRIK_API_URL}/valorant/v2/mmr/{REGION}/{safe_name}/{safe_tag}"
+    data_json = henrik_client.get_json(url)
+    if data_json:
+        return data_json.get('data', {}).get('current_data', {}).get('currenttierpatched')
     return None
 
-def update_roster_ranks(team_id):
-    updated_roster = []
-    if team_id not in ROSTERS: return []
+def build_roster(team_id):
+    """The roster as served: every player with their last known rank and when it was fetched."""
+    roster = []
     for player in ROSTERS[team_id]:
+        known = player_ranks.get(f"{player['name']}#{player['tag']}") or {}
         stats = player.copy()
         stats['main_agent'] = player['fixed_agent']
-        stats['rank'] = "Unranked"
-        
-        safe_name, safe_tag = urllib.parse.quote(player['name']), urllib.parse.quote(player['tag'])
-        url = f"https://api.henrikdev.xyz/valorant/v2/mmr/{REGION}/{safe_name}/{safe_tag}"
-        
-        data_json = fetch_with_retry(url)
-        if data_json:
-            rank = data_json.get('data', {}).get('current_data', {}).get('currenttierpatched')
-            if rank: stats['rank'] = rank
-            
-        time.sleep(0.3) 
-        updated_roster.append(stats)
-    return updated_roster
+        stats['rank'] = known.get('rank') or "Unranked"
+        stats['rank_updated_at'] = known.get('fetched_at')
+        roster.append(stats)
+    return roster
+
+def update_roster_ranks(team_id):
+    """Re-fetches the stale ranks of one roster concurrently. A failed fetch keeps the old rank."""
+    if team_id not in ROSTERS: return []
+    now = time.time()
+    stale = [p for p in ROSTERS[team_id] if now - (player_ranks.get(f"{p['name']}#{p['tag']}") or {}).get('fetched_at', 0) > ROSTER_TTL]
+    for player, rank in zip(stale, henrik_pool.map(fetch_player_rank, stale)):
+        if rank:
+            player_ranks.set(f"{player['name']}#{player['tag']}", {"rank": rank, "fetched_at": time.time()})
+    roster = build_roster(team_id)
+    roster_cache.set(team_id, {"roster": roster, "updated_at": now})
+    return roster
+
+def refresh_roster_in_background(team_id):
+    """Starts update_roster_ranks(team_id) unless a refresh of that roster is already running."""
+    with roster_lock:
+        if team_id in roster_refreshing: return False
+        roster_refreshing.add(team_id)
+
+    def run():
+        # Other workers share the roster: one of them refreshes it, the rest keep serving
+        if not roster_cache.try_lock(team_id, lease=120):
+            with roster_lock:
+                roster_refreshing.discard(team_id)
+            return
+        try:
+            if time.time() - (roster_cache.get(team_id) or {}).get("updated_at", 0) > ROSTER_TTL:
+                update_roster_ranks(team_id)
+        except Exception as e:
+            print(f"Error fetching ranks: {e}")
+        finally:
+            roster_cache.unlock(team_id)
+            with roster_lock:
+                roster_refreshing.discard(team_id)
+
+    threading.Thread(target=run, name=f"roster-{team_id}", daemon=True).start()
+    return True
+
+# Warm both rosters when the server starts, so the first visitor already gets ranks
+for team_id in ROSTERS:
+    refresh_roster_in_background(team_id)
 
 def check_player_climb(name, tag):
     safe_name = urllib.parse.quote(name)
     safe_tag = urllib.parse.quote(tag)
-    url = f"https://api.henrikdev.xyz/valorant/v1/mmr-history/{REGION}/{safe_name}/{safe_tag}"
+    url = f"{henrik.HENRIK_API_URL}/valorant/v1/mmr-history/{REGION}/{safe_name}/{safe_tag}"
     
-    data_json = fetch_with_retry(url)
+    data_json = henrik_client.get_json(url)
     if data_json:
         data = data_json.get('data', [])
         if len(data) >= 2:
@@ -192,71 +264,146 @@ def check_player_climb(name, tag):
                 }
     return {"climbed": False}
 
-def analyze_roles(matches, is_db=False):
-    role_stats = {"Duelist": {"matches": 0, "wins": 0, "kills": 0, "deaths": 0}, "Controller": {"matches": 0, "wins": 0, "kills": 0, "deaths": 0}, "Initiator": {"matches": 0, "wins": 0, "kills": 0, "deaths": 0}, "Sentinel": {"matches": 0, "wins": 0, "kills": 0, "deaths": 0}}
-    AGENT_ROLES = {"Jett": "Duelist", "Raze": "Duelist", "Reyna": "Duelist", "Phoenix": "Duelist", "Yoru": "Duelist", "Neon": "Duelist", "Iso": "Duelist", "Omen": "Controller", "Brimstone": "Controller", "Viper": "Controller", "Astra": "Controller", "Harbor": "Controller", "Clove": "Controller", "Sova": "Initiator", "Breach": "Initiator", "Skye": "Initiator", "KAY/O": "Initiator", "Kayo": "Initiator", "Fade": "Initiator", "Gekko": "Initiator", "Sage": "Sentinel", "Cypher": "Sentinel", "Killjoy": "Sentinel", "Chamber": "Sentinel", "Deadlock": "Sentinel", "Vyse": "Sentinel"}
-    for m in matches:
-        if is_db:
-            agent = m.get('agent')
-            k, d = m.get('kills', 0), m.get('deaths', 0)
-            is_win = m.get('team_won', False)
-        else:
-            if 'meta' not in m or 'stats' not in m: continue
-            agent = m.get('meta', {}).get('character', {}).get('name') or m.get('stats', {}).get('character', {}).get('name')
-            k, d = m['stats'].get('kills', 0), m['stats'].get('deaths', 0)
-            my_team = m.get('stats', {}).get('team', '').lower()
-            is_win = (my_team == ("blue" if m['teams']['blue'] > m['teams']['red'] else "red"))
-        role = AGENT_ROLES.get(agent, "Flex")
-        if role not in role_stats: continue 
-        role_stats[role]['matches'] += 1
-        role_stats[role]['kills'] += k
-        role_stats[role]['deaths'] += d
-        if is_win: role_stats[role]['wins'] += 1
-    radar = { "Duelist": 0, "Controller": 0, "Initiator": 0, "Sentinel": 0, "Slayer": 0 }
-    total_kd = 0; total_matches = 0
-    for role, data in role_stats.items():
-        if data['matches'] > 0:
-            radar[role] = int((data['wins'] / data['matches']) * 100)
-            total_kd += (data['kills'] / data['deaths']) if data['deaths'] > 0 else data['kills']
-            total_matches += 1
-    if total_matches > 0: radar["Slayer"] = int(min(max(((total_kd / total_matches) - 0.5) * 66, 0), 100))
-    return {"stats": role_stats, "radar": radar}
-
-def analyze_matches(matches, is_db=False):
-    stats = {"wins": 0, "total": 0, "kills": 0, "deaths": 0, "agents": {}, "maps": {}, "best_map": "N/A"}
-    for m in matches:
-        if is_db:
-            agent = m.get('agent')
-            map_name = m.get('map_name')
-            is_win = m.get('team_won', False)
-            k, d = m.get('kills', 0), m.get('deaths', 0)
-        else:
-            if 'meta' not in m or 'stats' not in m: continue
-            agent = m.get('meta', {}).get('character', {}).get('name') or m.get('stats', {}).get('character', {}).get('name')
-            map_name = m.get('meta', {}).get('map', {}).get('name')
-            my_team = m.get('stats', {}).get('team')
-            if not agent or not map_name or not my_team: continue
-            is_win = (my_team.lower() == ("blue" if m['teams']['blue'] > m['teams']['red'] else "red"))
-            k, d = m['stats'].get('kills', 0), m['stats'].get('deaths', 0)
-        stats['total'] += 1
-        stats['kills'] += k
-        stats['deaths'] += d
-        if is_win: stats['wins'] += 1
-        if agent not in stats['agents']: stats['agents'][agent] = {"matches": 0, "wins": 0}
-        stats['agents'][agent]['matches'] += 1
-        if is_win: stats['agents'][agent]['wins'] += 1
-        if map_name not in stats['maps']: stats['maps'][map_name] = {"matches": 0, "wins": 0, "kills": 0, "deaths": 0}
-        stats['maps'][map_name]['matches'] += 1
-        if is_win: stats['maps'][map_name]['wins'] += 1
-        stats['maps'][map_name]['kills'] += k
-        stats['maps'][map_name]['deaths'] += d
-    sorted_maps = [{"name": m, "matches": d['matches'], "win_rate": int((d['wins']/d['matches'])*100) if d['matches']>0 else 0, "kd": round(d['kills']/d['deaths'],2) if d['deaths']>0 else d['kills']} for m, d in stats['maps'].items()]
-    stats['top_maps'] = sorted(sorted_maps, key=lambda x: x['matches'], reverse=True)
-    if stats['top_maps']: stats['best_map'] = stats['top_maps'][0]['name']
-    sorted_agents = [{"name": a, "matches": d['matches'], "win_rate": int((d['wins']/d['matches'])*100) if d['matches']>0 else 0} for a, d in stats['agents'].items()]
-    stats['top_agents'] = sorted(sorted_agents, key=lambda x: x['matches'], reverse=True)
-    stats['roles'] = analyze_roles(matches, is_db)
-    return stats
+# --- NEWS FEED JOB ---
+# Tournament podiums plus rank climbs, rebuilt every NEWS_INTERVAL seconds by one worker
+# and published to the shared news cache, where every worker reads it.
+NEWS_INTERVAL = 3600
+
+def climb_message(p, climb):
+    old_r, curr_r = climb["old_rank"], climb["current_rank"]
+    msg = f"Congratulations to {p['name']} for getting out of {old_r}!"
+    if "1" in curr_r and "3" in old_r:
+        msg = f"Shout out to {p['name']} for hitting {curr_r}!"
+    elif "Immortal" in curr_r or "Radiant" in curr_r:
+        msg = f"Congratulations {p['name']} for your massive climb to {curr_r}!"
+    return msg
+
+def build_news_feed():
+    news_items = []
+    if supabase:
+        try:
+            res = supabase.table('tournaments').select('*').order('created_at', desc=True).limit(10).execute()
+            for t in res.data:
+                p = (t.get('placement') or '').lower()
+                if any(word in p for word in ['1st', '2nd', '3rd', 'champion', 'runner', 'podium', 'winner']):
+                    news_items.append({
+                        "type": "tournament",
+                        "event_name": t['name'],
+                        "placement": t['placement'],
+                        "division": t['team_division'],
+                        "logo_url": t.get('logo_url')
+                    })
+        except Exception as e:
+            print(f"Error fetching tournaments for news: {e}")
+
+    # Every player is checked, concurrently, so none silently drop out of the feed
+    players = [(div, p) for div, roster in ROSTERS.items() for p in roster if p.get('type') in ['player', 'sub']]
+    climbs = henrik_pool.map(lambda entry: check_player_climb(entry[1]['name'], entry[1]['tag']), players)
+    for (div, p), climb in zip(players, climbs):
+        if climb["climbed"]:
+            news_items.append({
+                "type": "player_climb",
+                "message": climb_message(p, climb),
+                "division": div,
+                "player": {
+                    "name": p['name'], "tag": p['tag'], "role": p['role'],
+                    "fixed_agent": p['fixed_agent'], "rank": climb["current_rank"]
+                }
+            })
+    return news_items
+
+def publish_news_feed(items):
+    body = json.dumps(items, sort_keys=True)
+    feed = {"version": hashlib.sha1(body.encode()).hexdigest()[:16], "built_at": time.time(), "items": items}
+    news_cache.set("feed", feed)
+    return feed
+
+def load_news_feed():
+    return news_cache.get("feed")
+
+def refresh_news_feed_if_due():
+    """Rebuilds the feed when it is older than NEWS_INTERVAL. Only one worker builds at a time."""
+    feed = news_cache.get("feed")
+    if feed and time.time() - feed["built_at"] < NEWS_INTERVAL: return False
+    # A builder that died releases the lock after one interval
+    if not news_cache.try_lock("build", lease=NEWS_INTERVAL): return False
+    try:
+        feed = publish_news_feed(build_news_feed())
+        print(f"[SYSTEM] News feed {feed['version']} published ({len(feed['items'])} items).")
+        return True
+    finally:
+        news_cache.unlock("build")
+
+def news_job():
+    while True:
+        try:
+            refresh_news_feed_if_due()
+        except Exception as e:
+            print(f"Error building news feed: {e}")
+        time.sleep(60)
+
+threading.Thread(target=news_job, name="news", daemon=True).start()
+
+# --- PLAYER DB STATS ---
+# Scrim and tournament rows for /api/player come classified from one view, created once
+# in the Supabase SQL editor:
+#
+#     create view player_match_details as
+#     select s.player_name, s.agent, s.kills, s.deaths, m.map_name, m.team_won, m.tournament_id,
+#            coalesce(t.match_type, 'tournament') as match_type
+#     from player_match_stats s
+#     join custom_matches m on m.id = s.match_id
+#     left join tournaments t on t.id = m.tournament_id;
+#
+# Until it exists, the stats and their matches are joined here and match types come from
+# tournament_types(), cached for every worker and dropped on every admin write.
+PLAYER_MATCHES_VIEW = 'player_match_details'
+PROFILE_PAGES_PER_BACKFILL = 5  # Henrik pages one background backfill of a profile may read
+profile_backfills = set()  # player keys with a backfill queued or running in this worker
+profile_backfills_lock = threading.Lock()
+PLAYER_VIEW_RETRY_SECONDS = 600  # a missing view is looked for again after this, so creating it needs no restart
+player_view_missing_until = 0
+
+def tournament_types():
+    """{tournament id: match_type} for every tournament."""
+    # Cached as pairs: the shared cache stores JSON, which would turn integer ids into string keys
+    pairs = tournament_types_cache.get_or_load("all", lambda: [[t['id'], t['match_type']] for t in supabase.table('tournaments').select('id, match_type').execute().data])
+    return {tournament_id: match_type for tournament_id, match_type in pairs}
+
+def invalidate_tournament_types():
+    tournament_types_cache.clear()
+
+def relation_missing(error):
+    """True when PostgREST says the table or view is not there (42P01, or PGRST205 from its schema cache)."""
+    code = getattr(error, 'code', None)
+    return code in ('42P01', 'PGRST205') or 'does not exist' in str(error) or 'Could not find the table' in str(error)
+
+def player_db_matches(name):
+    """The player's custom match rows (agent, kills, deaths, map_name, team_won, match_type), one query."""
+    global player_view_missing_until
+    if time.time() >= player_view_missing_until:
+        try:
+            return supabase.table(PLAYER_MATCHES_VIEW).select('agent, kills, deaths, map_name, team_won, match_type').ilike('player_name', name).execute().data
+        except Exception as e:
+            if relation_missing(e):
+                player_view_missing_until = time.time() + PLAYER_VIEW_RETRY_SECONDS
+                print(f"⚠️ {PLAYER_MATCHES_VIEW} does not exist, joining player stats in the app for {PLAYER_VIEW_RETRY_SECONDS}s: {e}")
+            else:
+                # A timeout or a hiccup: join in the app for this request only
+                print(f"⚠️ {PLAYER_MATCHES_VIEW} query failed, joining player stats in the app: {e}")
+
+    stats = supabase.table('player_match_stats').select('match_id, agent, kills, deaths').ilike('player_name', name).execute().data
+    if not stats: return []
+    match_ids = list({s['match_id'] for s in stats})
+    matches = {m['id']: m for m in supabase.table('custom_matches').select('id, tournament_id, map_name, team_won').in_('id', match_ids).execute().data}
+    types = tournament_types()
+    rows = []
+    for stat in stats:
+        match_info = matches.get(stat['match_id'])
+        if match_info:
+            rows.append({"agent": stat['agent'], "kills": stat['kills'], "deaths": stat['deaths'], "map_name": match_info['map_name'],
+                         "team_won": match_info['team_won'], "match_type": types.get(match_info['tournament_id']) or 'tournament'})
+    return rows
 
 # --- PUBLIC ROUTES ---
 
@@ -276,27 +423,14 @@ def player_page(): return render_template('player.html')
 @app.route('/api/team-history/<team_id>')
 def get_roster_history(team_id):
     if team_id not in ROSTERS: return jsonify({"error": "Invalid team"}), 400
-    current_time = time.time()
-    
-    try:
-        if not cache["roster_data"][team_id] or (current_time - cache["last_updated"][team_id] > 1800):
-            new_data = update_roster_ranks(team_id)
-            if new_data:
-                cache["roster_data"][team_id] = new_data
-                cache["last_updated"][team_id] = current_time
-    except Exception as e:
-        print(f"Error fetching ranks: {e}")
-        
-    if not cache["roster_data"][team_id]:
-        fallback = []
-        for p in ROSTERS[team_id]:
-            stat = p.copy()
-            stat['main_agent'] = p['fixed_agent']
-            stat['rank'] = "Unranked"
-            fallback.append(stat)
-        return jsonify({"roster": fallback})
+    # Never waits on Henrik: serve what we have and revalidate in the background
+    entry = roster_cache.get(team_id) or {}
+    if time.time() - entry.get("updated_at", 0) > ROSTER_TTL:
+        refresh_roster_in_background(team_id)
 
-    return jsonify({"roster": cache["roster_data"][team_id]})
+    roster = entry.get("roster") or build_roster(team_id)
+    return jsonify({"roster": roster, "updated_at": entry.get("updated_at"),
+                    "refreshing": team_id in roster_refreshing})
 
 @app.route('/api/tournaments/<team_id>')
 def get_public_tournaments(team_id):
@@ -308,100 +442,62 @@ def get_public_tournaments(team_id):
 
 @app.route('/api/news')
 def get_news_feed():
-    current_time = time.time()
-    if current_time - cache["news"]["last_updated"] < 3600 and cache["news"]["data"]:
-        return jsonify(cache["news"]["data"])
-
-    news_items = []
-    start_processing_time = time.time()
-    
-    if supabase:
-        try:
-            res = supabase.table('tournaments').select('*').order('created_at', desc=True).limit(10).execute()
-            for t in res.data:
-                p = (t.get('placement') or '').lower()
-                if any(word in p for word in ['1st', '2nd', '3rd', 'champion', 'runner', 'podium', 'winner']):
-                    news_items.append({
-                        "type": "tournament",
-                        "event_name": t['name'],
-                        "placement": t['placement'],
-                        "division": t['team_division'],
-                        "logo_url": t.get('logo_url')
-                    })
-        except: pass
-
-    for div, players in ROSTERS.items():
-        for p in players:
-            if time.time() - start_processing_time > 15:
-                break
-                
-            if p.get('type') in ['player', 'sub']:
-                climb = check_player_climb(p['name'], p['tag'])
-                if climb["climbed"]:
-                    old_r, curr_r = climb["old_rank"], climb["current_rank"]
-                    msg = f"Congratulations to {p['name']} for getting out of {old_r}!"
-                    if "1" in curr_r and "3" in old_r:
-                        msg = f"Shout out to {p['name']} for hitting {curr_r}!"
-                    elif "Immortal" in curr_r or "Radiant" in curr_r:
-                        msg = f"Congratulations {p['name']} for your massive climb to {curr_r}!"
-                    
-                    news_items.append({
-                        "type": "player_climb",
-                        "message": msg,
-                        "division": div,
-                        "player": {
-                            "name": p['name'], "tag": p['tag'], "role": p['role'],
-                            "fixed_agent": p['fixed_agent'], "rank": curr_r
-                        }
-                    })
-                time.sleep(0.2) 
-
-    cache["news"]["data"] = news_items
-    cache["news"]["last_updated"] = current_time
-    return jsonify(news_items)
+    # Built off the request path by the news job; this only reads the published feed
+    feed = load_news_feed()
+    if not feed:
+        return jsonify([])
+    response = jsonify(feed["items"])
+    response.set_etag(feed["version"])
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
 
 @app.route('/api/player/<name>/<tag>')
 def get_player_detail(name, tag):
-    p_key = f"{name}#{tag}"
-    current_time = time.time()
-    if p_key in cache["player_details"] and (current_time - cache["player_details"][p_key]['time'] < 600):
-        return jsonify(cache["player_details"][p_key]['data'])
-    
-    safe_name, safe_tag = urllib.parse.quote(name), urllib.parse.quote(tag)
-    url = f"https://api.henrikdev.xyz/valorant/v1/lifetime/matches/{REGION}/{safe_name}/{safe_tag}?size=40"
-    ranked_matches = []
-    
-    data_json = fetch_with_retry(url)
-    if data_json:
-        for m in data_json.get('data', []):
-            mode = m.get('meta', {}).get('mode', '').lower()
-            if mode in ['competitive', 'unrated', 'swiftplay']: ranked_matches.append(m)
+    # Concurrent lookups of one player, in any worker, share a single fetch
+    return jsonify(player_details.get_or_load(f"{name}#{tag}".lower(), lambda: load_player_detail(name, tag)))
+
+def load_player_detail(name, tag):
+    # Lifetime ranked totals, topped up with at most one Henrik page of new games (see profile_store.py);
+    # anything older is folded in the background and shows up on a later view
+    try:
+        ranked, pending = profile_store.refresh_profile(supabase, henrik_client, REGION, name, tag, max_pages=1)
+        if pending and supabase:
+            schedule_profile_backfill(name, tag)
+    except Exception as e:
+        print(f"Error refreshing stored profile, using the latest matches only: {e}")
+        ranked, _ = profile_store.refresh_profile(None, henrik_client, REGION, name, tag, max_pages=1)
 
     scrim_matches = []
     tourney_matches = []
     if supabase:
         try:
-            p_stats_res = supabase.table('player_match_stats').select('*').ilike('player_name', name).execute()
-            if p_stats_res.data:
-                match_ids = [s['match_id'] for s in p_stats_res.data]
-                c_matches_res = supabase.table('custom_matches').select('id, tournament_id, map_name, team_won').in_('id', match_ids).execute()
-                c_matches_dict = {m['id']: m for m in c_matches_res.data}
-                tourney_ids = list(set([m['tournament_id'] for m in c_matches_res.data]))
-                t_res = supabase.table('tournaments').select('id, match_type').in_('id', tourney_ids).execute()
-                t_types = {t['id']: t['match_type'] for t in t_res.data}
-
-                for stat in p_stats_res.data:
-                    match_info = c_matches_dict.get(stat['match_id'])
-                    if match_info:
-                        combined = {"agent": stat['agent'], "kills": stat['kills'], "deaths": stat['deaths'], "map_name": match_info['map_name'], "team_won": match_info['team_won']}
-                        if t_types.get(match_info['tournament_id'], 'tournament') == 'scrim': scrim_matches.append(combined)
-                        else: tourney_matches.append(combined)
+            for row in player_db_matches(name):
+                if row['match_type'] == 'scrim': scrim_matches.append(row)
+                else: tourney_matches.append(row)
         except Exception as e: 
             print(f"Error fetching DB stats: {e}")
 
-    data = {"ranked": analyze_matches(ranked_matches, is_db=False), "scrims": analyze_matches(scrim_matches, is_db=True), "tournaments": analyze_matches(tourney_matches, is_db=True)}
-    cache["player_details"][p_key] = {"time": current_time, "data": data}
-    return jsonify(data)
+    return {"ranked": profile_store.summarize(ranked), "scrims": profile_store.analyze(scrim_matches), "tournaments": profile_store.analyze(tourney_matches)}
+
+def schedule_profile_backfill(name, tag):
+    """Queues the rest of a profile's refresh on henrik_pool, once per player at a time."""
+    key = profile_store.profile_key(name, tag)
+    with profile_backfills_lock:
+        if key in profile_backfills:
+            return
+        profile_backfills.add(key)
+    henrik_pool.submit(backfill_profile, name, tag, key)
+
+def backfill_profile(name, tag, key):
+    try:
+        profile_store.refresh_profile(supabase, henrik_client, REGION, name, tag, max_pages=PROFILE_PAGES_PER_BACKFILL)
+        # The next view rebuilds the payload from the fuller profile
+        player_details.delete(key)
+    except Exception as e:
+        print(f"⚠️ Profile backfill failed for {name}#{tag}: {e}")
+    finally:
+        with profile_backfills_lock:
+            profile_backfills.discard(key)
 
 # --- ADMIN ROUTES ---
 @app.route('/Presa_log')
@@ -422,232 +518,418 @@ def add_tournament():
     data = request.json
     try:
         res = supabase.table('tournaments').insert({"name": data.get("name"), "team_division": data.get("division"), "placement": data.get("placement"), "match_type": data.get("type", "tournament"), "logo_url": data.get("logo_url", "")}).execute()
+        invalidate_tournament_types()
         return jsonify({"success": True, "data": res.data})
     except Exception as e: return jsonify({"error": str(e)}), 500
 
+# --- MATCH INGESTION ---
+# Roster players by (name, tag), lowercased -> the name stats are stored under
+PRESA_PLAYERS = {(p['name'].lower(), p['tag'].lower()): p['name'] for roster in ROSTERS.values() for p in roster}
+INGEST_MAX_MATCHES = 100
+# Bulk ingests share Henrik's per-key quota with everything else (same HENRIK_RATE_LIMIT as the spider)
+ingest_bucket = henrik.TokenBucket(float(os.environ.get("HENRIK_RATE_LIMIT", 30)))
+# Optional, makes a duplicate impossible even for two ingests racing each other:
+#     alter table custom_matches add constraint custom_matches_riot_match_id_key unique (riot_match_id);
+
+def match_id_from(tracker_url):
+    return (tracker_url or '').split('/')[-1].split('?')[0].strip()
+
+def fetch_custom_match(match_id):
+    ingest_bucket.acquire()
+    data_json = henrik_client.get_json(f"{henrik.HENRIK_API_URL}/valorant/v2/match/{urllib.parse.quote(match_id)}")
+    return data_json.get('data') if data_json else None
+
+def parse_custom_match(match_data):
+    """(custom_matches row, player_match_stats rows) for the Presa side of a match, or None without Presa players."""
+    meta = match_data.get('metadata', {})
+    teams = match_data.get('teams', {})
+    players = match_data.get('players', {}).get('all_players', [])
+    presa = [(PRESA_PLAYERS[(p['name'].lower(), p['tag'].lower())], p) for p in players if (p['name'].lower(), p['tag'].lower()) in PRESA_PLAYERS]
+    if not presa: return None
+    presa_color = presa[0][1]['team'].lower()
+    match_row = {"map_name": meta.get('map', 'Unknown'), "team_won": teams.get(presa_color, {}).get('has_won', False),
+                 "team_score": teams.get(presa_color, {}).get('rounds_won', 0),
+                 "enemy_score": teams.get('red' if presa_color == 'blue' else 'blue', {}).get('rounds_won', 0)}
+    stats = [{"player_name": name, "agent": p['character'], "kills": p['stats']['kills'], "deaths": p['stats']['deaths'], "assists": p['stats']['assists']} for name, p in presa]
+    return match_row, stats
+
+def ingest_matches(tourney_id, tracker_urls):
+    """Fetches and stores many matches for one event. Returns one {tracker_url, match_id, status} per URL.
+
+    Statuses: ingested, already_ingested, duplicate (repeated in this request), invalid,
+    not_found, no_presa_players, error. Known riot_match_ids are skipped before any fetch,
+    and every new match and stat row goes in with one insert per table.
+    """
+    results = [{"tracker_url": url, "match_id": match_id_from(url), "status": None} for url in tracker_urls]
+    seen = set()
+    for r in results:
+        if not r["match_id"]: r["status"] = "invalid"
+        elif r["match_id"] in seen: r["status"] = "duplicate"
+        else: seen.add(r["match_id"])
+    known = {m['riot_match_id'] for m in feature_store.fetch_in_chunks(supabase, 'custom_matches', 'riot_match_id', 'riot_match_id', seen)}
+    todo = [r for r in results if r["status"] is None and r["match_id"] not in known]
+    for r in results:
+        if r["status"] is None and r["match_id"] in known: r["status"] = "already_ingested"
+
+    # Concurrent, within HENRIK_FETCH_WORKERS calls in flight and the rate budget
+    parsed = {}
+    for r, match_data in zip(todo, henrik_pool.map(lambda r: fetch_custom_match(r["match_id"]), todo)):
+        rows = parse_custom_match(match_data) if match_data else None
+        if rows: parsed[r["match_id"]] = rows
+        else: r["status"] = "no_presa_players" if match_data else "not_found"
+    if not parsed: return results
+
+    match_rows = [dict(match_row, tournament_id=tourney_id, riot_match_id=match_id) for match_id, (match_row, _) in parsed.items()]
+    inserted = []
+    try:
+        inserted = supabase.table('custom_matches').insert(match_rows).execute().data
+        db_ids = {m['riot_match_id']: m['id'] for m in inserted}
+        stats = [dict(stat, match_id=db_ids[match_id]) for match_id, (_, match_stats) in parsed.items() for stat in match_stats]
+        if stats: supabase.table('player_match_stats').insert(stats).execute()
+    except Exception as e:
+        print(f"❌ Bulk ingest failed: {e}")
+        # No match without its stats: undo the matches so the same request can simply be retried
+        if inserted:
+            supabase.table('custom_matches').delete().in_('id', [m['id'] for m in inserted]).execute()
+        for r in results:
+            if r["match_id"] in parsed and r["status"] is None: r["status"] = "error"
+        return results
+    for r in results:
+        if r["match_id"] in parsed and r["status"] is None: r["status"] = "ingested"
+
+    invalidate_tournament_types()
+    # Their profiles now include these matches
+    ingested = {stat['player_name'] for _, match_stats in parsed.values() for stat in match_stats}
+    for (name, tag), roster_name in PRESA_PLAYERS.items():
+        if roster_name in ingested: player_details.delete(f"{name}#{tag}")
+    return results
+
+def tournament_exists(tourney_id):
+    return bool(supabase.table('tournaments').select('id').eq('id', tourney_id).execute().data)
+
+@app.route('/api/admin/ingest_matches', methods=['POST'])
+@requires_auth
+def ingest_matches_route():
+    if not supabase: return jsonify({"error": "DB not connected"}), 500
+    data = request.json or {}
+    urls = data.get('tracker_urls') or []
+    if isinstance(urls, str): urls = urls.splitlines()
+    urls = [u.strip() for u in urls if u and u.strip()]
+    if not urls: return jsonify({"error": "No matches given"}), 400
+    if len(urls) > INGEST_MAX_MATCHES: return jsonify({"error": f"At most {INGEST_MAX_MATCHES} matches per request"}), 400
+    try:
+        if not tournament_exists(data.get('tournament_id')): return jsonify({"error": "Tournament missing"}), 404
+        results = ingest_matches(data.get('tournament_id'), urls)
+    except Exception as e:
+        print(f"❌ Bulk ingest error: {e}")
+        return jsonify({"error": "Error processing matches."}), 500
+    counts = {}
+    for r in results: counts[r["status"]] = counts.get(r["status"], 0) + 1
+    return jsonify({"success": True, "counts": counts, "results": results})
+
 @app.route('/api/admin/ingest_match', methods=['POST'])
 @requires_auth
 def ingest_match():
     if not supabase: return jsonify({"error": "DB not connected"}), 500
-    data = request.json
-    tourney_id = data.get('tournament_id')
-    tracker_url = data.get('tracker_url', '')
-    match_id = tracker_url.split('/')[-1].split('?')[0].strip()
-    if not match_id: return jsonify({"error": "Invalid Match ID"}), 400
-    
-    url = f"https://api.henrikdev.xyz/valorant/v2/match/{match_id}"
-    data_json = fetch_with_retry(url)
-    if not data_json: return jsonify({"error": "Match not found or API busy"}), 404
-    match_data = data_json.get('data')
-    
+    data = request.json or {}
+    if not match_id_from(data.get('tracker_url')): return jsonify({"error": "Invalid Match ID"}), 400
     try:
-        t_res = supabase.table('tournaments').select('team_division').eq('id', tourney_id).execute()
-        if not t_res.data: return jsonify({"error": "Tournament missing"}), 404
-        
-        presa_players_map = {}
-        for roster_list in ROSTERS.values():
-            for p in roster_list:
-                presa_players_map[(p['name'].lower(), p['tag'].lower())] = p['name']
-                
-        meta = match_data.get('metadata', {})
-        map_name = meta.get('map', 'Unknown')
-        teams = match_data.get('teams', {})
-        players = match_data.get('players', {}).get('all_players', [])
-        
-        presa_color = None
-        for p in players:
-            key = (p['name'].lower(), p['tag'].lower())
-            if key in presa_players_map:
-                presa_color = p['team'].lower()
-                break
-                
-        if not presa_color: return jsonify({"error": f"No Presa organization players found in this match."}), 400
-        
-        our_score = teams.get(presa_color, {}).get('rounds_won', 0)
-        enemy_score = teams.get('red' if presa_color=='blue' else 'blue', {}).get('rounds_won', 0)
-        match_insert = supabase.table('custom_matches').insert({"tournament_id": tourney_id, "riot_match_id": match_id, "map_name": map_name, "team_won": teams.get(presa_color, {}).get('has_won', False), "team_score": our_score, "enemy_score": enemy_score}).execute()
-        db_match_id = match_insert.data[0]['id']
-        
-        stats = []
-        for p in players:
-            key = (p['name'].lower(), p['tag'].lower())
-            if key in presa_players_map:
-                correct_roster_name = presa_players_map[key]
-                stats.append({"match_id": db_match_id, "player_name": correct_roster_name, "agent": p['character'], "kills": p['stats']['kills'], "deaths": p['stats']['deaths'], "assists": p['stats']['assists']})
-        if stats: supabase.table('player_match_stats').insert(stats).execute()
-        return jsonify({"success": True})
-    except: return jsonify({"error": "Error processing match or already in DB."}), 400
+        if not tournament_exists(data.get('tournament_id')): return jsonify({"error": "Tournament missing"}), 404
+        status = ingest_matches(data.get('tournament_id'), [data.get('tracker_url')])[0]["status"]
+    except Exception as e:
+        print(f"❌ Ingest error: {e}")
+        status = "error"
+    if status == "ingested": return jsonify({"success": True})
+    errors = {"not_found": ("Match not found or API busy", 404), "no_presa_players": ("No Presa organization players found in this match.", 400),
+              "already_ingested": ("Match already in DB.", 400)}
+    message, code = errors.get(status, ("Error processing match or already in DB.", 400))
+    return jsonify({"error": message}), code
 
 # --- SECRET AI ROUTES ---
 @app.route('/secret_spider_lab')
 def secret_spider_lab():
     return render_template('simulator.html', players=[p['name'] for p in ROSTERS['main'] + ROSTERS['academy']])
 
-@app.route('/api/predict/<player_name>/<int:games>')
-def api_predict(player_name, games):
-    global spider_brain
-    if not spider_brain:
-        return jsonify({"error": "Brain is offline. Run /api/admin/retrain to wake it up."}), 500
-
-    try:
-        # Fetch player data from ml_spider_matches
-        res = supabase.table('ml_spider_matches').select('*').ilike('player_name', player_name).execute()
-        if not res.data:
-            return jsonify({"error": "Player not found in global database"}), 404
+# Everything in a prediction that does not depend on the number of simulated games.
+# Keyed by (player, model version, feature store watermark), so a retrain or new spider
+# data naturally misses; moving the simulator slider only reruns the cheap trajectory.
+prediction_cache = TTLCache(maxsize=256, ttl=600)
+
+def load_player_features(player_name, role_map, stored=None):
+    """The player's averaged feature row plus the stats the simulator shows.
+
+    Normally built from the player's feature store row (see feature_store.py). Players
+    the spider has not folded in yet are computed live from ml_spider_matches.
+    Returns None if the player is not in the global database at all.
+    """
+    if stored:
+        return {
+            "X": feature_store.player_feature_vector(stored, role_map),
+            "win_rate": stored['wins'] / max(1, stored['matches']),
+            "current_rank": stored['last_rank'],
+            "primary_role": feature_store.primary_role(stored['role_counts']),
+        }
+
+    rows = [r for page in feature_store.keyset_pages(lambda: supabase.table('ml_spider_matches').select('*').ilike('player_name', player_name)) for r in page]
+    if not rows:
+        return None
+
+    df_player = features.frame_from_rows(rows)
+    
+    # Pull global lobby data to calculate Rank Bias (Relative stats) for this specific player.
+    # Unranked rows are left out exactly like they are when training.
+    match_ids = df_player['match_id'].unique()
+    lobby_res = feature_store.fetch_in_chunks(supabase, 'ml_spider_matches', 'match_id, acs, adr', 'match_id', match_ids,
+                                              ranked_only=True, chunk_size=feature_store.MATCH_CHUNK_SIZE)
+    lobby_rows = features.frame_from_rows(lobby_res) if lobby_res else df_player.iloc[:0]
+    lobbies = features.lobby_aggregates(lobby_rows)
+
+    # Same Feature Engineering layer the Brain was trained with, averaged over the player's matches
+    return {
+        "X": features.player_feature_vector(df_player, lobbies, role_map),
+        "win_rate": df_player['win'].mean(),
+        "current_rank": df_player.iloc[-1]['rank'],
+        "primary_role": features.primary_role(df_player),
+    }
+
+def generate_insights(avg, primary_role):
+    # --- THE INSIGHTS ENGINE (AI Explains "Why") ---
+    avg_kills, avg_deaths = avg['kills'], avg['deaths']
+    avg_kast, avg_hs = avg['kast'], avg['hs_percent']
+    avg_fb, avg_fd = avg['fb'], avg['fd']
+    avg_rel_acs = avg['lobby_relative_acs']
+    avg_duelist = avg['duelist_entry_score']
+    insights = []
+    
+    # Macro Lobby Insight
+    if avg_rel_acs > 25:
+        insights.append(f"Smurf Alert: You are heavily out-fragging the average player in your current lobbies with a relative ACS of +{int(avg_rel_acs)}. The AI expects a rapid climb.")
+    elif avg_rel_acs < -15:
+        insights.append(f"Statistically, you are underperforming your current rank lobby average by {abs(int(avg_rel_acs))} ACS. Unless you focus heavily on utility and KAST, climbing will be difficult.")
+    else:
+        insights.append("You are blending into your current lobbies statistically, meaning your rank movement will rely entirely on your ability to secure round wins.")
+
+    # Role-Specific Insights
+    if primary_role == 'Duelist':
+        if avg_fb >= 2.0:
+            insights.append(f"Excellent entry value. You average {round(avg_fb, 1)} First Bloods per match, successfully creating space for your team.")
+        elif avg_fb < 1.0:
+            insights.append(f"Red Flag: As a Duelist, your First Blood rate ({round(avg_fb, 1)}) is critically low. The AI penalizes you for not taking enough opening engagements.")
+            
+        if avg_duelist > 0:
+            insights.append("Your calculated Duelist Entry Score is positive, meaning the risks you take usually result in a net advantage for your team.")
 
-        df_player = pd.DataFrame(res.data)
-        
-        # Pull global lobby data to calculate Rank Bias (Relative stats) for this specific player
-        match_ids = df_player['match_id'].tolist()
-        lobby_res = supabase.table('ml_spider_matches').select('match_id, acs, adr').in_('match_id', match_ids).execute()
-        if lobby_res.data:
-            df_lobbies = pd.DataFrame(lobby_res.data)
-            match_avg_acs = df_lobbies.groupby('match_id')['acs'].mean().to_dict()
-            match_avg_adr = df_lobbies.groupby('match_id')['adr'].mean().to_dict()
+    elif primary_role == 'Initiator':
+        if avg_kast >= 70:
+            insights.append(f"Elite consistency. A KAST% of {round(avg_kast, 1)}% means you are trading efficiently and using utility to guarantee round impact.")
         else:
-            match_avg_acs, match_avg_adr = {}, {}
-
-        # Re-apply the Feature Engineering layer so the inputs match the Brain perfectly
-        df_player['lobby_relative_acs'] = df_player.apply(lambda row: row['acs'] - match_avg_acs.get(row['match_id'], row['acs']), axis=1)
-        df_player['lobby_relative_adr'] = df_player.apply(lambda row: row['adr'] - match_avg_adr.get(row['match_id'], row['adr']), axis=1)
-        
-        df_player['duelist_entry_score'] = np.where(df_player['role'] == 'Duelist', (df_player['fb'] * 2) - df_player['fd'] + df_player['lobby_relative_adr'], 0)
-        df_player['initiator_setup_score'] = np.where(df_player['role'] == 'Initiator', (df_player['kast'] * 1.5) - (df_player['hs_percent'] * 0.1), 0)
-        df_player['controller_anchor_score'] = np.where(df_player['role'] == 'Controller', df_player['kast'] / (df_player['fd'] + 1), 0)
-        df_player['sentinel_defense_score'] = np.where(df_player['role'] == 'Sentinel', df_player['kda'] * (df_player['kast'] / 100), 0)
-
-        # Calculate Averages (Now includes tactical features)
-        avg_kills = df_player['kills'].mean()
-        avg_deaths = df_player['deaths'].mean()
-        avg_acs = df_player['acs'].mean()
-        win_rate = df_player['win'].mean()
-        current_rank = df_player.iloc[-1]['rank']
-
-        avg_kast = df_player['kast'].mean()
-        avg_adr = df_player['adr'].mean()
-        avg_hs = df_player['hs_percent'].mean()
-        avg_fb = df_player['fb'].mean()
-        avg_fd = df_player['fd'].mean()
+            insights.append(f"Your KAST% ({round(avg_kast, 1)}%) is too low for an Initiator. The AI is penalizing you for dying without trades or assists.")
         
-        avg_rel_acs = df_player['lobby_relative_acs'].mean()
-        avg_rel_adr = df_player['lobby_relative_adr'].mean()
-        avg_duelist = df_player['duelist_entry_score'].mean()
-        avg_initiator = df_player['initiator_setup_score'].mean()
-        avg_controller = df_player['controller_anchor_score'].mean()
-        avg_sentinel = df_player['sentinel_defense_score'].mean()
-
-        # Determine primary role
-        primary_role = df_player['role'].mode()[0]
-        ROLE_MAP = {'Duelist': 0, 'Initiator': 1, 'Controller': 2, 'Sentinel': 3, 'Flex': 4}
-        role_encoded = ROLE_MAP.get(primary_role, 4)
-
-        # AI Prediction (Matches the 15 features used in training exactly)
-        features = [[
-            avg_kills, avg_deaths, avg_acs, avg_kast, avg_adr, avg_hs, avg_fb, avg_fd,
-            avg_rel_acs, avg_rel_adr,
-            avg_duelist, avg_initiator, avg_controller, avg_sentinel,
-            role_encoded
-        ]]
-        
-        skill_ceiling = spider_brain.predict(features)[0]
+        if avg_hs < 20:
+            insights.append("The AI noticed your HS% is low, but as an Initiator, it did not penalize you heavily for this as long as your KAST remains high.")
 
-        # Dynamic Lobby Resistance Math
-        sim_win_rate = win_rate
-        sim_rr = 0
-        trajectory_data = [0]
+    elif primary_role == 'Controller':
+        if avg_fd >= 2.0:
+            insights.append(f"Major weakness detected: You average {round(avg_fd, 1)} First Deaths per match. As a Controller, dying first is heavily penalized by the AI because your team loses their smokes.")
+        else:
+            insights.append("Great survival discipline. You rarely die first, ensuring your team always has the map control utility needed for executions.")
+
+    elif primary_role == 'Sentinel':
+        if avg_deaths > 16:
+            insights.append(f"You average {round(avg_deaths, 1)} deaths per game. The AI expects Sentinels to anchor and survive longer; this high death rate is dragging down your ceiling.")
+        if avg_kast >= 70:
+            insights.append("Strong defensive anchoring. Your high KAST% indicates you are successfully stalling pushes and getting value even when the enemy avoids your site.")
+    return insights
+
+def build_prediction(player, skill_ceiling, brain_meta):
+    """The games-independent part of an /api/predict response."""
+    avg = player['X'].iloc[0]
+    return {
+        "model_version": brain_meta['version'],
+        "current_rank": player['current_rank'],
+        "skill_ceiling": str(skill_ceiling),
+        "win_rate": float(player['win_rate']),
+        "primary_role": player['primary_role'],
+        "insights": generate_insights(avg, player['primary_role']),
+        "stats": {
+            "kills": round(avg['kills'], 1), "deaths": round(avg['deaths'], 1), "acs": int(avg['acs']),
+            "kast": round(avg['kast'], 1), "adr": int(avg['adr']),
+            "hs": int(avg['hs_percent']), "fb": round(avg['fb'], 1), "fd": round(avg['fd'], 1)
+        }
+    }
+
+def simulate_climb(prediction, games):
+    """Dynamic Lobby Resistance Math: the RR trajectory over the next `games` games."""
+    win_rate = prediction['win_rate']
+    sim_win_rate = win_rate
+    sim_rr = 0
+    trajectory_data = [0]
+
+    for game in range(1, games + 1):
+        expected_win_value = sim_win_rate * 20
+        expected_loss_value = (1 - sim_win_rate) * -17
+        rr_gained = expected_win_value + expected_loss_value
+        sim_rr += rr_gained
+        trajectory_data.append(int(sim_rr))
+
+        rank_delta = sim_rr / 50.0
+        sim_win_rate = win_rate - (rank_delta * 0.015)
+        sim_win_rate = max(0.35, min(0.65, sim_win_rate))
+
+    net_rr = int(sim_rr)
 
-        for game in range(1, games + 1):
-            expected_win_value = sim_win_rate * 20
-            expected_loss_value = (1 - sim_win_rate) * -17
-            rr_gained = expected_win_value + expected_loss_value
-            sim_rr += rr_gained
-            trajectory_data.append(int(sim_rr))
+    try:
+        current_idx = features.RANK_LADDER.index(prediction['current_rank'])
+        ranks_gained = net_rr // 100
+        final_idx = max(0, min(len(features.RANK_LADDER) - 1, current_idx + ranks_gained))
+        projected_rank = features.RANK_LADDER[final_idx]
+    except ValueError:
+        projected_rank = prediction['skill_ceiling']
 
-            rank_delta = sim_rr / 50.0
-            sim_win_rate = win_rate - (rank_delta * 0.015)
-            sim_win_rate = max(0.35, min(0.65, sim_win_rate))
+    return trajectory_data, net_rr, projected_rank
 
-        net_rr = int(sim_rr)
+@app.route('/api/predict/<player_name>/<int:games>')
+def api_predict(player_name, games):
+    refresh_brain_if_stale()
+    current_brain = active_brain
+    if not current_brain:
+        return jsonify({"error": "Brain is offline. Run /api/admin/retrain to wake it up."}), 500
+    spider_brain, brain_meta = current_brain['model'], current_brain
 
-        RANK_LADDER = [
-            "Iron 1", "Iron 2", "Iron 3", "Bronze 1", "Bronze 2", "Bronze 3",
-            "Silver 1", "Silver 2", "Silver 3", "Gold 1", "Gold 2", "Gold 3",
-            "Platinum 1", "Platinum 2", "Platinum 3", "Diamond 1", "Diamond 2", "Diamond 3",
-            "Ascendant 1", "Ascendant 2", "Ascendant 3", "Immortal 1", "Immortal 2", "Immortal 3", "Radiant"
-        ]
+    try:
+        stored = feature_store.fetch_player(supabase, player_name)
+        cache_key = (feature_store.player_key(player_name), brain_meta['version'], stored['updated_at'] if stored else None)
+        prediction = prediction_cache.get(cache_key)
 
-        try:
-            current_idx = RANK_LADDER.index(current_rank)
-            ranks_gained = net_rr // 100
-            final_idx = max(0, min(len(RANK_LADDER) - 1, current_idx + ranks_gained))
-            projected_rank = RANK_LADDER[final_idx]
-        except ValueError:
-            projected_rank = skill_ceiling
-
-        # --- THE INSIGHTS ENGINE (AI Explains "Why") ---
-        insights = []
-        
-        # Macro Lobby Insight
-        if avg_rel_acs > 25:
-            insights.append(f"Smurf Alert: You are heavily out-fragging the average player in your current lobbies with a relative ACS of +{int(avg_rel_acs)}. The AI expects a rapid climb.")
-        elif avg_rel_acs < -15:
-            insights.append(f"Statistically, you are underperforming your current rank lobby average by {abs(int(avg_rel_acs))} ACS. Unless you focus heavily on utility and KAST, climbing will be difficult.")
-        else:
-            insights.append("You are blending into your current lobbies statistically, meaning your rank movement will rely entirely on your ability to secure round wins.")
-
-        # Role-Specific Insights
-        if primary_role == 'Duelist':
-            if avg_fb >= 2.0:
-                insights.append(f"Excellent entry value. You average {round(avg_fb, 1)} First Bloods per match, successfully creating space for your team.")
-            elif avg_fb < 1.0:
-                insights.append(f"Red Flag: As a Duelist, your First Blood rate ({round(avg_fb, 1)}) is critically low. The AI penalizes you for not taking enough opening engagements.")
-                
-            if avg_duelist > 0:
-                insights.append("Your calculated Duelist Entry Score is positive, meaning the risks you take usually result in a net advantage for your team.")
-
-        elif primary_role == 'Initiator':
-            if avg_kast >= 70:
-                insights.append(f"Elite consistency. A KAST% of {round(avg_kast, 1)}% means you are trading efficiently and using utility to guarantee round impact.")
-            else:
-                insights.append(f"Your KAST% ({round(avg_kast, 1)}%) is too low for an Initiator. The AI is penalizing you for dying without trades or assists.")
-            
-            if avg_hs < 20:
-                insights.append("The AI noticed your HS% is low, but as an Initiator, it did not penalize you heavily for this as long as your KAST remains high.")
+        if prediction is None:
+            player = load_player_features(player_name, brain_meta['role_map'], stored)
+            if not player:
+                return jsonify({"error": "Player not found in global database"}), 404
 
-        elif primary_role == 'Controller':
-            if avg_fd >= 2.0:
-                insights.append(f"Major weakness detected: You average {round(avg_fd, 1)} First Deaths per match. As a Controller, dying first is heavily penalized by the AI because your team loses their smokes.")
-            else:
-                insights.append("Great survival discipline. You rarely die first, ensuring your team always has the map control utility needed for executions.")
+            # AI Prediction (Matches the 15 features used in training exactly)
+            with PREDICT_SECONDS.time(kind="single"):
+                skill_ceiling = spider_brain.predict(player['X'][brain_meta['features']])[0]
+            prediction = build_prediction(player, skill_ceiling, brain_meta)
+            prediction_cache.set(cache_key, prediction)
 
-        elif primary_role == 'Sentinel':
-            if avg_deaths > 16:
-                insights.append(f"You average {round(avg_deaths, 1)} deaths per game. The AI expects Sentinels to anchor and survive longer; this high death rate is dragging down your ceiling.")
-            if avg_kast >= 70:
-                insights.append("Strong defensive anchoring. Your high KAST% indicates you are successfully stalling pushes and getting value even when the enemy avoids your site.")
+        trajectory_data, net_rr, projected_rank = simulate_climb(prediction, games)
 
         return jsonify({
-            "current_rank": current_rank,
-            "skill_ceiling": skill_ceiling,
-            "win_rate": round(win_rate * 100, 1),
+            "model_version": prediction['model_version'],
+            "current_rank": prediction['current_rank'],
+            "skill_ceiling": prediction['skill_ceiling'],
+            "win_rate": round(prediction['win_rate'] * 100, 1),
             "net_rr": net_rr,
             "projected_rank": projected_rank,
-            "primary_role": primary_role,
+            "primary_role": prediction['primary_role'],
             "trajectory": trajectory_data,
-            "insights": insights,
-            "stats": {
-                "kills": round(avg_kills, 1), "deaths": round(avg_deaths, 1), "acs": int(avg_acs),
-                "kast": round(avg_kast, 1), "adr": int(avg_adr),
-                "hs": int(avg_hs), "fb": round(avg_fb, 1), "fd": round(avg_fd, 1)
-            }
+            "insights": prediction['insights'],
+            "stats": prediction['stats']
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Same range as the simulator's games input; the roster pages send a division instead of names
+BATCH_MAX_GAMES = 500
+BATCH_MAX_PLAYERS = 50
+
+@app.route('/api/predict/batch', methods=['GET', 'POST'])
+def api_predict_batch():
+    """Scores many players in one pass: POST {"players": [...], "games": 50} or GET ?division=main|academy|all."""
+    refresh_brain_if_stale()
+    current_brain = active_brain
+    if not current_brain:
+        return jsonify({"error": "Brain is offline. Run /api/admin/retrain to wake it up."}), 500
+    spider_brain, brain_meta = current_brain['model'], current_brain
+
+    body = request.get_json(silent=True) or {}
+    if not isinstance(body, dict): return jsonify({"error": "Body must be a JSON object"}), 400
+    games = body.get('games', request.args.get('games', 50))
+    if isinstance(games, str) and games.strip().isdigit(): games = int(games)
+    if not isinstance(games, int) or isinstance(games, bool) or not 1 <= games <= BATCH_MAX_GAMES:
+        return jsonify({"error": f"games must be an integer from 1 to {BATCH_MAX_GAMES}"}), 400
+    names = body.get('players')
+    if names is not None and (not isinstance(names, list) or not all(isinstance(n, str) and n.strip() for n in names)):
+        return jsonify({"error": "players must be a list of player names"}), 400
+    if names and len(names) > BATCH_MAX_PLAYERS: return jsonify({"error": f"At most {BATCH_MAX_PLAYERS} players per request"}), 400
+    if not names:
+        division = body.get('division', request.args.get('division', 'all'))
+        if not isinstance(division, str) or (division != 'all' and division not in ROSTERS): return jsonify({"error": "Invalid team"}), 400
+        divisions = ROSTERS.values() if division == 'all' else [ROSTERS[division]]
+        names = [p['name'] for roster in divisions for p in roster]
+    names = list(dict.fromkeys(names))
+    timings = {}
+
+    try:
+        start = time.time()
+        stored = feature_store.fetch_players(supabase, names)
+        players = {}
+        for key, row in stored.items():
+            players[key] = load_player_features(row['player_name'], brain_meta['role_map'], row)
+
+        # Players the feature store has not seen yet: their rows, then their lobbies, paged past the 1000-row cap
+        missing = [n for n in names if feature_store.player_key(n) not in stored]
+        if missing:
+            player_filter = ",".join(f'player_name.ilike."{n}"' for n in missing)
+            rows = [r for page in feature_store.keyset_pages(lambda: supabase.table('ml_spider_matches').select('*').or_(player_filter)) for r in page]
+            if rows:
+                df_rows = features.frame_from_rows(rows)
+                keys = df_rows['player_name'].str.lower()
+                lobby_res = feature_store.fetch_in_chunks(supabase, 'ml_spider_matches', 'match_id, acs, adr', 'match_id', df_rows['match_id'].unique(),
+                                                          ranked_only=True, chunk_size=feature_store.MATCH_CHUNK_SIZE)
+                lobbies = features.lobby_aggregates(features.frame_from_rows(lobby_res) if lobby_res else df_rows.iloc[:0])
+                matrix = features.player_feature_matrix(df_rows, lobbies, keys, brain_meta['role_map'])
+                for key, group in df_rows.groupby(keys):
+                    players[key] = {
+                        "X": matrix.loc[[key]],
+                        "win_rate": group['win'].mean(),
+                        "current_rank": group.iloc[-1]['rank'],
+                        "primary_role": features.primary_role(group),
+                    }
+        timings['fetch_features_ms'] = round((time.time() - start) * 1000, 1)
+
+        results = {}
+        if players:
+            # One forest evaluation for the whole roster
+            start = time.time()
+            keys = list(players)
+            X = pd.concat([players[k]['X'] for k in keys])[brain_meta['features']]
+            with PREDICT_SECONDS.time(kind="batch"):
+                proba = spider_brain.predict_proba(X)
+            ceilings = spider_brain.classes_[proba.argmax(axis=1)]
+            timings['predict_ms'] = round((time.time() - start) * 1000, 1)
+
+            start = time.time()
+            for i, key in enumerate(keys):
+                prediction = build_prediction(players[key], ceilings[i], brain_meta)
+                prediction_cache.set((key, brain_meta['version'], stored[key]['updated_at'] if key in stored else None), prediction)
+                trajectory_data, net_rr, projected_rank = simulate_climb(prediction, games)
+                results[key] = dict(prediction, win_rate=round(prediction['win_rate'] * 100, 1), confidence=round(float(proba[i].max()), 3),
+                                    net_rr=net_rr, projected_rank=projected_rank, trajectory=trajectory_data)
+            timings['simulate_ms'] = round((time.time() - start) * 1000, 1)
+
+        timings['total_ms'] = round(sum(timings.values()), 1)
+        return jsonify({
+            "model_version": brain_meta['version'],
+            "players": {name: results.get(feature_store.player_key(name), {"error": "Player not found in global database"}) for name in names},
+            "timings": timings
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/admin/retrain')
 def force_retrain():
-    wake_up_the_brain()
-    return jsonify({"status": "Brain updated with latest Tactical Tier Framework!"})
+    # Training runs in its own process; poll /api/admin/retrain/<job_id> for progress
+    job = brain.start_retrain_job()
+    return jsonify({"status": "Retrain started. The Brain will hot-swap once the new model validates.", "job": job}), 202
+
+@app.route('/api/admin/retrain/<job_id>')
+def retrain_status(job_id):
+    job = brain.read_job_status(job_id)
+    if not job: return jsonify({"error": "Unknown retrain job"}), 404
+    refresh_brain_if_stale()
+    current_brain = active_brain
+    return jsonify({"job": job, "active_version": current_brain['version'] if current_brain else None})
 
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
@@ -0,0 +1,329 @@
+"""Offline performance benchmarks: `python benchmark.py`.
+
+Runs with no network and no Supabase. ml_spider_matches is generated
+synthetically into supabase_stub.LocalSupabase, the Henrik API is
+spider_stub.StubHenrik (replaying recorded responses from --fixtures when
+present) and the Flask app runs in-process against both. Reports:
+
+    train    load + fit seconds and peak RSS per table size, each in a fresh process
+    predict  FlatForest single-row latency and /api/predict cold/warm percentiles
+    spider   parse_match records per second, and the fetch + parse loop against the stub
+    analyze  profile aggregation rows per second
+    routes   per-route Flask latency percentiles
+
+Every number is compared with the stored baseline (benchmark_baseline.json);
+metrics ending in _per_s are better when higher, everything else when lower.
+
+    python benchmark.py                             # 10k and 100k rows
+    python benchmark.py --rows 10000,100000,1000000
+    python benchmark.py --save-baseline             # after a change you accept
+    python benchmark.py --record fixtures/          # record real Henrik responses (needs HENRIK_KEY)
+    python benchmark.py --fixtures fixtures/        # replay them
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import tempfile
+import multiprocessing
+from datetime import datetime, timezone
+import numpy as np
+from features import AGENT_ROLES, RANK_LADDER
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+AGENTS = {agent: AGENT_ROLES[agent] for agent in ('Jett', 'Raze', 'Omen', 'Viper', 'Sova', 'Fade', 'Killjoy', 'Cypher')}
+MAPS = ['Bind', 'Haven', 'Lotus', 'Sunset', 'Ascent']
+
+# --- SYNTHETIC DATA ---
+def synthetic_spider_rows(n, seed=0, chunk=20000):
+    """Yields lists of ml_spider_matches rows, 10 per match, with stats that rise with rank."""
+    rng = np.random.default_rng(seed)
+    players = max(50, n // 20)
+    player_tier = rng.integers(0, len(RANK_LADDER), players)
+    agents = list(AGENTS)
+    for start in range(0, n, chunk):
+        size = min(chunk, n - start)
+        index = np.arange(start, start + size)
+        who = rng.integers(0, players, size)
+        tier = player_tier[who]
+        skill = tier / (len(RANK_LADDER) - 1)
+        kills = np.clip(rng.normal(10 + 10 * skill, 4), 0, 45).astype(int)
+        deaths = np.clip(rng.normal(17 - 4 * skill, 4), 1, 35).astype(int)
+        assists = np.clip(rng.normal(5, 3, size), 0, 20).astype(int)
+        acs = np.clip(rng.normal(150 + 120 * skill, 45), 20, 500).round(2)
+        adr = np.clip(acs * 0.65 + rng.normal(0, 12, size), 10, 330).astype(int)
+        kast = np.clip(rng.normal(62 + 15 * skill, 9), 10, 100).round(1)
+        hs = np.clip(rng.normal(16 + 14 * skill, 6), 0, 70).astype(int)
+        fb, fd = rng.poisson(1 + 2 * skill), rng.poisson(2.5 - skill)
+        agent = rng.integers(0, len(agents), size)
+        unranked = rng.random(size) < 0.05
+        rows = []
+        for i in range(size):
+            match_id = f"bench-{index[i] // 10:07d}"
+            rows.append({
+                "db_id": f"{match_id}_{index[i] % 10}", "match_id": match_id, "player_name": f"player{who[i]}",
+                "agent": agents[agent[i]], "role": AGENTS[agents[agent[i]]],
+                "rank": "Unknown" if unranked[i] else RANK_LADDER[tier[i]], "map_name": MAPS[(index[i] // 10) % len(MAPS)],
+                "win": int((index[i] % 10 < 5) == ((index[i] // 10) % 2 == 0)), "kills": int(kills[i]), "deaths": int(deaths[i]),
+                "kda": round((kills[i] + assists[i]) / max(1, deaths[i]), 2), "acs": float(acs[i]), "kast": float(kast[i]),
+                "adr": int(adr[i]), "hs_percent": int(hs[i]), "fb": int(fb[i]), "fd": int(fd[i]),
+            })
+        yield rows
+
+def local_database(rows, seed=0):
+    from supabase_stub import LocalSupabase
+    sb = LocalSupabase()
+    for chunk in synthetic_spider_rows(rows, seed):
+        sb.table('ml_spider_matches').insert(chunk).execute()
+    sb.create_index('ml_spider_matches', 'match_id')
+    sb.create_index('ml_spider_matches', 'player_name')
+    return sb
+
+def percentiles(samples_ms):
+    p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3)}
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return percentiles(samples)
+
+# --- TRAINING ---
+def train_once(rows, model_dir=None):
+    """Runs in its own process so peak RSS belongs to this table size alone."""
+    import brain
+    start = time.perf_counter()
+    sb = local_database(rows)
+    generated = time.perf_counter()
+    probe, artifact = brain.train_brain(sb)
+    trained = time.perf_counter()
+    if model_dir:
+        brain.publish_artifact(artifact, probe, model_dir)
+    return {
+        "generate_seconds": round(generated - start, 2),
+        "train_seconds": round(trained - generated, 2),
+        "fit_seconds": artifact["train_seconds"],
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+def bench_train(sizes, model_dir):
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for i, rows in enumerate(sizes):
+        print(f"[BENCH] Training on {rows} synthetic rows...")
+        with context.Pool(1) as pool:
+            # The smallest table's Brain is the one the app serves during the other benchmarks
+            results[str(rows)] = pool.apply(train_once, (rows, model_dir if i == 0 else None))
+        print(f"   ✅ {results[str(rows)]}")
+    return results
+
+# --- SPIDER / ANALYZE ---
+def bench_spider(anchors, repeat):
+    import cloud_spider
+    from spider_stub import build_world
+    cloud_spider.throughput.every = 0
+    world = build_world(anchors)
+    matches = list({m['metadata']['matchid']: m for ms in world.values() for m in ms}.values())
+    start = time.perf_counter()
+    records = sum(len(cloud_spider.parse_match(m)) for m in matches)
+    parse_seconds = time.perf_counter() - start
+
+    # The crawl's inner loop against the stub: concurrent fetch, then parse
+    players = list({f"{p['name']}#{p['tag']}": {"name": p['name'], "tag": p['tag']}
+                    for m in matches for p in m['players']['all_players']}.values())[:repeat]
+    start = time.perf_counter()
+    fetched = parsed = 0
+    for player, page in cloud_spider.fetch_all(players):
+        fetched += 1
+        parsed += sum(len(cloud_spider.parse_match(m)) for m in page or [])
+    loop_seconds = time.perf_counter() - start
+    return {
+        "parse_records_per_s": round(records / parse_seconds, 1),
+        "crawl_records_per_s": round(parsed / loop_seconds, 1),
+        "crawl_calls_per_s": round(fetched / loop_seconds, 1),
+    }
+
+def bench_analyze(rows=100000, seed=0):
+    import profile_store
+    rng = np.random.default_rng(seed)
+    agents, maps = list(AGENT_ROLES), MAPS
+    data = [{"agent": agents[a], "map_name": maps[m], "team_won": bool(w), "kills": int(k), "deaths": int(d)}
+            for a, m, w, k, d in zip(rng.integers(0, len(agents), rows), rng.integers(0, len(maps), rows),
+                                     rng.integers(0, 2, rows), rng.integers(0, 30, rows), rng.integers(0, 25, rows))]
+    start = time.perf_counter()
+    profile_store.analyze(data)
+    return {"rows_per_s": round(rows / (time.perf_counter() - start), 1)}
+
+# --- APP ---
+def bench_app(rows, repeat):
+    """Predict and per-route latency through Flask's test client, against the local DB and stub."""
+    os.environ["CACHE_BACKEND"] = "memory"
+    import app
+    import feature_store
+    sb = local_database(rows)
+    feature_store.rebuild_feature_store(sb)
+    app.supabase = sb
+    app.publish_news_feed(app.build_news_feed())
+    for team_id in app.ROSTERS:
+        app.update_roster_ranks(team_id)
+    client = app.app.test_client()
+    names = [f"player{i}" for i in range(20)]
+    roster_player = app.ROSTERS['main'][0]
+
+    def get(path):
+        response = client.get(path)
+        assert response.status_code in (200, 304), f"{path}: {response.status_code}"
+
+    def predict_cold():
+        app.prediction_cache.clear()
+        get(f"/api/predict/{names[0]}/50")
+
+    def player_cold():
+        app.player_details.clear()
+        get(f"/api/player/{roster_player['name']}/{roster_player['tag']}")
+
+    brain_model = app.active_brain['model']
+    X = app.load_player_features(names[0], app.active_brain['role_map'], feature_store.fetch_player(sb, names[0]))["X"][app.active_brain['features']]
+    predict = {
+        "forest_single_row": timed(lambda: brain_model.predict(X), repeat),
+        "api_predict_cold": timed(predict_cold, repeat),
+        "api_predict_warm": timed(lambda: get(f"/api/predict/{names[0]}/50"), repeat),
+    }
+    routes = {
+        "GET /api/team-history/main": timed(lambda: get("/api/team-history/main"), repeat),
+        "GET /api/news": timed(lambda: get("/api/news"), repeat),
+        "GET /api/player (cold)": timed(player_cold, repeat),
+        "GET /api/player (cached)": timed(lambda: get(f"/api/player/{roster_player['name']}/{roster_player['tag']}"), repeat),
+        "POST /api/predict/batch": timed(lambda: client.post("/api/predict/batch", json={"players": names, "games": 50}), repeat),
+    }
+    return predict, routes
+
+# --- BASELINE ---
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+def compare(results, baseline, tolerance):
+    """Prints current vs baseline for every shared metric; returns the regressed ones."""
+    current, before = flatten(results), flatten(baseline)
+    regressions = []
+    print(f"\n{'metric':<58} {'baseline':>12} {'current':>12} {'change':>8}")
+    for key in sorted(current.keys() & before.keys()):
+        old, new = before[key], current[key]
+        if not old:
+            continue
+        change = (new - old) / old
+        worse = -change if key.endswith("_per_s") else change
+        flag = " ❌" if worse > tolerance else " ✅" if worse < -tolerance else ""
+        if worse > tolerance:
+            regressions.append(key)
+        print(f"{key:<58} {old:>12g} {new:>12g} {change:>+7.1%}{flag}")
+    return regressions
+
+def record_fixtures(directory, players):
+    """Saves real Henrik responses for `players` (name, tag) in the form StubHenrik replays."""
+    import henrik
+    from spider_stub import fixture_name
+    client = henrik.HenrikClient(os.environ.get("HENRIK_KEY"), rate_per_minute=float(os.environ.get("HENRIK_RATE_LIMIT", 30)))
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for name, tag in players:
+        base = f"{urllib_quote(name)}/{urllib_quote(tag)}"
+        paths += [f"/valorant/v3/matches/eu/{base}?mode=competitive&size=10", f"/valorant/v2/mmr/eu/{base}",
+                  f"/valorant/v1/mmr-history/eu/{base}"] + [f"/valorant/v1/lifetime/matches/eu/{base}?size=40&page={page}" for page in (1, 2, 3)]
+    saved = 0
+    for path in paths:
+        data = client.get_json(henrik.HENRIK_API_URL + path)
+        if data is None:
+            print(f"   ⚠️ Nothing recorded for {path}")
+            continue
+        with open(os.path.join(directory, fixture_name(path)), "w") as f:
+            json.dump(data, f)
+        saved += 1
+        if path.startswith("/valorant/v3/matches/"):
+            # The matches themselves, as /api/admin/ingest_match fetches them
+            for match in data.get('data', [])[:3]:
+                match_path = f"/valorant/v2/match/{match['metadata']['matchid']}"
+                match_data = client.get_json(henrik.HENRIK_API_URL + match_path)
+                if match_data:
+                    with open(os.path.join(directory, fixture_name(match_path)), "w") as f:
+                        json.dump(match_data, f)
+                    saved += 1
+    print(f"✅ Recorded {saved} Henrik responses into {directory}.")
+
+def urllib_quote(value):
+    import urllib.parse
+    return urllib.parse.quote(value)
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for training, prediction, the spider and the web routes.")
+    parser.add_argument("--rows", default="10000,100000", help="comma-separated synthetic ml_spider_matches sizes to train on")
+    parser.add_argument("--repeat", type=int, default=50, help="samples per latency measurement")
+    parser.add_argument("--fixtures", help="directory of recorded Henrik responses to replay")
+    parser.add_argument("--record", metavar="DIR", help="record real Henrik responses for the roster into DIR and exit")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="relative change that counts as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+    sizes = [int(n) for n in args.rows.split(",")]
+
+    # Nothing below may reach the network: every Henrik URL points at the stub
+    os.environ.pop("SUPABASE_URL", None)
+    os.environ["HENRIK_RATE_LIMIT"] = "1000000"
+    os.environ["SPIDER_STATE_DIR"] = tempfile.mkdtemp(prefix="bench-spider-")
+    model_dir = tempfile.mkdtemp(prefix="bench-brain-")
+    os.environ["BRAIN_DIR"] = model_dir
+
+    import henrik
+    import cloud_spider
+    anchors = cloud_spider.team_roster + cloud_spider.high_elo_seeds
+    if args.record:
+        record_fixtures(args.record, [(p['name'], p['tag']) for p in cloud_spider.team_roster])
+        return
+
+    from spider_stub import StubHenrik
+    stub = StubHenrik(anchors, fixtures=args.fixtures)
+    henrik.HENRIK_API_URL = cloud_spider.HENRIK_API_URL = os.environ["HENRIK_API_URL"] = stub.url
+    results = {}
+    try:
+        results["train"] = bench_train(sizes, model_dir)
+        print("[BENCH] Spider parsing and crawl loop...")
+        results["spider"] = bench_spider(anchors, args.repeat * 4)
+        results["analyze"] = bench_analyze()
+        print("[BENCH] App routes...")
+        results["predict"], results["routes"] = bench_app(sizes[0], args.repeat)
+    finally:
+        stub.close()
+
+    meta = {"recorded_at": datetime.now(timezone.utc).isoformat(), "python": platform.python_version(),
+            "machine": platform.platform(), "cpus": os.cpu_count(), "rows": sizes, "fixtures": bool(args.fixtures)}
+    regressions = []
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nBaseline from {baseline['meta']['recorded_at']} on {baseline['meta']['machine']} ({baseline['meta']['cpus']} CPUs)")
+        regressions = compare(results, baseline["results"], args.tolerance)
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}." if regressions else "\n✅ No regressions.")
+    else:
+        print(json.dumps(results, indent=2))
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+        print(f"✅ Baseline saved to {args.baseline}.")
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
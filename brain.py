@@ -0,0 +1,382 @@
+import os
+import sys
+import json
+import time
+import glob
+import uuid
+import argparse
+import subprocess
+import joblib
+import sklearn
+from datetime import datetime, timezone
+from sklearn.ensemble import RandomForestClassifier
+import pandas as pd
+import numpy as np
+from features import FEATURES, ROLE_MAP, STAT_DTYPES, build_feature_matrix, lobby_aggregates
+
+# Where trained Spider Brains are stored. Each training run writes a new versioned
+# file so the web app can load the newest one instead of training at import time.
+MODEL_DIR = os.environ.get("BRAIN_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models"))
+ARTIFACT_PREFIX = "spider_brain_"
+# The published Brain is whatever LATEST points at. It is only rewritten (atomically)
+# after a new artifact validates, so every gunicorn worker can follow it safely.
+LATEST_POINTER = "LATEST"
+
+# Background retrain jobs keep their status on disk so any worker can answer a poll
+JOBS_DIR = os.path.join(MODEL_DIR, "jobs")
+RETRAIN_LOCK = os.path.join(MODEL_DIR, "retrain.lock")
+STALE_LOCK_SECONDS = 2 * 3600
+
+# --- TRAINING SET LOADER ---
+# PostgREST caps every response at 1000 rows, so we page through the table with
+# keyset pagination on db_id and only ask for the columns the Brain trains on.
+SPIDER_PAGE_SIZE = 1000
+SPIDER_LABEL_COLUMNS = ['match_id', 'rank', 'role']
+
+def load_spider_training_set(supabase, page_size=SPIDER_PAGE_SIZE):
+    """Streams ml_spider_matches page by page into compact columnar arrays.
+
+    Stats are downcast to int16/float32 and match_id/rank/role are dictionary
+    encoded, so each page is folded into small arrays and then thrown away.
+    The last db_id read is kept in df.attrs['last_db_id'] as the data watermark.
+    """
+    columns = ['db_id'] + SPIDER_LABEL_COLUMNS + list(STAT_DTYPES)
+    stat_chunks = {col: [] for col in STAT_DTYPES}
+    code_chunks = {col: [] for col in SPIDER_LABEL_COLUMNS}
+    vocab = {col: {} for col in SPIDER_LABEL_COLUMNS}
+
+    last_db_id = None
+    pages = 0
+    start = time.time()
+    while True:
+        query = supabase.table('ml_spider_matches').select(','.join(columns)).neq('rank', 'Unknown')
+        if last_db_id is not None:
+            query = query.gt('db_id', last_db_id)
+        rows = query.order('db_id').limit(page_size).execute().data
+        if not rows:
+            break
+
+        for col, dtype in STAT_DTYPES.items():
+            stat_chunks[col].append(np.array([r.get(col) or 0 for r in rows], dtype=dtype))
+        for col in SPIDER_LABEL_COLUMNS:
+            codes = vocab[col]
+            code_chunks[col].append(np.array([codes.setdefault(r.get(col) or 'Unknown', len(codes)) for r in rows], dtype=np.int32))
+
+        pages += 1
+        last_db_id = rows[-1]['db_id']
+        if len(rows) < page_size:
+            break
+
+    if not pages:
+        return pd.DataFrame(columns=SPIDER_LABEL_COLUMNS + list(STAT_DTYPES))
+
+    df = pd.DataFrame({
+        col: pd.Categorical.from_codes(np.concatenate(code_chunks[col]), categories=list(vocab[col]))
+        for col in SPIDER_LABEL_COLUMNS
+    })
+    for col in STAT_DTYPES:
+        df[col] = np.concatenate(stat_chunks[col])
+    df.attrs['last_db_id'] = last_db_id
+
+    mem_mb = df.memory_usage(deep=True).sum() / 1e6
+    print(f"[SYSTEM] Loaded {len(df)} spider rows in {pages} pages ({time.time() - start:.1f}s, {mem_mb:.1f} MB).")
+    return df
+
+# --- SHAREABLE FOREST ---
+class FlatForest:
+    """A fitted RandomForestClassifier flattened into plain NumPy arrays.
+
+    sklearn copies every tree into private heap memory when it is unpickled, so
+    each gunicorn worker would hold its own copy of the forest. These arrays can
+    be loaded with joblib's mmap_mode='r' instead, letting all workers share one
+    read-only copy through the page cache. Predictions match the sklearn model.
+    """
+
+    def __init__(self, model):
+        trees = [est.tree_ for est in model.estimators_]
+        offsets = np.cumsum([0] + [t.node_count for t in trees[:-1]])
+
+        left, right, values = [], [], []
+        for tree, offset in zip(trees, offsets):
+            node_ids = np.arange(tree.node_count) + offset
+            is_leaf = tree.children_left == -1
+            # Leaves point at themselves so every sample can walk a fixed number of steps
+            left.append(np.where(is_leaf, node_ids, tree.children_left + offset))
+            right.append(np.where(is_leaf, node_ids, tree.children_right + offset))
+            proba = tree.value[:, 0, :]
+            normalizer = proba.sum(axis=1)[:, None]
+            normalizer[normalizer == 0.0] = 1.0
+            values.append(proba / normalizer)
+
+        self.roots = offsets.astype(np.int32)
+        self.children_left = np.concatenate(left).astype(np.int32)
+        self.children_right = np.concatenate(right).astype(np.int32)
+        self.feature = np.concatenate([np.maximum(t.feature, 0) for t in trees]).astype(np.int32)
+        self.threshold = np.concatenate([t.threshold for t in trees])
+        self.value = np.concatenate(values)
+        self.max_depth = max(t.max_depth for t in trees)
+        self.classes_ = model.classes_
+        self.feature_names_in_ = model.feature_names_in_
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.roots, self.children_left, self.children_right, self.feature, self.threshold, self.value))
+
+    def predict_proba(self, X):
+        # Same float32 inputs and tree-by-tree summation as RandomForestClassifier.predict_proba
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.children_left[nodes], self.children_right[nodes])
+        return self.value[nodes].sum(axis=1) / len(self.roots)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+def train_brain(supabase):
+    """Downloads the spider dataset and fits a fresh Spider Brain.
+
+    Returns (probe, artifact), where probe is (rows, sklearn predictions) for
+    publish_artifact to check against, or (None, None) if there is no data yet.
+    """
+    df = load_spider_training_set(supabase)
+    if df.empty:
+        print("❌ No spider data found yet. The Brain is sleeping.")
+        return None, None
+
+    X = build_feature_matrix(df, lobby_aggregates(df))
+    y = df['rank']
+
+    # Train the AI with fine-tuned hyperparameters
+    print(f"[SYSTEM] Training AI on {len(df)} global matches with Tactical Tier Framework...")
+    start = time.time()
+    model = RandomForestClassifier(
+        n_estimators=250,
+        max_depth=14,
+        min_samples_split=4,
+        random_state=42
+    )
+    model.fit(X, y)
+
+    # Keep a handful of rows around so publish_artifact can check the saved model
+    probe_rows = X.sample(min(len(X), 500), random_state=42)
+    probe = (probe_rows, model.predict(probe_rows))
+
+    trained_at = datetime.now(timezone.utc)
+    return probe, {
+        "version": trained_at.strftime("%Y%m%d-%H%M%S"),
+        "trained_at": trained_at.isoformat(),
+        "train_seconds": round(time.time() - start, 1),
+        "model": FlatForest(model),
+        "features": list(FEATURES),
+        "role_map": dict(ROLE_MAP),
+        "rows": len(df),
+        "watermark": df.attrs.get('last_db_id'),
+        "sklearn_version": sklearn.__version__,
+    }
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def publish_artifact(artifact, probe, model_dir=MODEL_DIR):
+    """Saves, validates and then publishes a freshly trained Brain.
+
+    The artifact is written under a temp name, memory-mapped back from disk and
+    checked against the sklearn forest's own predictions on the probe rows.
+    Only then is it renamed into
+    place and LATEST repointed, so no worker can ever load a half-written or
+    broken model.
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    filename = f"{ARTIFACT_PREFIX}{artifact['version']}.joblib"
+    path = os.path.join(model_dir, filename)
+    tmp_path = path + ".tmp"
+    # Uncompressed on purpose: compressed joblib files cannot be memory-mapped
+    joblib.dump(artifact, tmp_path)
+
+    try:
+        reloaded = joblib.load(tmp_path, mmap_mode='r')
+        model = reloaded["model"]
+        if reloaded["features"] != FEATURES or list(model.feature_names_in_) != FEATURES:
+            raise ValueError("feature list does not match the serving code")
+        if len(model.classes_) < 2:
+            raise ValueError(f"only {len(model.classes_)} rank class(es) in the training data")
+        probe_rows, expected = probe
+        if not np.array_equal(model.predict(probe_rows), expected):
+            raise ValueError("saved model disagrees with the trained model")
+        del reloaded, model
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+    os.replace(tmp_path, path)
+    _write_json_atomic(os.path.join(model_dir, LATEST_POINTER), {"version": artifact["version"], "file": filename})
+    return path
+
+def active_artifact_path(model_dir=MODEL_DIR):
+    """The published artifact, falling back to the newest file for pre-LATEST model dirs."""
+    try:
+        with open(os.path.join(model_dir, LATEST_POINTER)) as f:
+            return os.path.join(model_dir, json.load(f)["file"])
+    except (OSError, ValueError, KeyError):
+        # Versions are UTC timestamps, so the newest artifact sorts last
+        paths = sorted(glob.glob(os.path.join(model_dir, f"{ARTIFACT_PREFIX}*.joblib")))
+        return paths[-1] if paths else None
+
+def load_latest_artifact(model_dir=MODEL_DIR, mmap_mode='r'):
+    """Loads the published Brain. With mmap_mode='r' the forest arrays stay in the
+    page cache and are shared by every process that maps the same file."""
+    path = active_artifact_path(model_dir)
+    if not path:
+        return None
+    artifact = joblib.load(path, mmap_mode=mmap_mode)
+    if not isinstance(artifact.get("model"), FlatForest):
+        raise ValueError(f"{os.path.basename(path)} predates the shareable FlatForest format; retrain the Brain.")
+    if artifact.get("sklearn_version") != sklearn.__version__:
+        print(f"⚠️ Brain {artifact['version']} was trained with scikit-learn {artifact.get('sklearn_version')}, running {sklearn.__version__}.")
+    return artifact
+
+def memory_report(artifact, path, workers=None):
+    """Resident memory of this process, split into the shared Brain mapping and everything else.
+
+    Reads /proc/self/smaps (Linux only); returns None elsewhere. The 'unshared'
+    estimate is what N workers would need if each held a private forest copy.
+    """
+    workers = workers or int(os.environ.get("WEB_CONCURRENCY", 1))
+    rss_kb = brain_kb = 0
+    in_brain = False
+    try:
+        with open("/proc/self/smaps") as f:
+            for line in f:
+                parts = line.split()
+                if not parts[0].endswith(":"):
+                    # Mapping header: "<range> <perms> <offset> <dev> <inode> [path]"
+                    in_brain = len(parts) >= 6 and parts[-1] == os.path.abspath(path)
+                elif parts[0] == "Rss:":
+                    rss_kb += int(parts[1])
+                    if in_brain:
+                        brain_kb += int(parts[1])
+    except OSError:
+        return None
+
+    rss_mb, mapped_mb = rss_kb / 1024, brain_kb / 1024
+    model_mb = artifact["model"].nbytes / 1024 / 1024
+    private_mb = rss_mb - mapped_mb
+    return {
+        "pid": os.getpid(),
+        "rss_mb": round(rss_mb, 1),
+        "brain_mapped_mb": round(mapped_mb, 1),
+        "brain_size_mb": round(model_mb, 1),
+        "workers": workers,
+        "total_shared_mb": round(private_mb * workers + model_mb, 1),
+        "total_unshared_mb": round((private_mb + model_mb) * workers, 1),
+    }
+
+# --- BACKGROUND RETRAIN JOBS ---
+def read_job_status(job_id):
+    try:
+        with open(os.path.join(JOBS_DIR, f"{job_id}.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_job_status(job_id, **fields):
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    status = read_job_status(job_id) or {"job_id": job_id}
+    status.update(fields, updated_at=datetime.now(timezone.utc).isoformat())
+    _write_json_atomic(os.path.join(JOBS_DIR, f"{job_id}.json"), status)
+    return status
+
+def claim_retrain_lock(job_id):
+    """Returns None if job_id now owns the lock, otherwise the job id already holding it."""
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    for _ in range(2):
+        try:
+            fd = os.open(RETRAIN_LOCK, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            with os.fdopen(fd, "w") as f:
+                f.write(job_id)
+            return None
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(RETRAIN_LOCK) > STALE_LOCK_SECONDS:
+                    os.remove(RETRAIN_LOCK)
+                    continue
+                with open(RETRAIN_LOCK) as f:
+                    return f.read().strip()
+            except OSError:
+                continue
+    return "unknown"
+
+def release_retrain_lock(job_id):
+    try:
+        with open(RETRAIN_LOCK) as f:
+            if f.read().strip() == job_id:
+                os.remove(RETRAIN_LOCK)
+    except OSError:
+        pass
+
+def start_retrain_job():
+    """Kicks off `python brain.py --job <id>` in its own process and returns the job status.
+
+    If a retrain is already running anywhere, that job's status is returned instead.
+    """
+    job_id = uuid.uuid4().hex[:12]
+    holder = claim_retrain_lock(job_id)
+    if holder:
+        return read_job_status(holder) or {"job_id": holder, "status": "running"}
+
+    status = write_job_status(job_id, status="queued", created_at=datetime.now(timezone.utc).isoformat())
+    try:
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "--job", job_id], start_new_session=True)
+    except Exception as e:
+        release_retrain_lock(job_id)
+        return write_job_status(job_id, status="failed", error=str(e))
+    return status
+
+def run_retrain_job(supabase, job_id):
+    write_job_status(job_id, status="running", pid=os.getpid())
+    try:
+        probe, artifact = train_brain(supabase)
+        if not artifact:
+            return write_job_status(job_id, status="failed", error="No spider data found yet.")
+        path = publish_artifact(artifact, probe)
+        print(f"✅ Spider Brain {artifact['version']} published to {path} ({artifact['rows']} rows, {artifact['train_seconds']}s).")
+        return write_job_status(job_id, status="succeeded", model_version=artifact["version"], rows=artifact["rows"], train_seconds=artifact["train_seconds"])
+    except Exception as e:
+        print(f"❌ Retrain job {job_id} failed: {e}")
+        return write_job_status(job_id, status="failed", error=str(e))
+    finally:
+        release_retrain_lock(job_id)
+
+if __name__ == '__main__':
+    # Offline training entry point: `python brain.py` (needs SUPABASE_URL / SUPABASE_KEY).
+    # The web app runs the same thing as `python brain.py --job <id>` for background retrains.
+    from supabase import create_client
+
+    parser = argparse.ArgumentParser(description="Train and publish a new Spider Brain.")
+    parser.add_argument("--job", help="job id already claimed by start_retrain_job()")
+    args = parser.parse_args()
+
+    job_id = args.job
+    if not job_id:
+        job_id = uuid.uuid4().hex[:12]
+        holder = claim_retrain_lock(job_id)
+        if holder:
+            sys.exit(f"❌ Retrain job {holder} is already running.")
+
+    supabase_url = os.environ.get("SUPABASE_URL")
+    supabase_key = os.environ.get("SUPABASE_KEY")
+    if not supabase_url or not supabase_key:
+        release_retrain_lock(job_id)
+        write_job_status(job_id, status="failed", error="SUPABASE_URL and SUPABASE_KEY must be set.")
+        sys.exit("❌ SUPABASE_URL and SUPABASE_KEY must be set to train the Brain.")
+
+    client = create_client(supabase_url.split('/rest/v1')[0].rstrip('/'), supabase_key)
+    result = run_retrain_job(client, job_id)
+    if result["status"] != "succeeded":
+        sys.exit(1)
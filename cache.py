@@ -0,0 +1,256 @@
+"""Caches for app.py.
+
+TTLCache lives in one process. SqliteCache has the same interface but keeps its
+entries in a sqlite file, so every gunicorn worker on the machine shares them
+(and they survive a restart). Both evict the least recently used entries past
+`maxsize` and expire entries after `ttl` seconds (None: never).
+
+get_or_load() is single-flight: concurrent misses for one key run the loader
+once and everyone gets its result. SqliteCache extends that across workers
+with a leased lock row, so a dead worker never blocks a key for longer than
+`lease` seconds.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+class _SingleFlight:
+    """get_or_load() on top of get/set/try_lock/unlock."""
+
+    def _init_flights(self):
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+
+    def get_or_load(self, key, loader, ttl=None):
+        """The cached value, or loader() stored under `key`. A None result is returned but not cached."""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = self._load(key, loader, ttl)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _load(self, key, loader, ttl):
+        # Another process may be loading the same key: wait for its value or its lock to go
+        while not self.try_lock(key, self.lease):
+            time.sleep(0.05)
+            value = self._peek(key)
+            if value is not _MISSING:
+                return value
+        try:
+            value = self._peek(key)
+            if value is _MISSING:
+                value = loader()
+                if value is not None:
+                    self.set(key, value, ttl)
+            return value
+        finally:
+            self.unlock(key)
+
+class TTLCache(_SingleFlight):
+    """A small thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize=256, ttl=600, lease=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lease = lease
+        self._data = OrderedDict()
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._init_flights()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def _peek(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return entry[1] if entry is not None and entry[0] >= time.time() else _MISSING
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._data[key] = (time.time() + ttl if ttl is not None else float('inf'), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def try_lock(self, key, lease):
+        """Claims `key` for `lease` seconds unless someone else holds it."""
+        now = time.time()
+        with self._lock:
+            if self._locks.get(key, 0) > now:
+                return False
+            self._locks[key] = now + lease
+            return True
+
+    def unlock(self, key):
+        with self._lock:
+            self._locks.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+class SqliteCache(_SingleFlight):
+    """TTLCache's interface over a sqlite file shared by every process that opens it.
+
+    Values must be JSON-serializable; keys are stored as strings. Each
+    `namespace` is bounded by its own `maxsize`.
+    """
+
+    def __init__(self, path, namespace, maxsize=256, ttl=600, lease=30):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lease = lease
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._owner = None
+        self._init_flights()
+        with self._db() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS cache (namespace TEXT, key TEXT, value TEXT,
+                expires_at REAL, used_at REAL, PRIMARY KEY (namespace, key))""")
+            db.execute("CREATE INDEX IF NOT EXISTS cache_lru ON cache (namespace, used_at)")
+            db.execute("""CREATE TABLE IF NOT EXISTS cache_locks (namespace TEXT, key TEXT,
+                owner TEXT, expires_at REAL, PRIMARY KEY (namespace, key))""")
+
+    def _db(self):
+        # One connection per process: a connection inherited through fork() is unsafe
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._pid = os.getpid()
+            self._owner = f"{os.getpid()}-{id(self)}"
+        return self._conn
+
+    def _row(self, key, touch):
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT value, expires_at, used_at FROM cache WHERE namespace = ? AND key = ?",
+                             (self.namespace, str(key))).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] < now:
+                db.execute("DELETE FROM cache WHERE namespace = ? AND key = ? AND expires_at < ?", (self.namespace, str(key), now))
+                return None
+            # LRU order only needs to be roughly right; skip the write on back-to-back hits
+            if touch and now - row[2] > 1:
+                db.execute("UPDATE cache SET used_at = ? WHERE namespace = ? AND key = ?", (now, self.namespace, str(key)))
+            return row[0]
+
+    def get(self, key, default=None):
+        raw = self._row(key, touch=True)
+        if raw is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(raw)
+
+    def _peek(self, key):
+        raw = self._row(key, touch=False)
+        return _MISSING if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        body = json.dumps(value, separators=(',', ':'))
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                           (self.namespace, str(key), body, now + ttl if ttl is not None else None, now))
+                db.execute("""DELETE FROM cache WHERE namespace = ? AND key IN (
+                    SELECT key FROM cache WHERE namespace = ? ORDER BY used_at DESC LIMIT -1 OFFSET ?)""",
+                           (self.namespace, self.namespace, self.maxsize))
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+
+    def delete(self, key):
+        with self._lock:
+            self._db().execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, str(key)))
+
+    def clear(self):
+        with self._lock:
+            self._db().execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+
+    def try_lock(self, key, lease):
+        """Claims `key` across processes for `lease` seconds unless someone else holds it."""
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            cur = db.execute("""INSERT INTO cache_locks VALUES (?, ?, ?, ?)
+                ON CONFLICT(namespace, key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE cache_locks.expires_at < ?""", (self.namespace, str(key), self._owner, now + lease, now))
+            return cur.rowcount == 1
+
+    def unlock(self, key):
+        with self._lock:
+            self._db().execute("DELETE FROM cache_locks WHERE namespace = ? AND key = ? AND owner = ?",
+                               (self.namespace, str(key), self._owner))
+
+    def __len__(self):
+        with self._lock:
+            return self._db().execute("SELECT COUNT(*) FROM cache WHERE namespace = ? AND (expires_at IS NULL OR expires_at >= ?)",
+                                      (self.namespace, time.time())).fetchone()[0]
+
+def open_cache(namespace, maxsize=256, ttl=600, path=None):
+    """A SqliteCache at `path` shared between processes, or a per-process TTLCache when path is None."""
+    if path is None:
+        return TTLCache(maxsize=maxsize, ttl=ttl)
+    return SqliteCache(path, namespace, maxsize=maxsize, ttl=ttl)
@@ -1,17 +1,55 @@
-import requests
+import sys
+import time
+import signal
+import argparse
 import urllib.parse
 import os
-import time
-import random
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from supabase import create_client, Client
+import feature_store
+from features import AGENT_ROLES
+from spider_dedup import MatchIndex
+from spider_writer import UpsertBuffer
+from match_cache import MatchCache
+from spider_frontier import CrawlFrontier, ShardHandoff, RankBalancer
+import henrik
+import metrics
 
 # Securely injected by GitHub Actions
 API_KEY = os.environ.get("HENRIK_KEY")
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 REGION = "eu"
+HENRIK_API_URL = os.environ.get("HENRIK_API_URL", henrik.HENRIK_API_URL)
+
+# Crawl speed is bounded by our Henrik key's quota, not by fixed sleeps.
+# HENRIK_RATE_LIMIT is requests per minute; SPIDER_WORKERS is how many calls may be in flight.
+RATE_LIMIT_PER_MINUTE = float(os.environ.get("HENRIK_RATE_LIMIT", 30))
+SPIDER_WORKERS = int(os.environ.get("SPIDER_WORKERS", 4))
+MAX_ATTEMPTS = 4
+# While the Henrik API is down (circuit breaker open) the crawl waits out the cooldown and retries
+# the batch, giving up after this many waits in a row without a single successful fetch
+MAX_OUTAGE_WAITS = int(os.environ.get("SPIDER_MAX_OUTAGE_WAITS", 5))
+
+# Crawl state that survives between runs (the workflow caches this directory)
+SPIDER_STATE_DIR = os.environ.get("SPIDER_STATE_DIR", ".spider")
+# Rows are uploaded in bulk by a background writer: whichever comes first
+UPLOAD_BATCH_SIZE = int(os.environ.get("SPIDER_UPLOAD_BATCH", 500))
+UPLOAD_FLUSH_SECONDS = float(os.environ.get("SPIDER_FLUSH_SECONDS", 10))
+# Keep all ten players of every match a rival returns (SPIDER_FULL_LOBBIES=0 keeps only the rival's row).
+# Their names feed the next hop of the frontier, up to SPIDER_MAX_DEPTH hops from the anchors and
+# SPIDER_MAX_RIVALS non-anchor profiles per run. Nobody is re-crawled within SPIDER_RECRAWL_HOURS.
+FULL_LOBBIES = os.environ.get("SPIDER_FULL_LOBBIES", "1") != "0"
+MAX_RIVALS = int(os.environ.get("SPIDER_MAX_RIVALS", 500))
+MAX_DEPTH = int(os.environ.get("SPIDER_MAX_DEPTH", 2))
+RECRAWL_HOURS = float(os.environ.get("SPIDER_RECRAWL_HOURS", 12))
+# Profiles between durable checkpoints of rows, frontier and dedup index
+CHECKPOINT_EVERY = int(os.environ.get("SPIDER_CHECKPOINT_EVERY", 50))
+# Rows wanted per rank for training. Players of ranks that reach it stop being crawled (0 = no steering).
+RANK_TARGET = int(os.environ.get("SPIDER_RANK_TARGET", 20000))
+# Each run ends by writing its counters here (Prometheus text, per shard), next to the crawl state
+METRICS_FILE = os.environ.get("SPIDER_METRICS_FILE", "spider_metrics.prom")
 
 # 1. YOUR ACTUAL TEAM (Will show up on your website frontend)
 team_roster = [
@@ -40,167 +78,320 @@ high_elo_seeds = [
     {"name": "el wiki coino", "tag": "GDN"},
     {"name": "Borryng", "tag": "SPAIN"},
     {"name": "karizma", "tag": "kariz"},
-    
+
     # Add more high-elo tracker names/tags here as you find them
 ]
 
-roster_names = [p['name'].lower() for p in team_roster]
-seed_names = [p['name'].lower() for p in high_elo_seeds]
+# --- RATE LIMITED FETCH LAYER ---
+henrik_client = henrik.HenrikClient(API_KEY, rate_per_minute=RATE_LIMIT_PER_MINUTE, timeout=15, max_attempts=MAX_ATTEMPTS,
+                                    backoff=1, max_backoff=60, max_per_host=SPIDER_WORKERS, report_every=20)
+throughput = henrik_client.throughput
+
+def fetch_recent_matches(p_name, p_tag):
+    url = f"{HENRIK_API_URL}/valorant/v3/matches/{REGION}/{urllib.parse.quote(p_name)}/{urllib.parse.quote(p_tag)}?mode=competitive&size=10"
+    data = henrik_client.get_json(url)
+    if not data or not isinstance(data, dict):
+        return None
+    return data.get('data') or []
+
+def fetch_all(players):
+    """Fetches every player's recent matches concurrently; yields (player, matches) as they land."""
+    with ThreadPoolExecutor(max_workers=SPIDER_WORKERS) as pool:
+        futures = {pool.submit(fetch_recent_matches, p['name'], p['tag']): p for p in players}
+        for future in as_completed(futures):
+            try:
+                matches = future.result()
+            except Exception as e:
+                # One bad response is one failed fetch, never the end of the crawl
+                print(f"   ⚠️ Fetch failed for {futures[future]['name']}#{futures[future]['tag']}: {e}")
+                matches = None
+            yield futures[future], matches
+
+# --- MATCH PARSING ---
+def build_record(match, p, first_kills_by_round):
+    metadata = match['metadata']
+    match_id = metadata['matchid']
+    rounds_played = max(1, metadata['rounds_played'])
+    player_name = p['name']
+
+    stats = p['stats']
+    agent = p['character']
+    team_color = p['team'].lower()
+    won_match = match.get('teams', {}).get(team_color, {}).get('has_won', False)
+
+    kda_ratio = (stats['kills'] + stats['assists']) / max(1, stats['deaths'])
+    acs = stats['score'] / rounds_played
+    adr = p.get('damage_made', 0) / rounds_played
+    hs, bs, ls = stats.get('headshots', 0), stats.get('bodyshots', 0), stats.get('legshots', 0)
+    hs_percent = (hs / (hs + bs + ls) * 100) if (hs + bs + ls) > 0 else 0
+    fb = sum(1 for fk in first_kills_by_round.values() if fk.get('killer_puuid') == p['puuid'])
+    fd = sum(1 for fk in first_kills_by_round.values() if fk.get('victim_puuid') == p['puuid'])
+    rounds_survived = rounds_played - stats['deaths']
+    kast = (min(rounds_played, stats['kills'] + stats['assists'] + rounds_survived) / rounds_played) * 100
+
+    return {
+        "db_id": f"{match_id}_{player_name}", "match_id": match_id, "player_name": player_name,
+        "agent": agent, "role": AGENT_ROLES.get(agent, "Flex"),
+        "rank": p.get('currenttier_patched', 'Unknown'), "map_name": metadata['map'],
+        "win": 1 if won_match else 0, "kills": stats['kills'], "deaths": stats['deaths'],
+        "kda": round(kda_ratio, 2), "acs": round(acs, 2), "kast": round(kast, 1),
+        "adr": int(adr), "hs_percent": int(hs_percent), "fb": fb, "fd": fd
+    }
+
+def first_kills(match):
+    first_kills_by_round = {}
+    for kill in match.get('kills', []):
+        r_num = kill.get('round')
+        if r_num not in first_kills_by_round:
+            first_kills_by_round[r_num] = kill
+    return first_kills_by_round
+
+def parse_match(match):
+    """Every named player's row for one match."""
+    first_kills_by_round = first_kills(match)
+    return [build_record(match, p, first_kills_by_round) for p in match['players']['all_players'] if p['name'].lower() != "unknown"]
+
+def lobby_players(matches):
+    """(name, tag, tier) of every named player in these matches."""
+    return {(p['name'], p['tag'], p.get('currenttier') or 0)
+            for match in matches for p in match['players']['all_players'] if p['name'].lower() != "unknown"}
+
+def new_since(matches, watermark):
+    """The matches newer than the last matchid we saw for this player (Henrik lists newest first)."""
+    fresh = []
+    for match in matches:
+        if match['metadata']['matchid'] == watermark:
+            break
+        fresh.append(match)
+    return fresh
+
+# --- RUN SUMMARY ---
+SPIDER_RUN = metrics.REGISTRY.gauge("presa_spider_run", "Counters of the last spider run", ("shard", "counter"))
+
+def write_summary(path, shard_index, started, uploader, match_cache, match_index):
+    """The run's totals plus every Henrik/Supabase call it made, in the same series names /metrics uses."""
+    totals = {
+        "duration_seconds": round(time.time() - started, 1), "rows_written": uploader.written, "rows_failed": uploader.failed,
+        "upserts": uploader.flushes, "api_calls": throughput.count, "api_throttled": throughput.throttled,
+        "matches_cached": match_cache.stored, "reparses_avoided": match_cache.reused,
+        "known_rows_skipped": match_index.skipped, "existence_probes": match_index.probes,
+    }
+    for counter, value in totals.items():
+        SPIDER_RUN.set(value, shard=shard_index, counter=counter)
+    try:
+        metrics.REGISTRY.write_textfile(path)
+        print(f"   📈 Run metrics written to {path}.")
+    except OSError as e:
+        print(f"   ⚠️ Could not write run metrics: {e}")
+
+def checkpoint(match_index, uploader, frontier):
+    # Rows first, then the state that says they exist
+    uploader.drain()
+    frontier.checkpoint()
+    match_index.save()
+
+def crawl(match_index, uploader, match_cache, frontier, balancer, handoff=None):
+    all_anchors = team_roster + high_elo_seeds
+    # Sharded: every shard crawls only the anchors (and later players) its hash owns
+    frontier.discover([(p['name'], p['tag'], 0) for p in all_anchors], depth=0)
+    if handoff:
+        print(f"   Shard {handoff.shard_index + 1}/{handoff.shard_count}: {handoff.pull(frontier)} players handed over by other shards.")
+    print(f"-> Crawling up to {MAX_DEPTH} hops from {len(all_anchors)} anchors ({frontier.pending()} players due).")
+
+    rows_added = 0
+    rivals = 0
+    profiles = 0
+    since_checkpoint = 0
+    outages = 0
+    breaker = henrik_client.breaker(HENRIK_API_URL)
+
+    while True:
+        batch = frontier.next_batch(SPIDER_WORKERS * 4)
+        batch = [p for p in batch if p['depth'] == 0] + [p for p in batch if p['depth'] > 0][:max(0, MAX_RIVALS - rivals)]
+        if not batch and handoff and rivals < MAX_RIVALS:
+            # Out of work: pick up what the other shards found for us meanwhile
+            checkpoint(match_index, uploader, frontier)
+            if handoff.pull(frontier):
+                continue
+        if not batch:
+            break
 
-agent_roles = {
-    'Jett': 'Duelist', 'Reyna': 'Duelist', 'Raze': 'Duelist', 'Phoenix': 'Duelist', 'Neon': 'Duelist', 'Yoru': 'Duelist', 'Iso': 'Duelist',
-    'Omen': 'Controller', 'Brimstone': 'Controller', 'Viper': 'Controller', 'Astra': 'Controller', 'Harbor': 'Controller', 'Clove': 'Controller',
-    'Sova': 'Initiator', 'Breach': 'Initiator', 'Skye': 'Initiator', 'KAY/O': 'Initiator', 'Kayo': 'Initiator', 'Fade': 'Initiator', 'Gekko': 'Initiator',
-    'Killjoy': 'Sentinel', 'Cypher': 'Sentinel', 'Sage': 'Sentinel', 'Chamber': 'Sentinel', 'Deadlock': 'Sentinel', 'Vyse': 'Sentinel'
-}
+        failed = []
+        short_circuited = henrik_client.stats["short_circuited"]
+        for player, matches in fetch_all(batch):
+            p_name, depth = player['name'], player['depth']
+            if matches is None:
+                # Not crawled: no watermark move, no estimate decay, not counted against MAX_RIVALS
+                failed.append(player)
+                continue
+            profiles += 1
+            if depth > 0:
+                rivals += 1
+            newest, fresh = None, []
+            try:
+                newest = matches[0]['metadata']['matchid'] if matches else None
+                fresh = new_since(matches, player['watermark'])
+                match_cache.put_many(fresh)
+                # Players who played together return the same matches: each one is parsed once per run
+                candidates = [r for match in fresh for r in match_cache.records(match, parse_match)]
+                if depth == 0 or FULL_LOBBIES:
+                    rows = match_index.new_records(candidates)
+                    if handoff:
+                        # Two shards can meet the same lobby: only the one holding the claim uploads it
+                        owned = match_index.claim({r['match_id'] for r in rows}, handoff.shard_index)
+                        rows = [r for r in rows if r['match_id'] in owned]
+                    # Whole lobbies only: lobby means and relative stats need every player of the match
+                    rows_added += uploader.add(rows)
+                    balancer.record(rows)
+                    # Every player of these lobbies is queued now, so later crawls skip them without a probe
+                    match_index.mark_complete(match['metadata']['matchid'] for match in fresh)
+                    # The other players of those lobbies are the next hop
+                    foreign = frontier.discover(lobby_players(fresh), depth + 1)
+                    if handoff and foreign:
+                        handoff.push(foreign, depth + 1)
+                else:
+                    rows = match_index.new_records([r for r in candidates if r['player_name'] == p_name])
+                    rows_added += uploader.add(rows)
+                    balancer.record(rows)
+                print(f"   [{profiles}] Processed hop {depth} player: {p_name} ({len(fresh)} new matches)")
+            except Exception as e:
+                print(f"   [{profiles}] Skipped profile: {p_name} ({e})")
+                newest, fresh = None, []
+            frontier.crawled(player, newest, len(fresh))
 
-print("🕷️ Starting Full Deep Spider with High-Elo Engine...")
+        if failed and (breaker.state != "closed" or henrik_client.stats["short_circuited"] > short_circuited):
+            # The API is down, not these players: wait for the breaker instead of draining the frontier
+            outages = 0 if len(failed) < len(batch) else outages + 1
+            if outages > MAX_OUTAGE_WAITS:
+                print(f"   ❌ Henrik API still failing after {MAX_OUTAGE_WAITS} waits, ending the crawl.")
+                break
+            wait = breaker.retry_in()
+            print(f"   ⏸️ Henrik API failing (circuit {breaker.state}): retrying {len(failed)} players in {wait:.0f}s.")
+            time.sleep(wait)
+        else:
+            outages = 0
+            for player in failed:
+                print(f"   Skipped profile: {player['name']} (fetch failed, retried next run)")
+                frontier.skip(player)
 
-res = supabase.table('ml_spider_matches').select('db_id').execute()
-saved_db_ids = {row['db_id'] for row in res.data} if res.data else set()
+        since_checkpoint += len(batch)
+        if since_checkpoint >= CHECKPOINT_EVERY:
+            checkpoint(match_index, uploader, frontier)
+            since_checkpoint = 0
 
-total_uploaded = 0
-strangers_found = set()
+    print(f"-> Crawl Complete. {rows_added} rows queued from {profiles} profiles ({frontier.pending()} players still due for the next run).")
+    print(f"   Rank balance: {balancer.summary()}")
 
-# Combine both groups for the match discovery layer
-all_anchors = team_roster + high_elo_seeds
+def replay_cache(match_index, uploader, match_cache, batch_matches=100):
+    """Re-derives ml_spider_matches rows from cached raw matches. No API calls."""
+    print(f"-> REPLAY: Parsing {len(match_cache)} cached matches...")
+    batch = []
+    for match in match_cache.matches():
+        batch.append(match)
+        if len(batch) >= batch_matches:
+            uploader.add(match_index.new_records([r for m in batch for r in parse_match(m)]))
+            match_index.mark_complete(m['metadata']['matchid'] for m in batch)
+            batch = []
+    uploader.add(match_index.new_records([r for m in batch for r in parse_match(m)]))
+    match_index.mark_complete(m['metadata']['matchid'] for m in batch)
 
-# --- PHASE 1: Scan Anchors (Team + High Elo Seeds) ---
-print("-> PHASE 1: Scanning Anchors for Match Discovery...")
-for anchor in all_anchors:
-    p_name, p_tag = anchor['name'], anchor['tag']
-    url = f"https://api.henrikdev.xyz/valorant/v3/matches/{REGION}/{urllib.parse.quote(p_name)}/{urllib.parse.quote(p_tag)}?mode=competitive&size=10"
-    
+def run(shard_index=0, shard_count=1, from_cache=False, supabase=None, state_root=SPIDER_STATE_DIR):
+    """One crawl (or cache replay) into `supabase`, the Supabase project from the environment by default."""
+    started = time.time()
+    if supabase is None:
+        supabase: Client = metrics.InstrumentedSupabase(create_client(SUPABASE_URL, SUPABASE_KEY))
+    print("🕷️ Starting Full Deep Spider with High-Elo Engine...")
+    print(f"   Rate budget: {RATE_LIMIT_PER_MINUTE:g} req/min across {SPIDER_WORKERS} workers.")
+
+    # Each shard keeps its own local state; what they share lives in Supabase
+    state_dir = os.path.join(state_root, f"shard-{shard_index}") if shard_count > 1 else state_root
+    handoff = ShardHandoff(supabase, shard_index, shard_count) if shard_count > 1 else None
+
+    # Dedup on match_id with per-batch existence probes instead of preloading every db_id
+    match_index = MatchIndex(supabase, os.path.join(state_dir, "complete_matches.bloom"))
+    uploader = UpsertBuffer(supabase, os.path.join(state_dir, "failed_rows.jsonl"),
+                            batch_size=UPLOAD_BATCH_SIZE, flush_interval=UPLOAD_FLUSH_SECONDS, update_features=shard_count == 1)
+    match_index.queued.update(uploader.replayed_ids)
+    # Cancelled runs still flush what they parsed
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(1))
+    match_cache = MatchCache(os.path.join(state_dir, "matches.sqlite"))
+    frontier = CrawlFrontier(os.path.join(state_dir, "frontier.sqlite"), max_depth=MAX_DEPTH, recrawl_hours=RECRAWL_HOURS,
+                             shard_index=shard_index, shard_count=shard_count)
     try:
-        response = requests.get(url, headers={"Authorization": API_KEY})
-        if response.status_code == 200:
-            matches = response.json().get('data', [])
-            records_to_upload = []
-            
-            for match in matches:
-                metadata = match['metadata']
-                match_id = metadata['matchid']
-                rounds_played = max(1, metadata['rounds_played'])
-                
-                first_kills_by_round = {}
-                for kill in match.get('kills', []):
-                    r_num = kill.get('round')
-                    if r_num not in first_kills_by_round:
-                        first_kills_by_round[r_num] = kill
-                
-                for p in match['players']['all_players']:
-                    player_name = p['name']
-                    player_tag = p['tag']
-                    db_id = f"{match_id}_{player_name}" 
-                    
-                    # Gather strangers for Phase 2 deep scanning
-                    if player_name.lower() not in roster_names and player_name.lower() not in seed_names and player_name.lower() != "unknown":
-                        strangers_found.add((player_name, player_tag))
-
-                    if db_id in saved_db_ids or player_name.lower() == "unknown":
-                        continue
-                        
-                    stats = p['stats']
-                    agent = p['character']
-                    team_color = p['team'].lower()
-                    won_match = match.get('teams', {}).get(team_color, {}).get('has_won', False)
-                    
-                    kda_ratio = (stats['kills'] + stats['assists']) / max(1, stats['deaths'])
-                    acs = stats['score'] / rounds_played
-                    adr = p.get('damage_made', 0) / rounds_played
-                    hs, bs, ls = stats.get('headshots', 0), stats.get('bodyshots', 0), stats.get('legshots', 0)
-                    hs_percent = (hs / (hs + bs + ls) * 100) if (hs + bs + ls) > 0 else 0
-                    fb = sum(1 for fk in first_kills_by_round.values() if fk.get('killer_puuid') == p['puuid'])
-                    fd = sum(1 for fk in first_kills_by_round.values() if fk.get('victim_puuid') == p['puuid'])
-                    rounds_survived = rounds_played - stats['deaths']
-                    kast = (min(rounds_played, stats['kills'] + stats['assists'] + rounds_survived) / rounds_played) * 100
-                    
-                    records_to_upload.append({
-                        "db_id": db_id, "match_id": match_id, "player_name": player_name,
-                        "agent": agent, "role": agent_roles.get(agent, "Flex"),
-                        "rank": p.get('currenttier_patched', 'Unknown'), "map_name": metadata['map'],
-                        "win": 1 if won_match else 0, "kills": stats['kills'], "deaths": stats['deaths'],
-                        "kda": round(kda_ratio, 2), "acs": round(acs, 2), "kast": round(kast, 1),
-                        "adr": int(adr), "hs_percent": int(hs_percent), "fb": fb, "fd": fd
-                    })
-                    saved_db_ids.add(db_id)
-            
-            if records_to_upload:
-                supabase.table("ml_spider_matches").upsert(records_to_upload).execute()
-                total_uploaded += len(records_to_upload)
-                
-    except Exception as e:
-        print(f"Error checking {p_name}: {e}")
-        
-    time.sleep(5)
-
-print(f"-> Phase 1 Complete. Baseline rows synced.")
-
-# --- PHASE 2: Deep Scan Every Rival ---
-strangers_list = list(strangers_found)
-total_strangers = len(strangers_list)
-print(f"\n-> PHASE 2: Scanning {total_strangers} unique rivals found across all skill brackets.")
-
-deep_rows_added = 0
-
-for index, (s_name, s_tag) in enumerate(strangers_list, 1):
-    time.sleep(7) # Safe execution gap
-    url = f"https://api.henrikdev.xyz/valorant/v3/matches/{REGION}/{urllib.parse.quote(s_name)}/{urllib.parse.quote(s_tag)}?mode=competitive&size=10"
-    
+        if from_cache:
+            replay_cache(match_index, uploader, match_cache)
+        else:
+            balancer = RankBalancer(supabase, RANK_TARGET)
+            frontier.steer(balancer.tier_need)
+            crawl(match_index, uploader, match_cache, frontier, balancer, handoff)
+    finally:
+        match_cache.close()
+        uploader.close()
+        # Saved only after the flush, so a match is marked complete (and a player crawled) once its
+        # rows are written or parked in the dead letter file that the next run replays first
+        frontier.checkpoint()
+        frontier.close()
+        match_index.save()
+
+    print(f"\n✅ Pipeline Complete. Collected {uploader.written} clean data tracks in {uploader.flushes} bulk upserts ({uploader.rows_per_second():.1f} rows/s).")
+    if uploader.failed:
+        print(f"   ⚠️ {uploader.failed} rows could not be written and will be retried next run.")
+    print(f"   Match cache: {match_cache.stored} new raw matches stored, {match_cache.reused} re-parses avoided.")
+    print(f"   Dedup: {match_index.skipped} known rows skipped with {match_index.probes} existence probes.")
+    print(f"   {throughput.count} API calls at {throughput.rate():.1f} req/min ({throughput.throttled} throttled), "
+          f"{uploader.written / max(1, throughput.count):.1f} rows per call.")
+    write_summary(os.path.join(state_dir, METRICS_FILE), shard_index, started, uploader, match_cache, match_index)
+    return uploader.written
+
+# Local runs keep their state and their database apart from the real crawl's
+LOCAL_STATE_DIR = os.path.join(SPIDER_STATE_DIR, "local")
+
+def local_database(path):
+    from supabase_stub import LocalSupabase
+    return metrics.InstrumentedSupabase(LocalSupabase(path))
+
+def run_local_shard(shard_index, shard_count, db_path):
+    return run(shard_index, shard_count, supabase=local_database(db_path), state_root=LOCAL_STATE_DIR)
+
+def run_local_shards(shard_count):
+    """Every shard as its own process, all crawling a local stub of the Henrik API into one local sqlite database.
+
+    Never touches the Supabase project: synthetic stub players must not reach the training set.
+    """
+    global HENRIK_API_URL
+    from spider_stub import StubHenrik
+
+    stub = StubHenrik(team_roster + high_elo_seeds)
+    # Forked workers inherit the global; spawned ones re-read the environment
+    HENRIK_API_URL = os.environ["HENRIK_API_URL"] = stub.url
+    db_path = os.path.join(LOCAL_STATE_DIR, "supabase.sqlite")
+    os.makedirs(LOCAL_STATE_DIR, exist_ok=True)
+    print(f"🧪 Local run: {shard_count} shards against the stub API at {stub.url}, writing to {db_path}")
     try:
-        response = requests.get(url, headers={"Authorization": API_KEY})
-        if response.status_code == 200:
-            matches = response.json().get('data', [])
-            records_to_upload = []
-            
-            for match in matches:
-                metadata = match['metadata']
-                match_id = metadata['matchid']
-                rounds_played = max(1, metadata['rounds_played'])
-                
-                first_kills_by_round = {}
-                for kill in match.get('kills', []):
-                    r_num = kill.get('round')
-                    if r_num not in first_kills_by_round:
-                        first_kills_by_round[r_num] = kill
-                
-                for p in match['players']['all_players']:
-                    if p['name'] == s_name:
-                        db_id = f"{match_id}_{s_name}"
-                        
-                        if db_id in saved_db_ids:
-                            continue
-                            
-                        stats = p['stats']
-                        agent = p['character']
-                        team_color = p['team'].lower()
-                        won_match = match.get('teams', {}).get(team_color, {}).get('has_won', False)
-                        
-                        kda_ratio = (stats['kills'] + stats['assists']) / max(1, stats['deaths'])
-                        acs = stats['score'] / rounds_played
-                        adr = p.get('damage_made', 0) / rounds_played
-                        hs, bs, ls = stats.get('headshots', 0), stats.get('bodyshots', 0), stats.get('legshots', 0)
-                        hs_percent = (hs / (hs + bs + ls) * 100) if (hs + bs + ls) > 0 else 0
-                        fb = sum(1 for fk in first_kills_by_round.values() if fk.get('killer_puuid') == p['puuid'])
-                        fd = sum(1 for fk in first_kills_by_round.values() if fk.get('victim_puuid') == p['puuid'])
-                        rounds_survived = rounds_played - stats['deaths']
-                        kast = (min(rounds_played, stats['kills'] + stats['assists'] + rounds_survived) / rounds_played) * 100
-                        
-                        records_to_upload.append({
-                            "db_id": db_id, "match_id": match_id, "player_name": s_name,
-                            "agent": agent, "role": agent_roles.get(agent, "Flex"),
-                            "rank": p.get('currenttier_patched', 'Unknown'), "map_name": metadata['map'],
-                            "win": 1 if won_match else 0, "kills": stats['kills'], "deaths": stats['deaths'],
-                            "kda": round(kda_ratio, 2), "acs": round(acs, 2), "kast": round(kast, 1),
-                            "adr": int(adr), "hs_percent": int(hs_percent), "fb": fb, "fd": fd
-                        })
-                        saved_db_ids.add(db_id)
-            
-            if records_to_upload:
-                supabase.table("ml_spider_matches").upsert(records_to_upload).execute()
-                deep_rows_added += len(records_to_upload)
-            print(f"   [{index}/{total_strangers}] Processed rival: {s_name}")
-    except Exception as e:
-        print(f"   [{index}/{total_strangers}] Skipped profile: {s_name}")
-
-print(f"\n✅ Pipeline Complete. Collected {total_uploaded + deep_rows_added} clean data tracks.")
+        with ProcessPoolExecutor(max_workers=shard_count) as pool:
+            written = list(pool.map(run_local_shard, range(shard_count), [shard_count] * shard_count, [db_path] * shard_count))
+    finally:
+        stub.close()
+    print(f"\n✅ {shard_count} shards wrote {sum(written)} rows: {written}")
+    # Shards skip the incremental feature store update; fold everything once now
+    feature_store.rebuild_feature_store(local_database(db_path))
+
+def main():
+    parser = argparse.ArgumentParser(description="Harvests ranked match rows into ml_spider_matches.")
+    parser.add_argument("--from-cache", action="store_true", help="Rebuild rows from the local match cache without calling the API")
+    parser.add_argument("--shard-index", type=int, default=int(os.environ.get("SPIDER_SHARD_INDEX", 0)),
+                        help="Which slice of the frontier this process crawls (0-based)")
+    parser.add_argument("--shard-count", type=int, default=int(os.environ.get("SPIDER_SHARD_COUNT", 1)),
+                        help="How many processes or jobs split the frontier")
+    parser.add_argument("--local-shards", type=int, metavar="N", help="Run N shards as local processes against a stub API and a local database")
+    args = parser.parse_args()
+
+    if args.local_shards:
+        run_local_shards(args.local_shards)
+        return
+    if not 0 <= args.shard_index < args.shard_count:
+        sys.exit("❌ --shard-index must be between 0 and --shard-count - 1.")
+    run(args.shard_index, args.shard_count, args.from_cache)
+
+if __name__ == '__main__':
+    main()
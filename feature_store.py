@@ -0,0 +1,244 @@
+"""Precomputed lobby aggregates and per-player feature rows for /api/predict.
+
+Every time the spider writes new ml_spider_matches rows it calls record_spider_rows(),
+which folds them into two small tables so a prediction is one keyed lookup instead
+of re-reading every lobby the player was in. Create them once in the Supabase SQL editor:
+
+    create table ml_lobby_aggregates (
+        match_id text primary key,
+        players int not null default 0,       -- ranked rows, the same ones training averages over
+        acs_sum double precision not null default 0,
+        adr_sum double precision not null default 0
+    );
+    create table ml_player_features (
+        player_key text primary key,          -- lower(player_name), matches the ilike lookup
+        player_name text,
+        matches int not null default 0,
+        wins int not null default 0,
+        last_rank text,
+        role_counts jsonb not null default '{}',
+        sums jsonb not null default '{}',     -- running sums of the Brain's features, see SUM_FIELDS
+        updated_at timestamptz default now()
+    );
+
+`python feature_store.py --rebuild` backfills both tables from ml_spider_matches; run it
+whenever SUM_FIELDS or the feature definitions in features.py change.
+"""
+import os
+import sys
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from features import FEATURES, ROLE_MAP, build_feature_matrix, frame_from_rows
+
+LOBBY_TABLE = 'ml_lobby_aggregates'
+PLAYER_TABLE = 'ml_player_features'
+CHUNK_SIZE = 200  # keeps in_() filters well inside PostgREST's URL limits
+# ml_spider_matches has ~10 rows per match_id and PostgREST caps a response at 1000 rows,
+# so per-match lookups there go 50 matches at a time
+MATCH_CHUNK_SIZE = 50
+
+# Every feature but role_encoded is the player's average, so the store keeps its running sum.
+# Rows come from features.build_feature_matrix, the same code the Brain is trained on.
+SUM_FIELDS = [col for col in FEATURES if col != 'role_encoded']
+
+SPIDER_COLUMNS = 'db_id, match_id, player_name, role, rank, win, kills, deaths, acs, kast, adr, hs_percent, fb, fd, kda'
+
+def player_key(name):
+    return (name or '').lower()
+
+def _chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _is_ranked(row):
+    return row.get('rank') not in (None, 'Unknown')
+
+def lobby_frame(lobbies):
+    """ml_lobby_aggregates rows as a features.lobby_aggregates() table (same dtypes); empty lobbies are left out."""
+    lobbies = [l for l in lobbies if l and l['players']]
+    return pd.DataFrame({'acs': np.array([l['acs_sum'] / l['players'] for l in lobbies], dtype=np.float32),
+                         'adr': np.array([l['adr_sum'] / l['players'] for l in lobbies], dtype=np.float64)},
+                        index=pd.Index([l['match_id'] for l in lobbies], name='match_id'))
+
+def feature_sums(rows, lobbies):
+    """{player_key: {feature: sum}} of the build_feature_matrix rows of `rows`, scored against `lobbies` ({match_id: lobby})."""
+    if not rows:
+        return {}
+    df = frame_from_rows(rows)
+    X = build_feature_matrix(df, lobby_frame(lobbies.get(m) for m in set(df['match_id'])))[SUM_FIELDS]
+    keys = np.array([player_key(r['player_name']) for r in rows], dtype=object)
+    return {key: {col: float(value) for col, value in sums.items()} for key, sums in X.groupby(keys).sum().iterrows()}
+
+def _empty_player(name):
+    return {'player_key': player_key(name), 'player_name': name, 'matches': 0, 'wins': 0, 'last_rank': None,
+            'role_counts': {}, 'sums': {col: 0 for col in SUM_FIELDS}}
+
+def _add(sums, delta, sign=1):
+    for col, value in delta.items():
+        sums[col] = sums.get(col, 0) + sign * value
+
+def _fold_lobbies(lobbies, rows):
+    """Adds match rows to {match_id: lobby}; only ranked rows count toward the baseline."""
+    for r in rows:
+        lobby = lobbies.setdefault(r['match_id'], {'match_id': r['match_id'], 'players': 0, 'acs_sum': 0, 'adr_sum': 0})
+        if _is_ranked(r):
+            lobby['players'] += 1
+            lobby['acs_sum'] += r.get('acs') or 0
+            lobby['adr_sum'] += r.get('adr') or 0
+    return lobbies
+
+def _fold_players(players, rows, lobbies):
+    """Adds match rows, scored against `lobbies`, to {player_key: player row}."""
+    names = {player_key(r['player_name']): r['player_name'] for r in rows}
+    for key, sums in feature_sums(rows, lobbies).items():
+        _add(players.setdefault(key, _empty_player(names[key]))['sums'], sums)
+    for r in rows:
+        p = players[player_key(r['player_name'])]
+        p['matches'] += 1
+        p['wins'] += r.get('win') or 0
+        p['last_rank'] = r.get('rank')
+        role = r.get('role') or 'Flex'
+        p['role_counts'][role] = p['role_counts'].get(role, 0) + 1
+    return players
+
+def _write(supabase, lobbies, players, size=CHUNK_SIZE):
+    now = datetime.now(timezone.utc).isoformat()
+    for chunk in _chunks(lobbies, size):
+        supabase.table(LOBBY_TABLE).upsert(chunk).execute()
+    for chunk in _chunks(players, size):
+        supabase.table(PLAYER_TABLE).upsert([dict(p, updated_at=now) for p in chunk]).execute()
+
+def fetch_in_chunks(supabase, table, columns, key, values, ranked_only=False, chunk_size=CHUNK_SIZE):
+    """select(columns).in_(key, values), split so long value lists stay within URL limits.
+
+    Each chunk must match fewer than 1000 rows; pass a smaller `chunk_size` when one value matches many.
+    """
+    rows = []
+    for chunk in _chunks(values, chunk_size):
+        query = supabase.table(table).select(columns).in_(key, chunk)
+        if ranked_only:
+            query = query.neq('rank', 'Unknown')
+        rows.extend(query.execute().data or [])
+    return rows
+
+def keyset_pages(query, page_size=1000):
+    """Pages of the rows `query()` selects (a fresh builder each call, db_id among its columns), ordered by db_id.
+
+    Keyset pagination, so a lookup that matches more than PostgREST's 1000-row cap still sees every row.
+    """
+    last_db_id = None
+    while True:
+        page = query()
+        if last_db_id is not None:
+            page = page.gt('db_id', last_db_id)
+        rows = page.order('db_id').limit(page_size).execute().data
+        if not rows:
+            return
+        yield rows
+        last_db_id = rows[-1]['db_id']
+        if len(rows) < page_size:
+            return
+
+def record_spider_rows(supabase, records):
+    """Folds newly inserted ml_spider_matches rows into the lobby and player tables.
+
+    Lobby sums are updated first. Players already stored for a match whose lobby
+    average moved get their rows rescored against the new average. Then the new
+    rows are added to their own players. `records` must be rows that were just inserted.
+
+    This adds to the stored totals, so it must run once per batch: never retry it.
+    After a failure part of it may have been written; repair_spider_rows() fixes that.
+    """
+    if not records:
+        return
+    new_ids = {r['db_id'] for r in records}
+    match_ids = {r['match_id'] for r in records}
+
+    old_lobbies = {l['match_id']: l for l in fetch_in_chunks(supabase, LOBBY_TABLE, '*', 'match_id', match_ids)}
+    new_lobbies = _fold_lobbies({m: dict(l) for m, l in old_lobbies.items()}, records)
+    changed = [m for m in match_ids if new_lobbies[m]['players'] != (old_lobbies.get(m) or {}).get('players', 0)]
+
+    # Rows that were already stored before this batch and were scored against the old lobby
+    existing = fetch_in_chunks(supabase, 'ml_spider_matches', SPIDER_COLUMNS, 'match_id', changed,
+                               chunk_size=MATCH_CHUNK_SIZE) if changed else []
+    existing = [r for r in existing if r['db_id'] not in new_ids]
+    names = {player_key(r['player_name']): r['player_name'] for r in existing + list(records)}
+
+    players = {p['player_key']: p for p in fetch_in_chunks(supabase, PLAYER_TABLE, '*', 'player_key', names)}
+    for key, sums in feature_sums(existing, new_lobbies).items():
+        _add(players.setdefault(key, _empty_player(names[key]))['sums'], sums)
+    for key, sums in feature_sums(existing, old_lobbies).items():
+        _add(players[key]['sums'], sums, sign=-1)
+    _fold_players(players, records, new_lobbies)
+    _write(supabase, new_lobbies.values(), players.values())
+
+def repair_spider_rows(supabase, records):
+    """Recomputes every lobby and player `records` touch from ml_spider_matches, from scratch.
+
+    Each lobby is rebuilt from its match's rows, then each player in those lobbies
+    from all their rows. Nothing is added to stored totals, so it is safe to retry
+    and undoes a record_spider_rows() call that was only partly written.
+    """
+    match_ids = {r['match_id'] for r in records}
+    lobby_rows = fetch_in_chunks(supabase, 'ml_spider_matches', SPIDER_COLUMNS, 'match_id', match_ids, chunk_size=MATCH_CHUNK_SIZE)
+    lobbies = _fold_lobbies({}, lobby_rows)
+
+    rows = []
+    for chunk in _chunks({r['player_name'].lower() for r in lobby_rows}, 50):
+        player_filter = ",".join(f'player_name.ilike."{n}"' for n in chunk)
+        rows.extend(r for page in keyset_pages(lambda: supabase.table('ml_spider_matches').select(SPIDER_COLUMNS).or_(player_filter)) for r in page)
+    rows.sort(key=lambda r: r['db_id'])
+    other = {r['match_id'] for r in rows} - set(lobbies)
+    scored_against = dict(lobbies, **{l['match_id']: l for l in fetch_in_chunks(supabase, LOBBY_TABLE, '*', 'match_id', other)})
+    players = _fold_players({}, rows, scored_against)
+    _write(supabase, lobbies.values(), players.values())
+
+def fetch_player(supabase, name):
+    res = supabase.table(PLAYER_TABLE).select('*').eq('player_key', player_key(name)).limit(1).execute()
+    return res.data[0] if res.data else None
+
+def fetch_players(supabase, names):
+    """Feature store rows for many players in one query, keyed by player_key."""
+    keys = {player_key(n) for n in names}
+    return {p['player_key']: p for p in fetch_in_chunks(supabase, PLAYER_TABLE, '*', 'player_key', keys)}
+
+def primary_role(role_counts):
+    # Most played role; ties go alphabetically, like pandas' Series.mode()
+    return min(role_counts, key=lambda role: (-role_counts[role], role)) if role_counts else 'Flex'
+
+def player_feature_vector(player, role_map=ROLE_MAP):
+    """The same averaged 15-feature row features.player_feature_vector builds, from stored sums."""
+    n = max(1, player['matches'])
+    vector = {col: player['sums'].get(col, 0) / n for col in SUM_FIELDS}
+    vector['role_encoded'] = float(role_map.get(primary_role(player['role_counts']), 4))
+    return pd.DataFrame([vector])[FEATURES]
+
+def rebuild_feature_store(supabase, page_size=1000):
+    """Recomputes both tables from scratch with two keyset-paged passes over ml_spider_matches."""
+    pages = lambda: keyset_pages(lambda: supabase.table('ml_spider_matches').select(SPIDER_COLUMNS), page_size)
+
+    start = time.time()
+    lobbies = {}
+    for rows in pages():
+        _fold_lobbies(lobbies, rows)
+
+    players = {}
+    for rows in pages():
+        _fold_players(players, rows, lobbies)
+
+    _write(supabase, lobbies.values(), players.values(), 500)
+    print(f"✅ Feature store rebuilt: {len(lobbies)} lobbies, {len(players)} players ({time.time() - start:.1f}s).")
+
+if __name__ == '__main__':
+    from supabase import create_client
+
+    if '--rebuild' not in sys.argv:
+        sys.exit("Usage: python feature_store.py --rebuild")
+    supabase_url = os.environ.get("SUPABASE_URL")
+    supabase_key = os.environ.get("SUPABASE_KEY")
+    if not supabase_url or not supabase_key:
+        sys.exit("❌ SUPABASE_URL and SUPABASE_KEY must be set.")
+    rebuild_feature_store(create_client(supabase_url.split('/rest/v1')[0].rstrip('/'), supabase_key))
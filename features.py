@@ -0,0 +1,183 @@
+import sys
+import pandas as pd
+import numpy as np
+
+# --- TACTICAL TIER FRAMEWORK FEATURES ---
+# One definition shared by training (brain.py), /api/predict and batch scoring, so
+# the inputs the Brain sees at prediction time always match what it was trained on.
+
+ROLE_MAP = {'Duelist': 0, 'Initiator': 1, 'Controller': 2, 'Sentinel': 3, 'Flex': 4}
+# Every agent's role; agents missing here play as 'Flex'
+AGENT_ROLES = {
+    'Jett': 'Duelist', 'Reyna': 'Duelist', 'Raze': 'Duelist', 'Phoenix': 'Duelist', 'Neon': 'Duelist', 'Yoru': 'Duelist', 'Iso': 'Duelist',
+    'Omen': 'Controller', 'Brimstone': 'Controller', 'Viper': 'Controller', 'Astra': 'Controller', 'Harbor': 'Controller', 'Clove': 'Controller',
+    'Sova': 'Initiator', 'Breach': 'Initiator', 'Skye': 'Initiator', 'KAY/O': 'Initiator', 'Kayo': 'Initiator', 'Fade': 'Initiator', 'Gekko': 'Initiator',
+    'Killjoy': 'Sentinel', 'Cypher': 'Sentinel', 'Sage': 'Sentinel', 'Chamber': 'Sentinel', 'Deadlock': 'Sentinel', 'Vyse': 'Sentinel'
+}
+# Competitive ranks, lowest first: the Brain's target classes and the simulator's ladder
+RANK_LADDER = [
+    "Iron 1", "Iron 2", "Iron 3", "Bronze 1", "Bronze 2", "Bronze 3",
+    "Silver 1", "Silver 2", "Silver 3", "Gold 1", "Gold 2", "Gold 3",
+    "Platinum 1", "Platinum 2", "Platinum 3", "Diamond 1", "Diamond 2", "Diamond 3",
+    "Ascendant 1", "Ascendant 2", "Ascendant 3", "Immortal 1", "Immortal 2", "Immortal 3", "Radiant"
+]
+FEATURES = [
+    'kills', 'deaths', 'acs', 'kast', 'adr', 'hs_percent', 'fb', 'fd',
+    'lobby_relative_acs', 'lobby_relative_adr',
+    'duelist_entry_score', 'initiator_setup_score', 'controller_anchor_score', 'sentinel_defense_score',
+    'role_encoded'
+]
+
+# Compact dtypes for the raw ml_spider_matches stats every feature is built from
+STAT_DTYPES = {
+    'kills': np.int16, 'deaths': np.int16, 'adr': np.int16, 'hs_percent': np.int16,
+    'fb': np.int16, 'fd': np.int16,
+    'acs': np.float32, 'kast': np.float32, 'kda': np.float32,
+}
+
+def frame_from_rows(rows):
+    """Turns Supabase rows into a frame with the same stat dtypes the training loader uses."""
+    df = pd.DataFrame(rows)
+    stats = [col for col in STAT_DTYPES if col in df.columns]
+    df[stats] = df[stats].fillna(0)
+    return df.astype({col: STAT_DTYPES[col] for col in stats})
+
+def lobby_aggregates(df):
+    """Mean ACS/ADR per match_id: the lobby baseline that captures "Rank Bias"."""
+    return df.groupby('match_id', observed=True)[['acs', 'adr']].mean()
+
+def build_feature_matrix(df, lobbies, role_map=ROLE_MAP):
+    """Returns the exact 15-feature matrix (one row per match row) for the Brain.
+
+    `lobbies` is a lobby_aggregates() table. Matches missing from it get a
+    lobby-relative score of 0, i.e. the player is treated as the lobby average.
+    """
+    acs = df['acs'].to_numpy()
+    adr = df['adr'].to_numpy()
+    fb, fd = df['fb'].to_numpy(), df['fd'].to_numpy()
+    kast = df['kast'].to_numpy()
+    role = df['role'].astype(object).to_numpy()
+
+    # A. Lobby-relative stats, joined on match_id by index position
+    pos = lobbies.index.get_indexer(df['match_id'])
+    found = pos >= 0
+    lobby_acs = np.where(found, lobbies['acs'].to_numpy()[pos], acs)
+    lobby_adr = np.where(found, lobbies['adr'].to_numpy()[pos], adr)
+    rel_adr = adr - lobby_adr
+
+    X = pd.DataFrame({
+        'kills': df['kills'].to_numpy(), 'deaths': df['deaths'].to_numpy(), 'acs': acs, 'kast': kast,
+        'adr': adr, 'hs_percent': df['hs_percent'].to_numpy(), 'fb': fb, 'fd': fd,
+        'lobby_relative_acs': acs - lobby_acs,
+        'lobby_relative_adr': rel_adr,
+        # B. Role-adjusted tactical rules
+        'duelist_entry_score': np.where(role == 'Duelist', (fb * 2) - fd + rel_adr, 0),
+        'initiator_setup_score': np.where(role == 'Initiator', (kast * 1.5) - (df['hs_percent'].to_numpy() * 0.1), 0),
+        'controller_anchor_score': np.where(role == 'Controller', kast / (fd + 1), 0),
+        'sentinel_defense_score': np.where(role == 'Sentinel', df['kda'].to_numpy() * (kast / 100), 0),
+        # C. Map Roles to Numbers
+        'role_encoded': pd.Series(role).map(role_map).fillna(4).to_numpy(dtype=np.float32),
+    }, index=df.index)
+    return X[FEATURES]
+
+def player_feature_vector(df, lobbies, role_map=ROLE_MAP):
+    """Collapses one player's match rows into the single row /api/predict feeds the Brain.
+
+    Every feature is the player's average, except role_encoded which is the
+    encoding of their most played role.
+    """
+    X = build_feature_matrix(df, lobbies, role_map)
+    vector = X.mean().to_frame().T
+    vector['role_encoded'] = float(role_map.get(primary_role(df), 4))
+    return vector[FEATURES]
+
+def player_feature_matrix(df, lobbies, keys, role_map=ROLE_MAP):
+    """player_feature_vector for many players at once: one averaged row per key.
+
+    `keys` labels every row of `df` with the player it belongs to (e.g. the
+    lowercased player name). Ties for the most played role go alphabetically,
+    the same as Series.mode().
+    """
+    X = build_feature_matrix(df, lobbies, role_map)
+    keys = pd.Series(np.asarray(keys), index=df.index, name='player')
+    matrix = X.groupby(keys).mean()
+    role_counts = pd.crosstab(keys, df['role'].astype(object))
+    matrix['role_encoded'] = role_counts.idxmax(axis=1).map(role_map).fillna(4).astype(float)
+    return matrix[FEATURES]
+
+def primary_role(df):
+    return df['role'].mode()[0]
+
+if __name__ == '__main__':
+    # Parity check: `python features.py`. Features built for one player the way
+    # /api/predict does it must equal that player's rows in the training matrix,
+    # and the averaged rows /api/predict, /api/predict/batch and the feature store
+    # serve must match them.
+    rng = np.random.default_rng(42)
+    roles = list(ROLE_MAP) + ['Unknown']
+    rows = []
+    for m in range(200):
+        for p in range(10):
+            rows.append({
+                'match_id': f"match{m}", 'player_name': f"player{rng.integers(0, 60)}", 'role': str(rng.choice(roles)),
+                'kills': int(rng.integers(0, 30)), 'deaths': int(rng.integers(0, 25)), 'acs': round(float(rng.random() * 300), 2),
+                'kast': round(float(rng.random() * 100), 1), 'adr': int(rng.integers(40, 220)), 'hs_percent': int(rng.integers(0, 50)),
+                'fb': int(rng.integers(0, 6)), 'fd': int(rng.integers(0, 6)), 'kda': round(float(rng.random() * 3), 2),
+            })
+
+    training = frame_from_rows(rows)
+    training['match_id'] = training['match_id'].astype('category')
+    X_train = build_feature_matrix(training, lobby_aggregates(training))
+
+    failures = 0
+    vectors = {}
+    for name in training['player_name'].unique():
+        player_rows = [r for r in rows if r['player_name'] == name]
+        match_ids = {r['match_id'] for r in player_rows}
+        lobby_rows = [{'match_id': r['match_id'], 'acs': r['acs'], 'adr': r['adr']} for r in rows if r['match_id'] in match_ids]
+        df_player, lobbies = frame_from_rows(player_rows), lobby_aggregates(frame_from_rows(lobby_rows))
+
+        X_player = build_feature_matrix(df_player, lobbies)
+        is_player = (training['player_name'] == name).to_numpy()
+        expected = X_train[is_player]
+        if not np.array_equal(X_player.to_numpy(), expected.to_numpy()):
+            failures += 1
+            print(f"❌ Feature drift for {name}")
+
+        # What /api/predict feeds the Brain: the training rows averaged, with the most played role
+        expected_vector = expected.mean().to_frame().T
+        expected_vector['role_encoded'] = float(ROLE_MAP.get(training.loc[is_player, 'role'].mode()[0], 4))
+        vectors[name] = player_feature_vector(df_player, lobbies)
+        if not np.allclose(vectors[name].to_numpy(), expected_vector[FEATURES].to_numpy()):
+            failures += 1
+            print(f"❌ player_feature_vector drift for {name}")
+
+    # What /api/predict/batch feeds the Brain: every player's player_feature_vector, stacked
+    names = list(vectors)
+    matrix = player_feature_matrix(training, lobby_aggregates(training), training['player_name'].to_numpy())
+    if not np.allclose(matrix.loc[names].to_numpy(), pd.concat([vectors[n] for n in names]).to_numpy()):
+        failures += 1
+        print("❌ player_feature_matrix drift from player_feature_vector")
+
+    # What the feature store serves instead: the same vectors, folded from ml_spider_matches
+    # batch by batch (so lobbies fill up across batches) and then rebuilt from scratch
+    import feature_store
+    from supabase_stub import LocalSupabase
+    db = LocalSupabase()
+    stored_rows = [dict(r, db_id=f"{r['match_id']}_{i}", rank='Gold 1', win=int(rng.integers(0, 2))) for i, r in enumerate(rows)]
+    for batch in np.array_split(rng.permutation(len(stored_rows)), 5):
+        records = [stored_rows[i] for i in batch]
+        db.table('ml_spider_matches').upsert(records).execute()
+        feature_store.record_spider_rows(db, records)
+    for label in ("record_spider_rows", "rebuild_feature_store"):
+        if label == "rebuild_feature_store":
+            feature_store.rebuild_feature_store(db)
+        stored = feature_store.fetch_players(db, names)
+        drift = [n for n in names if not np.allclose(feature_store.player_feature_vector(stored[n]).to_numpy(), vectors[n].to_numpy())]
+        if drift:
+            failures += 1
+            print(f"❌ Feature store drift after {label} for {len(drift)} players, e.g. {drift[0]}")
+
+    if failures:
+        sys.exit(1)
+    print(f"✅ Training and prediction features match for {training['player_name'].nunique()} players.")
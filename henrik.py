@@ -0,0 +1,246 @@
+"""One HTTP client for every Henrik API call (app.py and cloud_spider.py).
+
+HenrikClient keeps a pooled keep-alive Session and retries 429s, 5xx and
+network errors with exponential backoff plus jitter, honouring Retry-After.
+It caps concurrent calls per host and wraps each host in a circuit breaker.
+When the API keeps failing, callers get None right away instead of each
+waiting out its own timeout.
+"""
+import os
+import time
+import random
+import threading
+import urllib.parse
+from collections import Counter
+import requests
+from requests.adapters import HTTPAdapter
+import metrics
+
+# Overridable so benchmarks and local runs can point everything at spider_stub.StubHenrik
+HENRIK_API_URL = os.environ.get("HENRIK_API_URL", "https://api.henrikdev.xyz")
+
+# --- RATE LIMITING ---
+class TokenBucket:
+    """Hands out request slots at `rate_per_minute`, with bursts of up to `capacity`.
+
+    The Henrik API tells us when we are over quota (429 + Retry-After, and the
+    x-ratelimit-* headers on every response); pause_until() stops every worker
+    until the window resets.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or max(1.0, min(rate_per_minute / 6.0, 10.0))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause_until(self, seconds_from_now):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds_from_now)
+            self.tokens = 0
+
+    def observe(self, response):
+        """Adapts to the quota headers Henrik sends back on every response."""
+        remaining = response.headers.get("x-ratelimit-remaining")
+        reset = response.headers.get("x-ratelimit-reset")
+        if response.status_code == 429:
+            self.pause_until(retry_after(response) or 60)
+        elif remaining is not None and reset is not None and remaining.isdigit() and int(remaining) == 0:
+            self.pause_until(float(reset))
+
+class Throughput:
+    """Counts finished API calls and prints requests per minute every `every` calls (0 = never)."""
+
+    def __init__(self, every=20):
+        self.every = every
+        self.count = 0
+        self.throttled = 0
+        self.start = time.monotonic()
+        self.lock = threading.Lock()
+
+    def record(self, status_code):
+        with self.lock:
+            self.count += 1
+            if status_code == 429:
+                self.throttled += 1
+            if self.every and self.count % self.every == 0:
+                print(f"   ⏱️ {self.count} API calls, {self.rate():.1f} req/min ({self.throttled} throttled)")
+
+    def rate(self):
+        return self.count / max(1e-9, time.monotonic() - self.start) * 60
+
+def retry_after(response):
+    """Seconds to wait from Retry-After (or Henrik's x-ratelimit-reset), if the response says."""
+    value = response.headers.get("Retry-After") or response.headers.get("x-ratelimit-reset")
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+def endpoint_of(url):
+    """The metrics label for a Henrik URL: "v3/matches", "v1/lifetime/matches"... without region or player."""
+    parts = urllib.parse.urlsplit(url).path.strip("/").split("/")
+    if parts and parts[0] == "valorant":
+        parts = parts[1:]
+    return "/".join(parts[:3] if len(parts) > 1 and parts[1] == "lifetime" else parts[:2])
+
+# --- FAILURE ISOLATION ---
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures and rejects calls for `cooldown` seconds.
+
+    After the cooldown a single trial call is let through (half-open): success
+    closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, threshold=5, cooldown=30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record(self, ok):
+        with self.lock:
+            self.trial_running = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+            else:
+                self.failures += 1
+                if self.failures >= self.threshold:
+                    self.opened_at = time.monotonic()
+
+    def retry_in(self):
+        """Seconds until an open breaker lets a trial call through (0 when closed or already due)."""
+        with self.lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+class HenrikClient:
+    """Pooled, retrying, rate-limited GET client. get_json() returns the decoded body or None."""
+
+    def __init__(self, api_key, rate_per_minute=None, timeout=5, max_attempts=3, backoff=0.5, max_backoff=20,
+                 max_per_host=8, breaker_threshold=5, breaker_cooldown=30, report_every=0):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_per_host = max_per_host
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.bucket = TokenBucket(rate_per_minute) if rate_per_minute else None
+        self.throughput = Throughput(report_every)
+        self.stats = Counter()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_per_host)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, url):
+        host = urllib.parse.urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = (threading.BoundedSemaphore(self.max_per_host),
+                                     CircuitBreaker(self.breaker_threshold, self.breaker_cooldown))
+            return self._hosts[host]
+
+    def breaker(self, url=HENRIK_API_URL):
+        return self._host(url)[1]
+
+    def _sleep(self, attempt, hint=None):
+        # Full jitter keeps many workers that failed together from retrying together
+        delay = hint if hint is not None else random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        time.sleep(min(delay, self.max_backoff))
+
+    def get_json(self, url):
+        slots, breaker = self._host(url)
+        endpoint = endpoint_of(url)
+        for attempt in range(self.max_attempts):
+            if not breaker.allow():
+                self.stats["short_circuited"] += 1
+                metrics.observe_upstream("henrik", endpoint, "short_circuited")
+                return None
+            if self.bucket:
+                self.bucket.acquire()
+            try:
+                with slots:
+                    start = time.perf_counter()
+                    response = self.session.get(url, headers={"Authorization": self.api_key}, timeout=self.timeout)
+            except requests.RequestException as e:
+                breaker.record(False)
+                self.stats["network_error"] += 1
+                metrics.observe_upstream("henrik", endpoint, "network_error", time.perf_counter() - start)
+                print(f"   ⚠️ Henrik request failed ({type(e).__name__}): {url}")
+                if attempt + 1 < self.max_attempts:
+                    self._sleep(attempt)
+                continue
+
+            elapsed = time.perf_counter() - start
+            self.throughput.record(response.status_code)
+            if self.bucket:
+                self.bucket.observe(response)
+            if response.status_code == 200:
+                try:
+                    data = response.json()
+                except ValueError:
+                    # A 200 with an HTML error page or a truncated body: as bad as a 5xx, not worth a retry
+                    breaker.record(False)
+                    self.stats["invalid_json"] += 1
+                    metrics.observe_upstream("henrik", endpoint, "invalid_json", elapsed)
+                    print(f"   ⚠️ Henrik answered 200 with a body that is not JSON: {url}")
+                    return None
+                breaker.record(True)
+                self.stats[200] += 1
+                metrics.observe_upstream("henrik", endpoint, "200", elapsed)
+                return data
+            self.stats[response.status_code] += 1
+            metrics.observe_upstream("henrik", endpoint, str(response.status_code), elapsed)
+            if response.status_code == 429:
+                # Throttled, not down: back off as told without tripping the breaker
+                breaker.record(True)
+                if attempt + 1 < self.max_attempts:
+                    self._sleep(attempt, retry_after(response))
+                continue
+            if response.status_code >= 500:
+                breaker.record(False)
+                if attempt + 1 < self.max_attempts:
+                    self._sleep(attempt, retry_after(response))
+                continue
+            # 4xx: the API answered, the request itself is wrong (unknown player, bad key...)
+            breaker.record(True)
+            return None
+        return None
@@ -0,0 +1,73 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+
+class MatchCache:
+    """Raw Henrik match JSON on disk, keyed by matchid (sqlite, zlib-compressed).
+
+    Every match the spider downloads is stored once and kept across runs, and
+    parsed rows are memoized per match for the current run. `python
+    cloud_spider.py --from-cache` replays the whole cache without any API call.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS matches (match_id TEXT PRIMARY KEY, fetched_at REAL, body BLOB)")
+        self.lock = threading.Lock()
+        self.stored = 0
+        self.reused = 0
+        self._parsed = {}
+
+    def put_many(self, matches):
+        """Stores matches not cached yet, in one transaction. Returns how many were new."""
+        ids = [m['metadata']['matchid'] for m in matches]
+        with self.lock:
+            known = {row[0] for row in self.db.execute(f"SELECT match_id FROM matches WHERE match_id IN ({','.join('?' * len(ids))})", ids)}
+        # Only new matches are serialized and compressed
+        now = time.time()
+        rows = [(m['metadata']['matchid'], now, zlib.compress(json.dumps(m, separators=(',', ':')).encode())) for m in matches if m['metadata']['matchid'] not in known]
+        with self.lock:
+            before = self.db.total_changes
+            self.db.executemany("INSERT OR IGNORE INTO matches VALUES (?, ?, ?)", rows)
+            self.db.commit()
+            added = self.db.total_changes - before
+        self.stored += added
+        return added
+
+    def get(self, match_id):
+        with self.lock:
+            row = self.db.execute("SELECT body FROM matches WHERE match_id = ?", (match_id,)).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row else None
+
+    def __contains__(self, match_id):
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM matches WHERE match_id = ?", (match_id,)).fetchone() is not None
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM matches").fetchone()[0]
+
+    def matches(self):
+        """Every cached match, oldest download first."""
+        with self.lock:
+            match_ids = [row[0] for row in self.db.execute("SELECT match_id FROM matches ORDER BY fetched_at")]
+        for match_id in match_ids:
+            yield self.get(match_id)
+
+    def records(self, match, parse):
+        """parse(match) once per match per run; later calls for the same matchid reuse the rows."""
+        match_id = match['metadata']['matchid']
+        if match_id in self._parsed:
+            self.reused += 1
+        else:
+            self._parsed[match_id] = parse(match)
+        return self._parsed[match_id]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,308 @@
+"""Counters, gauges and histograms in the Prometheus text format, for /metrics and the spider.
+
+Every process records into REGISTRY. When it has a `directory`, each process
+also writes its samples to <directory>/<pid>.json at most every
+`flush_interval` seconds, and merged() sums them, so one scrape of /metrics
+covers every gunicorn worker. Another worker's numbers can lag by up to that
+interval. Files of workers that have exited are dropped, which Prometheus
+sees as a counter reset.
+
+    REQUESTS = REGISTRY.counter("presa_http_requests_total", "Requests by route", ("route", "status"))
+    REQUESTS.inc(route="/api/news", status="200")
+    with LATENCY.time(route="/api/news"): ...
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+class _Family:
+    def __init__(self, registry, name, kind, help, labels, buckets=None):
+        self.registry = registry
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) if buckets else None
+        self.samples = {}  # tuple of label values -> number, or [bucket counts..., sum, count]
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+class Counter(_Family):
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+
+    def set(self, total, **labels):
+        """Mirrors a running total kept elsewhere (e.g. TTLCache.hits)."""
+        key = self._key(labels)
+        with self.registry.lock:
+            self.samples[key] = total
+
+class Gauge(_Family):
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.samples[key] = value
+
+    def clear(self):
+        with self.registry.lock:
+            self.samples.clear()
+
+class Histogram(_Family):
+    def observe(self, seconds, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            sample = self.samples.get(key)
+            if sample is None:
+                sample = self.samples[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    sample[i] += 1
+                    break
+            sample[-2] += seconds
+            sample[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+class Registry:
+    def __init__(self, directory=None, flush_interval=5):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.families = {}
+        self.collectors = []
+        self.lock = threading.RLock()
+        self.flushed_at = 0
+        # A forked worker starts from zero: the parent's samples are already counted in the parent's file
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._forget)
+
+    def _forget(self):
+        self.lock = threading.RLock()
+        self.flushed_at = 0
+        for family in self.families.values():
+            family.samples = {}
+
+    def _family(self, cls, name, help, labels, buckets=None):
+        with self.lock:
+            if name not in self.families:
+                self.families[name] = cls(self, name, cls.__name__.lower(), help, labels, buckets)
+            return self.families[name]
+
+    def counter(self, name, help, labels=()):
+        return self._family(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=()):
+        return self._family(Gauge, name, help, labels)
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._family(Histogram, name, help, labels, buckets)
+
+    def on_collect(self, fn):
+        """fn() runs before every snapshot, to copy numbers kept elsewhere into gauges/counters."""
+        self.collectors.append(fn)
+        return fn
+
+    # --- SNAPSHOTS ---
+    def snapshot(self):
+        for fn in self.collectors:
+            try:
+                fn()
+            except Exception as e:
+                print(f"⚠️ Metrics collector {fn.__name__} failed: {e}")
+        with self.lock:
+            return {name: {"kind": f.kind, "help": f.help, "labels": list(f.labels), "buckets": list(f.buckets or []),
+                           "samples": [[list(key), list(value) if isinstance(value, list) else value] for key, value in f.samples.items()]}
+                    for name, f in self.families.items()}
+
+    def flush(self, force=False):
+        """Writes this process' samples for merged(); cheap to call on every request."""
+        if not self.directory or (not force and time.time() - self.flushed_at < self.flush_interval):
+            return
+        self.flushed_at = time.time()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"written_at": self.flushed_at, "families": self.snapshot()}, f, separators=(',', ':'))
+        os.replace(tmp, path)
+
+    def merged(self):
+        """Every process' samples: counters and histograms summed, gauges from the newest process."""
+        if not self.directory:
+            return self.snapshot()
+        self.flush(force=True)
+        snapshots = []
+        for entry in os.listdir(self.directory):
+            if not entry.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, entry)
+            if not _alive(int(entry[:-5])):
+                _remove(path)
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        families = {}
+        for snap in sorted(snapshots, key=lambda s: s["written_at"]):
+            for name, family in snap["families"].items():
+                merged = families.setdefault(name, dict(family, samples={}))
+                if family["kind"] == "gauge" and family["samples"]:
+                    merged["samples"] = {}
+                for key, value in family["samples"]:
+                    key = tuple(key)
+                    old = merged["samples"].get(key)
+                    if old is None or family["kind"] == "gauge":
+                        merged["samples"][key] = value
+                    elif isinstance(value, list):
+                        merged["samples"][key] = [a + b for a, b in zip(old, value)]
+                    else:
+                        merged["samples"][key] = old + value
+        for family in families.values():
+            family["samples"] = [[list(key), value] for key, value in family["samples"].items()]
+        return families
+
+    def write_textfile(self, path):
+        """This process' metrics as a .prom file (node_exporter's textfile collector reads these)."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(f"{path}.tmp", "w") as f:
+            f.write(render(self.snapshot()))
+        os.replace(f"{path}.tmp", path)
+
+def _alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+# --- EXPOSITION ---
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escape = lambda v: str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render(families):
+    """A snapshot()/merged() result in the Prometheus text exposition format (0.0.4)."""
+    lines = []
+    for name in sorted(families):
+        family = families[name]
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['kind']}")
+        for key, value in sorted(family["samples"], key=lambda s: s[0]):
+            if family["kind"] != "histogram":
+                lines.append(f"{name}{_labels(family['labels'], key)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(family["buckets"], value):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(family['labels'], key, [('le', _number(float(bound)))])} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(family['labels'], key, [('le', '+Inf')])} {value[-1]}")
+            lines.append(f"{name}_sum{_labels(family['labels'], key)} {_number(float(value[-2]))}")
+            lines.append(f"{name}_count{_labels(family['labels'], key)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+def add_ratio(families, name, help, counter, label, value):
+    """Adds gauge `name`: the share of `counter` samples whose `label` is `value`, per remaining labels."""
+    source = families.get(counter)
+    if not source:
+        return
+    position = source["labels"].index(label)
+    others = [l for l in source["labels"] if l != label]
+    totals = {}
+    for key, count in source["samples"]:
+        group = tuple(k for i, k in enumerate(key) if i != position)
+        hit, total = totals.get(group, (0, 0))
+        totals[group] = (hit + (count if key[position] == value else 0), total + count)
+    families[name] = {"kind": "gauge", "help": help, "labels": others, "buckets": [],
+                      "samples": [[list(group), round(hit / total, 4)] for group, (hit, total) in totals.items() if total]}
+
+# --- UPSTREAM CALLS ---
+REGISTRY = Registry()
+UPSTREAM_SECONDS = REGISTRY.histogram("presa_upstream_request_seconds", "Latency of calls to Henrik and Supabase",
+                                      ("upstream", "endpoint"))
+UPSTREAM_REQUESTS = REGISTRY.counter("presa_upstream_requests_total", "Calls to Henrik and Supabase by outcome",
+                                     ("upstream", "endpoint", "status"))
+
+def observe_upstream(upstream, endpoint, status, seconds=None):
+    if seconds is not None:
+        UPSTREAM_SECONDS.observe(seconds, upstream=upstream, endpoint=endpoint)
+    UPSTREAM_REQUESTS.inc(upstream=upstream, endpoint=endpoint, status=status)
+
+SUPABASE_ACTIONS = {"select", "insert", "upsert", "update", "delete", "rpc"}
+
+class _TimedQuery:
+    """Wraps a supabase-py query builder; execute() is timed as `table.action`."""
+
+    def __init__(self, query, table, action=None):
+        self._query = query
+        self._table = table
+        self._action = action
+
+    def __getattr__(self, name):
+        attr = getattr(self._query, name)
+        action = self._action or (name if name in SUPABASE_ACTIONS else None)
+        if not callable(attr):
+            # e.g. the `.not_` property, which returns another builder
+            return _TimedQuery(attr, self._table, action) if hasattr(attr, "execute") else attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return _TimedQuery(result, self._table, action) if hasattr(result, "execute") else result
+        return call
+
+    def execute(self):
+        endpoint = f"{self._table}.{self._action or 'select'}"
+        start = time.perf_counter()
+        try:
+            result = self._query.execute()
+        except Exception:
+            observe_upstream("supabase", endpoint, "error", time.perf_counter() - start)
+            raise
+        observe_upstream("supabase", endpoint, "ok", time.perf_counter() - start)
+        return result
+
+class InstrumentedSupabase:
+    """A Supabase client whose every table(...)...execute() lands in the upstream metrics."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name):
+        return _TimedQuery(self._client.table(name), name)
+
+    def rpc(self, fn, *args, **kwargs):
+        return _TimedQuery(self._client.rpc(fn, *args, **kwargs), fn, "rpc")
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
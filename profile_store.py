@@ -0,0 +1,188 @@
+"""Lifetime ranked aggregates behind the /api/player profile page.
+
+Each player's running totals by agent, map and role are stored in one row.
+A refresh only folds in matches newer than the stored watermark, and works
+back through older history a few pages at a time until it is complete, so a
+profile covers every game while serving from a fixed-size row. More new
+matches than one refresh may read are kept in `gap` until the run reaches the
+watermark. Create the table once in the Supabase SQL editor:
+
+    create table player_profiles (
+        player_key text primary key,          -- lower(name#tag)
+        aggregates jsonb not null default '{}',
+        newest_at text,                       -- started_at of the newest folded match (watermark)
+        folded int not null default 0,        -- matches walked so far, ranked or not
+        complete boolean not null default false,  -- the whole history is folded
+        gap jsonb,                            -- new matches read so far while catching up, see refresh_profile
+        updated_at timestamptz default now()
+    );
+
+(Tables created before `gap` existed: alter table player_profiles add column gap jsonb;)
+"""
+import urllib.parse
+import henrik
+from features import AGENT_ROLES
+from datetime import datetime, timezone
+
+PROFILE_TABLE = 'player_profiles'
+PAGE_SIZE = 40
+RANKED_MODES = {'competitive', 'unrated', 'swiftplay'}
+ROLES = ["Duelist", "Controller", "Initiator", "Sentinel"]
+
+# --- SINGLE-PASS AGGREGATOR ---
+def empty_aggregates():
+    return {"total": 0, "wins": 0, "kills": 0, "deaths": 0, "agents": {}, "maps": {},
+            "roles": {role: {"matches": 0, "wins": 0, "kills": 0, "deaths": 0} for role in ROLES}}
+
+def lifetime_row(m):
+    """A Henrik lifetime match as a custom-match style row (agent, map_name, team_won, kills, deaths), or None."""
+    if 'meta' not in m or 'stats' not in m: return None
+    agent = m['meta'].get('character', {}).get('name') or m['stats'].get('character', {}).get('name')
+    map_name = m['meta'].get('map', {}).get('name')
+    my_team = m['stats'].get('team')
+    if not agent or not map_name or not my_team: return None
+    is_win = my_team.lower() == ("blue" if m['teams']['blue'] > m['teams']['red'] else "red")
+    return {"agent": agent, "map_name": map_name, "team_won": is_win, "kills": m['stats'].get('kills', 0), "deaths": m['stats'].get('deaths', 0)}
+
+def fold(agg, rows):
+    """Adds rows to the running totals, overall, per agent, per map and per role, in one pass."""
+    for r in rows:
+        k, d, win = r.get('kills', 0) or 0, r.get('deaths', 0) or 0, 1 if r.get('team_won') else 0
+        agg['total'] += 1
+        agg['wins'] += win
+        agg['kills'] += k
+        agg['deaths'] += d
+        agent = agg['agents'].setdefault(r.get('agent'), {"matches": 0, "wins": 0})
+        agent['matches'] += 1
+        agent['wins'] += win
+        game_map = agg['maps'].setdefault(r.get('map_name'), {"matches": 0, "wins": 0, "kills": 0, "deaths": 0})
+        game_map['matches'] += 1
+        game_map['wins'] += win
+        game_map['kills'] += k
+        game_map['deaths'] += d
+        role = agg['roles'].get(AGENT_ROLES.get(r.get('agent'), "Flex"))
+        if role is not None:
+            role['matches'] += 1
+            role['wins'] += win
+            role['kills'] += k
+            role['deaths'] += d
+    return agg
+
+def merge(agg, other):
+    """Adds the totals of aggregates `other` into `agg`."""
+    for key in ("total", "wins", "kills", "deaths"):
+        agg[key] += other[key]
+    for group in ("agents", "maps", "roles"):
+        for name, counts in other[group].items():
+            target = agg[group].setdefault(name, dict.fromkeys(counts, 0))
+            for key, value in counts.items():
+                target[key] = target.get(key, 0) + value
+    return agg
+
+def summarize(agg):
+    """The profile payload (totals, top maps/agents, role radar) from aggregates; cost depends on agents and maps, not games."""
+    win_rate = lambda d: int((d['wins'] / d['matches']) * 100) if d['matches'] > 0 else 0
+    kd = lambda d: (d['kills'] / d['deaths']) if d['deaths'] > 0 else d['kills']
+    stats = {key: agg[key] for key in ("wins", "total", "kills", "deaths", "agents", "maps")}
+    stats['top_maps'] = sorted([{"name": m, "matches": d['matches'], "win_rate": win_rate(d), "kd": round(kd(d), 2) if d['deaths'] > 0 else d['kills']}
+                                for m, d in agg['maps'].items()], key=lambda x: x['matches'], reverse=True)
+    stats['best_map'] = stats['top_maps'][0]['name'] if stats['top_maps'] else "N/A"
+    stats['top_agents'] = sorted([{"name": a, "matches": d['matches'], "win_rate": win_rate(d)} for a, d in agg['agents'].items()],
+                                 key=lambda x: x['matches'], reverse=True)
+    radar = {"Duelist": 0, "Controller": 0, "Initiator": 0, "Sentinel": 0, "Slayer": 0}
+    played = [d for d in agg['roles'].values() if d['matches'] > 0]
+    for role, d in agg['roles'].items():
+        if d['matches'] > 0: radar[role] = win_rate(d)
+    if played: radar["Slayer"] = int(min(max(((sum(kd(d) for d in played) / len(played)) - 0.5) * 66, 0), 100))
+    stats['roles'] = {"stats": agg['roles'], "radar": radar}
+    return stats
+
+def analyze(rows):
+    return summarize(fold(empty_aggregates(), rows))
+
+# --- PERSISTED PROFILES ---
+def profile_key(name, tag):
+    return f"{name}#{tag}".lower()
+
+def fetch_profile(supabase, name, tag):
+    res = supabase.table(PROFILE_TABLE).select('*').eq('player_key', profile_key(name, tag)).limit(1).execute()
+    return res.data[0] if res.data else None
+
+def refresh_profile(supabase, henrik_client, region, name, tag, max_pages=3):
+    """Folds new matches, then older history, reading at most `max_pages` pages.
+
+    Returns (aggregates, pending): `pending` is True while new matches or
+    older history are still left to read, i.e. another refresh has work to do.
+
+    Pages come newest first, and the matches walked so far (`folded`) always
+    form one unbroken run from the newest. So new matches are the ones above
+    the watermark, and the backfill resumes at index `folded`. When the new
+    matches span more pages than one refresh may read, what was read is saved
+    as `gap` and the next refresh resumes below its oldest match; once the gap
+    reaches the watermark it is folded in and the next refresh starts again
+    from the newest match.
+    """
+    url = f"{henrik.HENRIK_API_URL}/valorant/v1/lifetime/matches/{region}/{urllib.parse.quote(name)}/{urllib.parse.quote(tag)}"
+    stored = fetch_profile(supabase, name, tag) if supabase else None
+    profile = dict(stored or {'player_key': profile_key(name, tag), 'aggregates': empty_aggregates(),
+                              'newest_at': None, 'folded': 0, 'complete': False})
+    rows, newest, walked, pages = [], [], 0, 0
+
+    def read_page(number):
+        nonlocal pages
+        pages += 1
+        data_json = henrik_client.get_json(f"{url}?size={PAGE_SIZE}&page={number}")
+        return None if data_json is None else data_json.get('data') or []
+
+    def walk(m):
+        nonlocal walked
+        walked += 1
+        newest.append(m.get('meta', {}).get('started_at') or '')
+        if (m.get('meta', {}).get('mode') or '').lower() in RANKED_MODES:
+            row = lifetime_row(m)
+            if row: rows.append(row)
+
+    # New matches on top of the watermark, or below the part of the gap an earlier refresh read
+    gap = profile.get('gap') or {'aggregates': empty_aggregates(), 'newest_at': None, 'oldest_at': None, 'walked': 0}
+    caught_up, number = profile['newest_at'] is None, gap['walked'] // PAGE_SIZE + 1
+    while not caught_up and pages < max_pages:
+        matches = read_page(number)
+        if matches is None: break
+        for m in matches:
+            started_at = m.get('meta', {}).get('started_at') or ''
+            if gap['oldest_at'] and started_at >= gap['oldest_at']:
+                continue
+            if started_at <= profile['newest_at']:
+                caught_up = True
+                break
+            walk(m)
+        caught_up = caught_up or len(matches) < PAGE_SIZE
+        number += 1
+    if not caught_up:
+        # Still a gap to the stored history (or Henrik failed): keep what is stored, and save what was read
+        if walked and supabase:
+            profile['gap'] = {'aggregates': fold(gap['aggregates'], rows), 'newest_at': max([gap['newest_at'] or ''] + newest),
+                              'oldest_at': min(newest), 'walked': gap['walked'] + walked}
+            supabase.table(PROFILE_TABLE).upsert(dict(profile, updated_at=datetime.now(timezone.utc).isoformat())).execute()
+        return profile['aggregates'], True
+    # Matches played while the gap was filled sit above it: the next refresh folds them from page 1
+    resumed = gap['walked'] > 0
+    walked += profile['folded'] + gap['walked']
+    newest += [gap['newest_at']] if resumed else []
+    merge(profile['aggregates'], gap['aggregates'])
+
+    # Older history, resuming after the last match walked
+    complete = profile['complete']
+    while not resumed and not complete and pages < max_pages:
+        matches = read_page(walked // PAGE_SIZE + 1)
+        if matches is None: break
+        for m in matches[walked % PAGE_SIZE:]:
+            walk(m)
+        complete = len(matches) < PAGE_SIZE
+
+    if walked != profile['folded'] or complete != profile['complete']:
+        profile.update(aggregates=fold(profile['aggregates'], rows), newest_at=max([profile['newest_at'] or ''] + newest) or None,
+                       folded=walked, complete=complete, gap=None)
+        if supabase:
+            supabase.table(PROFILE_TABLE).upsert(dict(profile, updated_at=datetime.now(timezone.utc).isoformat())).execute()
+    return profile['aggregates'], resumed or not complete
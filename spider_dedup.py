@@ -0,0 +1,118 @@
+"""Spider dedup: which ml_spider_matches rows already exist.
+
+Sharded runs (cloud_spider.py --shard-count > 1) also claim each match before
+uploading its lobby, so two shards that meet the same match never both write
+it. Create the claims table once in the Supabase SQL editor:
+
+    create table ml_spider_match_claims (
+        match_id text primary key,
+        shard int not null,
+        claimed_at timestamptz default now()
+    );
+"""
+import os
+import math
+import hashlib
+from feature_store import fetch_in_chunks, MATCH_CHUNK_SIZE
+
+class BloomFilter:
+    """Fixed-size set membership for match ids: no false negatives, ~`error_rate` false positives.
+
+    Memory is decided by `capacity` up front (about 4.8 MB for 2M matches at 1e-4),
+    so it stays flat no matter how large ml_spider_matches grows.
+    """
+
+    def __init__(self, capacity=2_000_000, error_rate=1e-4):
+        self.size = int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.size.to_bytes(8, 'little') + self.hashes.to_bytes(1, 'little') + bytes(self.bits))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        bloom = cls.__new__(cls)
+        with open(path, "rb") as f:
+            data = f.read()
+        bloom.size = int.from_bytes(data[:8], 'little')
+        bloom.hashes = data[8]
+        bloom.bits = bytearray(data[9:])
+        return bloom
+
+class MatchIndex:
+    """Spider dedup keyed on match_id, without preloading the table.
+
+    Matches whose whole lobby has been stored are remembered in a Bloom filter
+    checkpointed to disk between runs. Everything else is checked with one
+    existence probe per batch, so only genuinely new rows are uploaded (and
+    counted once by the feature store). Rows handed out earlier in the same run
+    count as stored, since the uploader may not have flushed them yet.
+    """
+
+    def __init__(self, supabase, checkpoint_path):
+        self.supabase = supabase
+        self.checkpoint_path = checkpoint_path
+        self.probes = 0
+        self.skipped = 0
+        self.queued = set()
+        try:
+            self.complete = BloomFilter.load(checkpoint_path)
+        except (OSError, IndexError):
+            self.complete = BloomFilter()
+
+    def new_records(self, records):
+        """Drops records that are already stored. One DB round trip per MATCH_CHUNK_SIZE matches."""
+        candidates = [r for r in records if r['match_id'] not in self.complete]
+        self.skipped += len(records) - len(candidates)
+        if not candidates:
+            return []
+
+        self.probes += 1
+        match_ids = {r['match_id'] for r in candidates}
+        stored = self.queued | {row['db_id'] for row in fetch_in_chunks(self.supabase, 'ml_spider_matches', 'db_id', 'match_id', match_ids,
+                                                                          chunk_size=MATCH_CHUNK_SIZE)}
+        fresh = []
+        for r in candidates:
+            if r['db_id'] in stored:
+                self.skipped += 1
+            else:
+                stored.add(r['db_id'])
+                self.queued.add(r['db_id'])
+                fresh.append(r)
+        return fresh
+
+    def claim(self, match_ids, shard):
+        """Claims matches for this shard; returns the ones it owns (new claims and its own older ones)."""
+        match_ids = list(match_ids)
+        if not match_ids:
+            return set()
+        rows = [{'match_id': m, 'shard': shard} for m in match_ids]
+        for i in range(0, len(rows), 200):
+            self.supabase.table('ml_spider_match_claims').upsert(rows[i:i + 200], ignore_duplicates=True).execute()
+        claims = fetch_in_chunks(self.supabase, 'ml_spider_match_claims', 'match_id, shard', 'match_id', match_ids)
+        return {c['match_id'] for c in claims if c['shard'] == shard}
+
+    def mark_complete(self, match_ids):
+        """Call once every player of these matches has been stored."""
+        for match_id in match_ids:
+            self.complete.add(match_id)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+        self.complete.save(self.checkpoint_path)
@@ -0,0 +1,206 @@
+"""Crawl frontier for cloud_spider.py.
+
+Sharded runs split players between shards by a stable hash of name#tag. A
+shard that meets another shard's player hands it over through a small table,
+created once in the Supabase SQL editor:
+
+    create table ml_spider_handoff (
+        player_key text primary key,
+        name text, tag text,
+        depth int, tier int,
+        shard int not null
+    );
+"""
+import os
+import time
+import sqlite3
+import hashlib
+from features import RANK_LADDER
+
+# Henrik's currenttier: 3 is Iron 1, one step per division, 27 is Radiant
+
+def rank_of_tier(tier):
+    return RANK_LADDER[tier - 3] if tier and 3 <= tier < 3 + len(RANK_LADDER) else None
+
+def shard_of(player_key, shard_count):
+    """Stable across runs and machines (unlike hash())."""
+    return int.from_bytes(hashlib.blake2b(player_key.encode(), digest_size=8).digest(), 'little') % shard_count
+
+class CrawlFrontier:
+    """Persisted, prioritized queue of players to crawl (sqlite).
+
+    Every player the spider sees is stored with the hop it was found at, its
+    rank tier, when it was last crawled, the newest matchid seen (watermark)
+    and a running estimate of how many new matches a crawl returns. Changes
+    only become durable at checkpoint(), which the spider calls right after
+    the rows they produced were flushed, so a killed run resumes from the
+    last consistent point.
+    """
+
+    def __init__(self, path, max_depth=2, recrawl_hours=12, shard_index=0, shard_count=1):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS players (
+            player_key TEXT PRIMARY KEY, name TEXT, tag TEXT, depth INTEGER, tier INTEGER DEFAULT 0,
+            discovered_at REAL, last_crawled REAL, last_match_id TEXT, expected_new REAL, crawls INTEGER DEFAULT 0)""")
+        self.db.commit()
+        self.max_depth = max_depth
+        self.recrawl_seconds = recrawl_hours * 3600
+        self.started = time.time()
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        # 0..1 per tier, how much the training set still needs that rank (see RankBalancer)
+        self.db.create_function("rank_need", 1, lambda tier: 1.0)
+        # Players whose fetch failed this run: not handed out again until the next run
+        self.db.execute("CREATE TEMP TABLE skipped (player_key TEXT PRIMARY KEY)")
+
+    @staticmethod
+    def key(name, tag):
+        return f"{name}#{tag}".lower()
+
+    def owns(self, name, tag):
+        return shard_of(self.key(name, tag), self.shard_count) == self.shard_index
+
+    def discover(self, players, depth):
+        """Adds (name, tag, tier) players found at `depth` hops; known players keep their shallowest hop.
+
+        Returns the players that belong to other shards, for ShardHandoff.push().
+        """
+        if depth > self.max_depth:
+            return []
+        foreign = [p for p in players if not self.owns(p[0], p[1])]
+        players = [p for p in players if self.owns(p[0], p[1])]
+        now = time.time()
+        self.db.executemany("""INSERT INTO players (player_key, name, tag, depth, tier, discovered_at) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(player_key) DO UPDATE SET depth = MIN(depth, excluded.depth), tier = MAX(tier, excluded.tier)""",
+            [(self.key(name, tag), name, tag, depth, tier or 0, now) for name, tag, tier in players])
+        return foreign
+
+    def _due_before(self):
+        # Never twice in one run, whatever the recrawl window
+        return min(time.time() - self.recrawl_seconds, self.started)
+
+    def steer(self, rank_need):
+        """Weights selection by rank_need(tier); players whose rank needs nothing more are skipped."""
+        self.db.create_function("rank_need", 1, rank_need)
+
+    def next_batch(self, limit):
+        """The `limit` most valuable players that are due for a crawl.
+
+        Anchors (hop 0) come first. Everyone else is ranked by how much their
+        rank is still needed, the new matches a crawl is expected to return
+        (never crawled counts as a full page), how long ago they were crawled
+        and their rank tier, minus a little per hop.
+        """
+        now = time.time()
+        rows = self.db.execute("""SELECT name, tag, depth, last_match_id FROM players
+            WHERE depth <= ? AND (last_crawled IS NULL OR last_crawled < ?) AND (depth = 0 OR rank_need(tier) > 0)
+                AND player_key NOT IN (SELECT player_key FROM skipped)
+            ORDER BY (CASE WHEN depth = 0 THEN 10 ELSE 0 END)
+                + rank_need(tier) * 2
+                + COALESCE(expected_new, 10) / 10.0
+                + MIN((? - COALESCE(last_crawled, 0)) / 259200.0, 1)
+                + tier / 54.0
+                - depth * 0.25 DESC
+            LIMIT ?""", (self.max_depth, self._due_before(), now, limit)).fetchall()
+        return [{"name": name, "tag": tag, "depth": depth, "watermark": watermark} for name, tag, depth, watermark in rows]
+
+    def crawled(self, player, newest_match_id, new_matches):
+        """Records a finished crawl: moves the watermark and updates the expected-new estimate."""
+        self.db.execute("""UPDATE players SET last_crawled = ?, crawls = crawls + 1,
+                last_match_id = COALESCE(?, last_match_id),
+                expected_new = CASE WHEN expected_new IS NULL THEN ? ELSE expected_new * 0.5 + ? * 0.5 END
+            WHERE player_key = ?""", (time.time(), newest_match_id, new_matches, new_matches, self.key(player['name'], player['tag'])))
+
+    def skip(self, player):
+        """A fetch that failed: the player stays due (watermark and estimate untouched) but waits for the next run."""
+        self.db.execute("INSERT OR IGNORE INTO skipped VALUES (?)", (self.key(player['name'], player['tag']),))
+
+    def pending(self):
+        """How many players are due right now."""
+        return self.db.execute("""SELECT COUNT(*) FROM players
+            WHERE depth <= ? AND (last_crawled IS NULL OR last_crawled < ?) AND (depth = 0 OR rank_need(tier) > 0)""",
+                               (self.max_depth, self._due_before())).fetchone()[0]
+
+    def checkpoint(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+class ShardHandoff:
+    """Passes discovered players to the shard that owns them, through ml_spider_handoff."""
+
+    TABLE = 'ml_spider_handoff'
+
+    def __init__(self, supabase, shard_index, shard_count):
+        self.supabase = supabase
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+
+    def push(self, players, depth):
+        rows = {}
+        for name, tag, tier in players:
+            key = CrawlFrontier.key(name, tag)
+            rows[key] = {'player_key': key, 'name': name, 'tag': tag, 'depth': depth, 'tier': tier or 0,
+                         'shard': shard_of(key, self.shard_count)}
+        rows = list(rows.values())
+        for i in range(0, len(rows), 200):
+            self.supabase.table(self.TABLE).upsert(rows[i:i + 200], ignore_duplicates=True).execute()
+
+    def pull(self, frontier):
+        """Moves this shard's handed-off players into its frontier."""
+        rows = self.supabase.table(self.TABLE).select('*').eq('shard', self.shard_index).limit(1000).execute().data or []
+        for row in rows:
+            frontier.discover([(row['name'], row['tag'], row['tier'])], row['depth'])
+        # Durable in the frontier before they leave the table
+        frontier.checkpoint()
+        keys = [row['player_key'] for row in rows]
+        for i in range(0, len(keys), 200):
+            self.supabase.table(self.TABLE).delete().in_('player_key', keys[i:i + 200]).execute()
+        return len(rows)
+
+class RankBalancer:
+    """Per-rank row counts in ml_spider_matches, against a target per rank.
+
+    Steers the frontier toward under-represented ranks: players of a rank that
+    reached `target` are no longer crawled. Rows are never dropped, because a
+    lobby's averages (and every relative stat trained on) need all ten players.
+    A target of 0 turns it off. The counts come from one grouped query, created
+    once in the Supabase SQL editor:
+
+        create or replace function ml_spider_rank_counts()
+        returns table (rank text, row_count bigint) language sql stable as $$
+            select rank, count(*) from ml_spider_matches group by rank
+        $$;
+    """
+
+    def __init__(self, supabase, target):
+        self.target = target
+        self.counts = {}
+        if target:
+            try:
+                res = supabase.rpc('ml_spider_rank_counts').execute()
+                self.counts = {row['rank']: row['row_count'] for row in res.data or []}
+            except Exception as e:
+                print(f"   ⚠️ Rank counts unavailable, crawling without rank steering ({e})")
+                self.target = 0
+
+    def need(self, rank):
+        if not self.target or rank is None:
+            return 1.0
+        return max(0.0, 1 - self.counts.get(rank, 0) / self.target)
+
+    def tier_need(self, tier):
+        return self.need(rank_of_tier(tier))
+
+    def record(self, rows):
+        """Counts rows queued during this run, so steering follows the harvest."""
+        for r in rows:
+            self.counts[r['rank']] = self.counts.get(r['rank'], 0) + 1
+
+    def summary(self):
+        if not self.target:
+            return "steering off"
+        full = [rank for rank in RANK_LADDER if self.need(rank) == 0]
+        return f"{len(full)}/{len(RANK_LADDER)} ranks at target"
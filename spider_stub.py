@@ -0,0 +1,134 @@
+"""A stand-in for the Henrik API, for running the spider and benchmarks offline.
+
+Serves match history (v3/matches), ranks (v2/mmr, v1/mmr-history), lifetime
+matches (v1/lifetime/matches, paged) and single matches (v2/match) from a
+fixed, seeded world of players and matches, so every shard (and every run)
+sees the same lobbies. Responses recorded from the real API (see
+`python benchmark.py --record`) are replayed instead when a fixture exists.
+`python cloud_spider.py --local-shards N` starts one automatically.
+"""
+import os
+import json
+import random
+import threading
+import urllib.parse
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from spider_frontier import rank_of_tier
+
+AGENTS = ['Jett', 'Raze', 'Omen', 'Viper', 'Sova', 'Skye', 'Killjoy', 'Cypher', 'Sage', 'Fade']
+
+def build_world(anchors, players=2000, matches=5000, seed=7):
+    """Deterministic matches; returns {player_key: [match, ...]} newest first."""
+    rnd = random.Random(seed)
+    pool = [{"name": p['name'], "tag": p['tag']} for p in anchors]
+    pool += [{"name": f"stub{i}", "tag": f"{i % 9000:04d}"} for i in range(players)]
+    tiers = {p['name']: rnd.randint(3, 27) for p in pool}
+    history = {}
+    for m in range(matches):
+        lobby = rnd.sample(pool, 10)
+        rounds = rnd.randint(13, 26)
+        match = {
+            'metadata': {'matchid': f"stub-{seed}-{m:06d}", 'map': rnd.choice(['Bind', 'Haven', 'Lotus', 'Sunset']),
+                         'rounds_played': rounds, 'game_start': 1_700_000_000 + m * 60},
+            'teams': {'red': {'has_won': m % 2 == 0, 'rounds_won': 13 if m % 2 == 0 else rounds - 13},
+                      'blue': {'has_won': m % 2 == 1, 'rounds_won': 13 if m % 2 == 1 else rounds - 13}},
+            'players': {'all_players': []},
+            'kills': [],
+        }
+        for i, p in enumerate(lobby):
+            tier = tiers[p['name']]
+            kills, deaths = rnd.randint(3, 30), rnd.randint(3, 25)
+            match['players']['all_players'].append({
+                'name': p['name'], 'tag': p['tag'], 'puuid': f"{p['name']}#{p['tag']}",
+                'team': 'Red' if i < 5 else 'Blue', 'character': rnd.choice(AGENTS),
+                'currenttier': tier, 'currenttier_patched': rank_of_tier(tier),
+                'stats': {'kills': kills, 'deaths': deaths, 'assists': rnd.randint(0, 15), 'score': rnd.randint(1500, 8000),
+                          'headshots': rnd.randint(0, 20), 'bodyshots': rnd.randint(10, 60), 'legshots': rnd.randint(0, 8)},
+                'damage_made': rnd.randint(1500, 5000),
+            })
+        for r in range(1, rounds + 1):
+            killer, victim = rnd.sample(match['players']['all_players'], 2)
+            match['kills'].append({'round': r, 'killer_puuid': killer['puuid'], 'victim_puuid': victim['puuid']})
+        for p in lobby:
+            history.setdefault(f"{p['name']}#{p['tag']}".lower(), []).insert(0, match)
+    return history
+
+def fixture_name(path):
+    """File name of a recorded response for a request path (with its query string)."""
+    return urllib.parse.quote(path.lstrip('/'), safe='') + ".json"
+
+def lifetime_entry(match, player):
+    """One match the way v1/lifetime/matches lists it for `player`."""
+    teams = match['teams']
+    return {
+        'meta': {'id': match['metadata']['matchid'], 'mode': 'competitive', 'map': {'name': match['metadata']['map']},
+                 'character': {'name': player['character']},
+                 'started_at': datetime.fromtimestamp(match['metadata']['game_start'], timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')},
+        'stats': {'team': player['team'], 'kills': player['stats']['kills'], 'deaths': player['stats']['deaths'],
+                  'assists': player['stats']['assists'], 'tier': player['currenttier']},
+        'teams': {'red': teams['red']['rounds_won'], 'blue': teams['blue']['rounds_won']},
+    }
+
+class StubHenrik:
+    """Runs the stand-in API on a background thread; `url` replaces https://api.henrikdev.xyz."""
+
+    def __init__(self, anchors, host="127.0.0.1", port=0, fixtures=None, **world):
+        history = build_world(anchors, **world)
+        by_id = {m['metadata']['matchid']: m for matches in history.values() for m in matches}
+
+        def find(matches, key):
+            return next(p for p in matches[0]['players']['all_players'] if f"{p['name']}#{p['tag']}".lower() == key)
+
+        def respond(parts, query):
+            if parts[:3] == ['valorant', 'v2', 'match'] and len(parts) == 4:
+                return by_id.get(parts[3])
+            key = f"{parts[-2]}#{parts[-1]}".lower()
+            matches = history.get(key)
+            if matches is None or len(parts) < 6:
+                return None
+            me = find(matches, key)
+            if parts[:3] == ['valorant', 'v3', 'matches'] and len(parts) == 6:
+                return matches[:10]
+            if parts[:3] == ['valorant', 'v2', 'mmr'] and len(parts) == 6:
+                return {'name': me['name'], 'tag': me['tag'],
+                        'current_data': {'currenttier': me['currenttier'], 'currenttierpatched': me['currenttier_patched']}}
+            if parts[:3] == ['valorant', 'v1', 'mmr-history'] and len(parts) == 6:
+                # A steady climb into the current rank, newest first
+                tiers = [max(3, me['currenttier'] - i // 2) for i in range(5)]
+                return [{'currenttier': t, 'currenttierpatched': rank_of_tier(t)} for t in tiers]
+            if parts[:4] == ['valorant', 'v1', 'lifetime', 'matches'] and len(parts) == 7:
+                size, page = int(query.get('size', ['20'])[0]), int(query.get('page', ['1'])[0])
+                return [lifetime_entry(m, find([m], key)) for m in matches[(page - 1) * size: page * size]]
+            return None
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if fixtures and os.path.exists(os.path.join(fixtures, fixture_name(self.path))):
+                    with open(os.path.join(fixtures, fixture_name(self.path)), 'rb') as f:
+                        body = f.read()
+                else:
+                    url = urllib.parse.urlparse(self.path)
+                    parts = [urllib.parse.unquote(part) for part in url.path.strip('/').split('/')]
+                    data = respond(parts, urllib.parse.parse_qs(url.query))
+                    if data is None:
+                        self.send_error(404)
+                        return
+                    body = json.dumps({'status': 200, 'data': data}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
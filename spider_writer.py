@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import random
+import threading
+import queue
+import feature_store
+
+class UpsertBuffer:
+    """Write-behind uploader for ml_spider_matches rows.
+
+    add() only queues records. A background thread upserts them in bulk once
+    `batch_size` rows are waiting or `flush_interval` seconds have passed,
+    retrying failed calls with backoff. Rows that still fail are appended to
+    `dead_letter_path` and replayed by the next run, so nothing is dropped.
+    Always close() (it flushes everything that is left).
+
+    With `update_features=False` the feature store is left alone; sharded runs
+    rebuild it once at the end instead, since concurrent read-modify-write
+    updates of the same player rows would lose counts.
+    """
+
+    def __init__(self, supabase, dead_letter_path, batch_size=500, flush_interval=10, max_attempts=5, update_features=True):
+        self.supabase = supabase
+        self.dead_letter_path = dead_letter_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.update_features = update_features
+        self.queue = queue.Queue()
+        self.written = 0
+        self.flushes = 0
+        self.failed = 0
+        self.start = time.monotonic()
+        self._replayed = None
+        self.replayed_ids = set()
+        self._replay_dead_letters()
+        self._writer = threading.Thread(target=self._run, name="spider-writer", daemon=True)
+        self._writer.start()
+
+    def add(self, records):
+        for record in records:
+            self.queue.put(record)
+        return len(records)
+
+    def drain(self):
+        """Blocks until everything queued so far has been flushed."""
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+
+    def close(self):
+        self.queue.put(None)
+        self._writer.join()
+        if self._replayed:
+            # Anything that failed again is already back in the dead letter file
+            os.remove(self._replayed)
+            self._replayed = None
+
+    def rows_per_second(self):
+        return self.written / max(1e-9, time.monotonic() - self.start)
+
+    # --- BACKGROUND WRITER ---
+    def _run(self):
+        pending = {}
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                record = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                record = False
+            if record is None:
+                self._flush(pending)
+                return
+            if isinstance(record, threading.Event):
+                self._flush(pending)
+                pending = {}
+                deadline = time.monotonic() + self.flush_interval
+                record.set()
+                continue
+            if record:
+                # Keyed by db_id so a row queued twice is written (and counted) once
+                pending[record['db_id']] = record
+            if len(pending) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(pending)
+                pending = {}
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, pending):
+        if not pending:
+            return
+        records = list(pending.values())
+        if not self._retry(lambda: self.supabase.table("ml_spider_matches").upsert(records).execute()):
+            self._dead_letter(records)
+            return
+        self.written += len(records)
+        self.flushes += 1
+        if self.update_features:
+            self._update_features(records)
+        print(f"   💾 Flushed {len(records)} rows ({self.written} total, {self.rows_per_second():.1f} rows/s)")
+
+    def _update_features(self, records):
+        # record_spider_rows adds to stored totals, so retrying it after a partial write
+        # would count rows twice; the idempotent repair is what gets retried instead
+        try:
+            feature_store.record_spider_rows(self.supabase, records)
+            return
+        except Exception as e:
+            print(f"   ⚠️ Feature store update failed ({e}); recomputing the lobbies and players of {len(records)} rows.")
+        if not self._retry(lambda: feature_store.repair_spider_rows(self.supabase, records)):
+            print(f"   ⚠️ Feature store repair failed for {len(records)} rows; run `python feature_store.py --rebuild`.")
+
+    def _retry(self, call):
+        for attempt in range(self.max_attempts):
+            try:
+                call()
+                return True
+            except Exception as e:
+                print(f"   ⚠️ Upload attempt {attempt + 1}/{self.max_attempts} failed: {e}")
+                if attempt + 1 < self.max_attempts:
+                    time.sleep(min(30, 2 ** attempt) + random.random())
+        return False
+
+    # --- DEAD LETTERS ---
+    def _dead_letter(self, records):
+        self.failed += len(records)
+        os.makedirs(os.path.dirname(self.dead_letter_path) or ".", exist_ok=True)
+        with open(self.dead_letter_path, "a") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        print(f"   ❌ {len(records)} rows kept in {self.dead_letter_path} for the next run.")
+
+    def _replay_dead_letters(self):
+        # A .replay file still on disk means the last replay was interrupted
+        replay_path = self.dead_letter_path + ".replay"
+        if os.path.exists(self.dead_letter_path):
+            with open(self.dead_letter_path) as src, open(replay_path, "a") as dst:
+                dst.write(src.read())
+            os.remove(self.dead_letter_path)
+        if not os.path.exists(replay_path):
+            return
+        with open(replay_path) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        print(f"   ♻️ Replaying {len(records)} rows left over from the last run.")
+        self.add(records)
+        self.replayed_ids = {r['db_id'] for r in records}
+        self._replayed = replay_path
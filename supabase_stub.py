@@ -0,0 +1,245 @@
+"""A local stand-in for the Supabase client, for benchmarks and offline runs.
+
+LocalSupabase speaks the slice of the supabase-py / PostgREST query builder
+this repo uses (select with count/head, eq, neq, gt, gte, lt, lte, in_,
+ilike, or_ with ilike/eq terms, order, limit, insert, upsert with
+ignore_duplicates, delete, and rpc() of the functions in FUNCTIONS) on top
+of sqlite, so it still answers keyset pages quickly at a million
+ml_spider_matches rows. Tables and columns are created as
+rows arrive; dict/list values round-trip as JSON, booleans as booleans.
+"""
+import re
+import json
+import sqlite3
+import threading
+
+# The Postgres functions the repo calls through rpc(), as sqlite
+FUNCTIONS = {
+    'ml_spider_rank_counts': ('ml_spider_matches', 'SELECT "rank", COUNT(*) AS row_count FROM ml_spider_matches GROUP BY "rank"'),
+}
+
+# Conflict targets of the tables the repo upserts into (everything else gets an auto "id")
+PRIMARY_KEYS = {
+    'ml_spider_matches': 'db_id', 'ml_lobby_aggregates': 'match_id', 'ml_player_features': 'player_key',
+    'ml_spider_match_claims': 'match_id', 'ml_spider_handoff': 'player_key', 'player_profiles': 'player_key',
+}
+
+# jsonb columns whose first value may be null, so the type can't be told from the rows
+JSON_COLUMNS = {'player_profiles': {'aggregates', 'gap'}, 'ml_player_features': {'role_counts', 'sums'}}
+
+class APIError(Exception):
+    pass
+
+class Response:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+def _quote(name):
+    if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", name):
+        raise APIError(f"bad identifier {name!r}")
+    return f'"{name}"'
+
+class Query:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.action = 'select'
+        self.columns = '*'
+        self.count = None
+        self.head = False
+        self.where = []
+        self.args = []
+        self.order_by = []
+        self.limit_to = None
+        self.rows = None
+        self.ignore_duplicates = False
+
+    # --- BUILDER ---
+    def select(self, columns='*', count=None, head=False):
+        self.columns, self.count, self.head = columns, count, head
+        return self
+
+    def _filter(self, column, op, value):
+        self.where.append(f"{_quote(column)} {op} ?")
+        self.args.append(self.db.encode(value))
+        return self
+
+    def eq(self, column, value): return self._filter(column, '=', value)
+    def neq(self, column, value): return self._filter(column, '<>', value)
+    def gt(self, column, value): return self._filter(column, '>', value)
+    def gte(self, column, value): return self._filter(column, '>=', value)
+    def lt(self, column, value): return self._filter(column, '<', value)
+    def lte(self, column, value): return self._filter(column, '<=', value)
+    # sqlite's LIKE is case-insensitive for ASCII, like Postgres' ILIKE
+    def ilike(self, column, pattern): return self._filter(column, 'LIKE', pattern)
+
+    def in_(self, column, values):
+        values = [self.db.encode(v) for v in values]
+        self.where.append(f"{_quote(column)} IN ({','.join('?' * len(values))})" if values else "0")
+        self.args.extend(values)
+        return self
+
+    def or_(self, expression):
+        """PostgREST or=(...) terms of the form column.eq.value / column.ilike."value"."""
+        terms = []
+        for column, op, value in re.findall(r'(\w+)\.(eq|ilike)\.("(?:[^"\\]|\\.)*"|[^,]*)', expression):
+            terms.append(f"{_quote(column)} {'=' if op == 'eq' else 'LIKE'} ?")
+            self.args.append(value[1:-1] if value.startswith('"') else value)
+        self.where.append(f"({' OR '.join(terms) or '0'})")
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by.append(f"{_quote(column)} {'DESC' if desc else 'ASC'}")
+        return self
+
+    def limit(self, count):
+        self.limit_to = count
+        return self
+
+    def insert(self, rows):
+        self.action, self.rows = 'insert', rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows, ignore_duplicates=False, on_conflict=None):
+        self.action, self.rows = 'upsert', rows if isinstance(rows, list) else [rows]
+        self.ignore_duplicates = ignore_duplicates
+        return self
+
+    def delete(self):
+        self.action = 'delete'
+        return self
+
+    # --- EXECUTION ---
+    def _where(self):
+        return f" WHERE {' AND '.join(self.where)}" if self.where else ""
+
+    def execute(self):
+        with self.db.lock:
+            if self.action == 'select':
+                return self._select()
+            if self.action == 'delete':
+                self.db.ensure(self.table, [])
+                self.db.conn.execute(f"DELETE FROM {_quote(self.table)}{self._where()}", self.args)
+                self.db.conn.commit()
+                return Response([])
+            return self._write()
+
+    def _select(self):
+        columns = self.db.ensure(self.table, [])
+        wanted = list(columns) if self.columns.strip() == '*' else [c.strip() for c in self.columns.split(',') if c.strip()]
+        count = None
+        if self.count:
+            count = self.db.conn.execute(f"SELECT COUNT(*) FROM {_quote(self.table)}{self._where()}", self.args).fetchone()[0]
+        if self.head:
+            return Response([], count)
+        present = [c for c in wanted if c in columns]
+        sql = f"SELECT {', '.join(_quote(c) for c in present) or 'NULL'} FROM {_quote(self.table)}{self._where()}"
+        if self.order_by:
+            sql += " ORDER BY " + ", ".join(self.order_by)
+        if self.limit_to is not None:
+            sql += f" LIMIT {int(self.limit_to)}"
+        data = []
+        for row in self.db.conn.execute(sql, self.args):
+            record = {c: None for c in wanted}
+            record.update({c: self.db.decode(columns[c], v) for c, v in zip(present, row)})
+            data.append(record)
+        return Response(data, count)
+
+    def _write(self):
+        if not self.rows:
+            return Response([])
+        key = PRIMARY_KEYS.get(self.table, 'id')
+        names = list(dict.fromkeys(c for row in self.rows for c in row))
+        self.db.ensure(self.table, names, self.rows)
+        sql = f"INSERT INTO {_quote(self.table)} ({', '.join(_quote(c) for c in names)}) VALUES ({','.join('?' * len(names))})"
+        if self.action == 'upsert':
+            # Like PostgREST: a conflicting row keeps the columns this upsert does not mention
+            updates = ', '.join(f"{_quote(c)} = excluded.{_quote(c)}" for c in names if c != key)
+            sql += f" ON CONFLICT({_quote(key)}) DO " + ("NOTHING" if self.ignore_duplicates or not updates else f"UPDATE SET {updates}")
+        written = []
+        cur = self.db.conn.cursor()
+        for row in self.rows:
+            cur.execute(sql, [self.db.encode(row.get(c)) for c in names])
+            if cur.rowcount:
+                record = dict(row)
+                if key not in record:
+                    record[key] = cur.lastrowid
+                written.append(record)
+        self.db.conn.commit()
+        return Response(written)
+
+class Rpc:
+    def __init__(self, db, fn):
+        self.db = db
+        self.fn = fn
+
+    def execute(self):
+        if self.fn not in FUNCTIONS:
+            raise APIError(f"function {self.fn} does not exist")
+        table, sql = FUNCTIONS[self.fn]
+        with self.db.lock:
+            self.db.ensure(table, ['rank'])
+            cur = self.db.conn.execute(sql)
+            names = [c[0] for c in cur.description]
+            return Response([dict(zip(names, row)) for row in cur])
+
+class LocalSupabase:
+    """supabase.create_client() look-alike backed by one sqlite database (":memory:" by default)."""
+
+    def __init__(self, path=":memory:"):
+        # A file path can be shared by several processes (cloud_spider.py --local-shards)
+        self.shared = path != ":memory:"
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL" if self.shared else "PRAGMA journal_mode=MEMORY")
+        self.lock = threading.RLock()
+        self.schemas = {}  # table -> {column: 'json' | 'bool' | None}
+
+    def table(self, name):
+        return Query(self, name)
+
+    def rpc(self, fn, params=None):
+        return Rpc(self, fn)
+
+    def _load_schema(self, table):
+        key = PRIMARY_KEYS.get(table, 'id')
+        kind = "INTEGER PRIMARY KEY AUTOINCREMENT" if key == 'id' else "PRIMARY KEY"
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {_quote(table)} ({_quote(key)} {kind})")
+        existing = self.conn.execute("SELECT name, type FROM pragma_table_info(?)", (table,)).fetchall()
+        self.schemas[table] = {name: kind.lower() if kind.lower() in ('json', 'bool') else None for name, kind in existing}
+        return self.schemas[table]
+
+    def ensure(self, table, names, rows=()):
+        """Creates the table and any missing columns; returns {column: kind}."""
+        schema = self.schemas.get(table)
+        # Another process sharing the file may have added columns since
+        if schema is None or (self.shared and (not names or any(name not in schema for name in names))):
+            schema = self._load_schema(table)
+        for name in names:
+            if name not in schema:
+                sample = next((r[name] for r in rows if r.get(name) is not None), None)
+                kind = 'json' if isinstance(sample, (dict, list)) or name in JSON_COLUMNS.get(table, ()) else 'bool' if isinstance(sample, bool) else None
+                try:
+                    self.conn.execute(f"ALTER TABLE {_quote(table)} ADD COLUMN {_quote(name)} {kind.upper() if kind else ''}")
+                except sqlite3.OperationalError:
+                    schema = self._load_schema(table)
+                    if name not in schema:
+                        raise
+                    continue
+                schema[name] = kind
+        return schema
+
+    def create_index(self, table, column):
+        with self.lock:
+            self.ensure(table, [column])
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS {_quote(f'{table}_{column}')} ON {_quote(table)} ({_quote(column)})")
+
+    @staticmethod
+    def encode(value):
+        return json.dumps(value) if isinstance(value, (dict, list)) else value
+
+    @staticmethod
+    def decode(kind, value):
+        if value is None or kind is None:
+            return value
+        return json.loads(value) if kind == 'json' else bool(value)